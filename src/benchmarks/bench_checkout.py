@@ -0,0 +1,104 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Environment switching benchmark: checks out, round-robin, every one of
+a set of synthetic environments whose data directories hold real files,
+and reports the latency of each switch. A switch journals the new state
+and flips the `.current` symlink, so its cost must not depend on the
+size of the environments.
+
+    python -m benchmarks.bench_checkout --envs 100 --mib 8
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+from typing import List
+
+from benchmarks.synthetic import generate_config
+from config.config import build_config, parse_user_values
+from config.state import StateJournal
+from environment import Environment
+
+
+def populate(env_dir: str, mib: int) -> None:
+    """Creates an environment data directory of about `mib` MiB."""
+    data_dir = os.path.join(env_dir, "db", "data")
+    os.makedirs(data_dir)
+    with open(os.path.join(data_dir, "system.dbf"), "wb") as f:
+        f.write(os.urandom(1024 * 1024) * mib)
+
+
+def run(envs: int, rounds: int, mib: int, root: str) -> List[float]:
+    """
+    :return: The latency of every switch, in seconds.
+    """
+    config_data, values_text = generate_config(envs)
+    config_data["envs_dir"] = os.path.join(root, "envs")
+    for env in config_data["envs"]:
+        env["archived"] = False
+        populate(os.path.join(config_data["envs_dir"], env["tag"]), mib)
+    config = build_config(
+        config_data, parse_user_values(values_text.splitlines())
+    )
+    environment = Environment(config, StateJournal(os.path.join(root, "j")))
+    tags = [env.tag for env in config.envs]
+
+    latencies: List[float] = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(rounds):
+            for tag in tags:
+                start = time.perf_counter()
+                environment.checkout_environment(tag)
+                latencies.append(time.perf_counter() - start)
+    assert os.readlink(environment.get_current_path()) == tags[-1]
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark switching between environments"
+    )
+    parser.add_argument("--envs", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument(
+        "--mib", type=int, default=8, help="Data per environment, in MiB."
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        latencies = sorted(run(args.envs, args.rounds, args.mib, root))
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{len(latencies)} switches across {args.envs} environments")
+    print(f"mean  {statistics.mean(latencies) * 1000:8.3f} ms")
+    print(f"p50   {statistics.median(latencies) * 1000:8.3f} ms")
+    print(f"p99   {p99 * 1000:8.3f} ms")
+    print(f"max   {latencies[-1] * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Config loading benchmark suite.
+
+Generates synthetic configs from 1 to 10,000 environments, with varying
+service and upstream counts, and measures time and peak memory of every
+loading stage. Results are stored as JSON baselines; `compare` flags
+regressions beyond a threshold and exits non-zero when there are any.
+
+    python -m benchmarks.bench_config run --save baseline.json
+    python -m benchmarks.bench_config compare baseline.json
+    python -m benchmarks.bench_config compare baseline.json current.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmarks.synthetic import write_config
+from config.config import (
+    load_config,
+    load_user_values,
+    parse_config,
+    substitute_placeholders,
+)
+
+DEFAULT_ENVS = [1, 10, 100, 1000, 10000]
+DEFAULT_SHAPES = ["3x1", "10x3"]
+DEFAULT_THRESHOLD = 0.2
+
+Result = Dict[str, Any]
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Tuple[float, int]:
+    """
+    Returns the best wall time in seconds over `repeat` runs of `fn`,
+    and its peak traced memory in bytes over one more run.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def bench_case(
+    work_dir: str, envs: int, services: int, upstreams: int, repeat: int
+) -> List[Result]:
+    """Measures every loading stage for one synthetic config."""
+    config_path, values_path = write_config(work_dir, envs, services, upstreams)
+    cache_path = os.path.join(work_dir, "shpdctl.cache")
+    with open(config_path, "r") as f:
+        config_data = json.load(f)
+    values = load_user_values(values_path)
+    substituted = json.dumps(substitute_placeholders(config_data, values))
+    load_config(config_path, values_path, cache_path=cache_path)
+
+    stages: Dict[str, Callable[[], Any]] = {
+        "load_user_values": lambda: load_user_values(values_path),
+        "substitute_placeholders": lambda: substitute_placeholders(
+            config_data, values
+        ),
+        "parse_config": lambda: parse_config(substituted),
+        "load_config": lambda: load_config(config_path, values_path),
+        "load_config_cached": lambda: load_config(
+            config_path, values_path, cache_path=cache_path
+        ),
+    }
+
+    case = f"envs={envs},services={services},upstreams={upstreams}"
+    results: List[Result] = []
+    for stage, fn in stages.items():
+        elapsed, peak = measure(fn, repeat)
+        results.append(
+            {
+                "case": case,
+                "stage": stage,
+                "time_s": elapsed,
+                "peak_bytes": peak,
+            }
+        )
+    return results
+
+
+def run(envs: List[int], shapes: List[str], repeat: int) -> Dict[str, Any]:
+    results: List[Result] = []
+    for shape in shapes:
+        services, upstreams = (int(n) for n in shape.split("x"))
+        for n in envs:
+            with tempfile.TemporaryDirectory() as work_dir:
+                results += bench_case(work_dir, n, services, upstreams, repeat)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        },
+        "results": results,
+    }
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float
+) -> List[str]:
+    """
+    Compares two benchmark runs.
+
+    :param baseline: The baseline run.
+    :param current: The run to check.
+    :param threshold: Relative increase tolerated, e.g. 0.2 for +20%.
+    :return: A description of every regression found.
+    """
+    base = {(r["case"], r["stage"]): r for r in baseline["results"]}
+    regressions: List[str] = []
+    for result in current["results"]:
+        ref = base.get((result["case"], result["stage"]))
+        if ref is None:
+            continue
+        for metric in ("time_s", "peak_bytes"):
+            if ref[metric] <= 0:
+                continue
+            ratio = result[metric] / ref[metric]
+            if ratio > 1 + threshold:
+                regressions.append(
+                    f"{result['stage']} [{result['case']}] {metric}: "
+                    f"{ref[metric]:.6g} -> {result[metric]:.6g} "
+                    f"(+{ratio - 1:.0%})"
+                )
+    return regressions
+
+
+def print_results(run_data: Dict[str, Any]) -> None:
+    print(f"{'case':<40} {'stage':<24} {'time ms':>10} {'peak KiB':>10}")
+    for r in run_data["results"]:
+        print(
+            f"{r['case']:<40} {r['stage']:<24} "
+            f"{r['time_s'] * 1000:>10.2f} {r['peak_bytes'] / 1024:>10.0f}"
+        )
+
+
+def save(run_data: Dict[str, Any], path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(run_data, f, indent=2)
+    print(f"Results saved to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Config loading benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("run", "compare"):
+        p = sub.add_parser(name)
+        p.add_argument("--envs", type=int, nargs="+", default=DEFAULT_ENVS)
+        p.add_argument(
+            "--shapes",
+            nargs="+",
+            default=DEFAULT_SHAPES,
+            help="Services x upstreams per environment, e.g. 3x1",
+        )
+        p.add_argument("--repeat", type=int, default=3)
+        p.add_argument("--save", help="Store the results as a JSON baseline")
+
+    cmp = sub.choices["compare"]
+    cmp.add_argument("baseline", help="Baseline JSON file")
+    cmp.add_argument(
+        "current", nargs="?", help="Results to check (default: run now)"
+    )
+    cmp.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Relative increase flagged as a regression",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "compare" and args.current:
+        with open(args.current, "r") as f:
+            current = json.load(f)
+    else:
+        current = run(args.envs, args.shapes, args.repeat)
+        print_results(current)
+    if args.save:
+        save(current, args.save)
+
+    if args.command == "compare":
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for regression in regressions:
+            print(f"[REGRESSION] {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Compares the legacy substitute/dumps/loads config loading path with the
+single-pass builder.
+
+    python -m benchmarks.bench_loader --envs 10 100 1000
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmarks.synthetic import generate_config
+from config.config import (
+    Config,
+    build_config,
+    parse_config,
+    parse_user_values,
+    substitute_placeholders,
+)
+
+
+def legacy_load(config_data: Dict[str, Any], values: Dict[str, str]) -> Config:
+    """The loading path as it was before the single-pass builder."""
+    return parse_config(
+        json.dumps(substitute_placeholders(config_data, values))
+    )
+
+
+def single_pass_load(
+    config_data: Dict[str, Any], values: Dict[str, str]
+) -> Config:
+    return build_config(config_data, values)
+
+
+LOADERS: Dict[str, Callable[[Dict[str, Any], Dict[str, str]], Config]] = {
+    "legacy": legacy_load,
+    "single-pass": single_pass_load,
+}
+
+
+def measure_peak(
+    loader: Callable[[Dict[str, Any], Dict[str, str]], Config],
+    config_data: Dict[str, Any],
+    values: Dict[str, str],
+) -> int:
+    """Returns the peak traced memory, in bytes, of one load."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        loader(config_data, values)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def measure_time(
+    loader: Callable[[Dict[str, Any], Dict[str, str]], Config],
+    config_data: Dict[str, Any],
+    values: Dict[str, str],
+    repeat: int,
+) -> float:
+    """Returns the best wall time, in seconds, over `repeat` loads."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        loader(config_data, values)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(envs: List[int], repeat: int) -> List[Tuple[int, str, float, int]]:
+    results: List[Tuple[int, str, float, int]] = []
+    for n in envs:
+        config_data, values_text = generate_config(n)
+        values = parse_user_values(values_text.splitlines())
+        for name, loader in LOADERS.items():
+            elapsed = measure_time(loader, config_data, values, repeat)
+            peak = measure_peak(loader, config_data, values)
+            results.append((n, name, elapsed, peak))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark legacy vs single-pass config loading"
+    )
+    parser.add_argument(
+        "--envs", type=int, nargs="+", default=[10, 100, 1000, 5000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'envs':>6}  {'loader':<12} {'time ms':>10} {'peak KiB':>10}")
+    for n, name, elapsed, peak in run(args.envs, args.repeat):
+        print(
+            f"{n:>6}  {name:<12} {elapsed * 1000:>10.2f} {peak / 1024:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
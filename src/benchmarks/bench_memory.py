@@ -0,0 +1,125 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Measures the memory retained by the config model for large fleets,
+against an equivalent model made of plain (dict-backed) dataclasses
+holding un-interned strings, as produced before slotting.
+
+    python -m benchmarks.bench_memory --envs 1000 10000
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+from dataclasses import field, fields, is_dataclass, make_dataclass
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+from benchmarks.synthetic import generate_config
+from config.config import Config, build_config, parse_user_values
+
+_plain_types: Dict[type, Type[Any]] = {}
+
+
+def plain_type(cls: type) -> Type[Any]:
+    """Returns a non-slotted mirror of a config dataclass."""
+    if cls not in _plain_types:
+        _plain_types[cls] = make_dataclass(
+            f"Plain{cls.__name__}",
+            [(f.name, f.type, field(default=None)) for f in fields(cls)],
+        )
+    return _plain_types[cls]
+
+
+def to_plain(value: Any) -> Any:
+    """
+    Deep-converts a config object into its plain mirror, copying every
+    container and string so that nothing is shared with the source.
+    """
+    if is_dataclass(value) and not isinstance(value, type):
+        return plain_type(type(value))(
+            **{f.name: to_plain(getattr(value, f.name)) for f in fields(value)}
+        )
+    if isinstance(value, dict):
+        src: Dict[Any, Any] = value
+        return {to_plain(k): to_plain(v) for k, v in src.items()}
+    if isinstance(value, (list, tuple)):
+        items: List[Any] = list(value)  # type: ignore[arg-type]
+        return [to_plain(v) for v in items]
+    if isinstance(value, str):
+        return (value + ".")[:-1]
+    return value
+
+
+def retained(build: Callable[[], Any]) -> Tuple[Any, int]:
+    """
+    Runs `build` under tracemalloc and returns its result along with
+    the bytes still allocated once it returned.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current
+
+
+def measure(envs: int) -> Tuple[int, int]:
+    """
+    Returns the retained bytes of the slotted and of the plain model
+    for a synthetic config with `envs` environments.
+    """
+    config_data, values_text = generate_config(envs)
+    values = parse_user_values(values_text.splitlines())
+    text = json.dumps(config_data)
+    del config_data
+
+    def build_slotted() -> Config:
+        return build_config(json.loads(text), values)
+
+    config, slotted = retained(build_slotted)
+    _, plain = retained(lambda: to_plain(config))
+    return slotted, plain
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark memory retained by the config model"
+    )
+    parser.add_argument("--envs", type=int, nargs="+", default=[1000, 10000])
+    args = parser.parse_args()
+
+    print(f"{'envs':>6}  {'slotted MiB':>12} {'plain MiB':>10} {'saved':>6}")
+    for n in args.envs:
+        slotted, plain = measure(n)
+        print(
+            f"{n:>6}  {slotted / 2**20:>12.1f} {plain / 2**20:>10.1f} "
+            f"{1 - slotted / plain:>6.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
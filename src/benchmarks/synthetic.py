@@ -0,0 +1,133 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import os
+from typing import Any, Dict, List, Tuple
+
+RESOURCES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources"
+)
+
+
+def base_config() -> Tuple[Dict[str, Any], str]:
+    """
+    Returns the shipped configuration template and the raw text of the
+    shipped user's values file.
+    """
+    with open(os.path.join(RESOURCES_DIR, "shpdctl.json"), "r") as f:
+        config_data: Dict[str, Any] = json.load(f)
+    with open(os.path.join(RESOURCES_DIR, "shpdctl.conf"), "r") as f:
+        values = f.read()
+    return config_data, values
+
+
+def make_upstream(index: int) -> Dict[str, Any]:
+    return {
+        "tag": f"upstream-{index}",
+        "type": "pg",
+        "user": "${db_usr}",
+        "psw": "${db_psw}",
+        "host": f"db-{index}.${{domain}}",
+        "port": "${pg_listener_port}",
+        "database": f"db{index}",
+        "unix_user": "postgres",
+        "dump_dir": f"/dumps/{index}",
+        "enabled": index % 2 == 0,
+    }
+
+
+def make_service(index: int) -> Dict[str, Any]:
+    return {
+        "type": f"custom-{index % 4}",
+        "tag": f"svc-{index}",
+        "image": f"ghcr.io/lunaticfringers/shepherd/custom-{index % 4}:1.0",
+        "envvars": {"USER": "${db_usr}", "PSW": "${db_psw}"},
+        "ports": {"http": f"{3000 + index}:3000"},
+        "properties": {"instance.name": f"svc-{index}", "instance.id": index},
+        "subject_alternative_name": f"DNS:svc-{index}.${{domain}}",
+    }
+
+
+def make_environment(
+    index: int, services: int, upstreams: int
+) -> Dict[str, Any]:
+    return {
+        "tag": f"env-{index}",
+        "db": {
+            "type": "pg" if index % 2 else "ora",
+            "image": "",
+            "sys_user": "${db_sys_usr}",
+            "sys_psw": "${db_sys_psw}",
+            "user": "",
+            "psw": "",
+            "upstreams": [make_upstream(i) for i in range(upstreams)],
+        },
+        "services": [
+            {
+                "type": "traefik",
+                "ingress": True,
+                "tag": "traefik-1",
+                "image": "",
+                "envvars": None,
+            }
+        ]
+        + [make_service(i) for i in range(services)],
+        "archived": index % 10 == 0,
+        "active": index == 0,
+    }
+
+
+def generate_config(
+    envs: int, services: int = 3, upstreams: int = 1
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Generates a synthetic configuration.
+
+    :param envs: Number of environments.
+    :param services: Number of custom services per environment.
+    :param upstreams: Number of upstreams per environment.
+    :return: The configuration tree and the user's values text.
+    """
+    config_data, values = base_config()
+    config_data["envs"] = [
+        make_environment(i, services, upstreams) for i in range(envs)
+    ]
+    return config_data, values
+
+
+def write_config(
+    dir_path: str, envs: int, services: int = 3, upstreams: int = 1
+) -> List[str]:
+    """
+    Writes a synthetic shpdctl.json and shpdctl.conf into `dir_path`.
+
+    :return: The paths of the configuration and values files.
+    """
+    config_data, values = generate_config(envs, services, upstreams)
+    config_path = os.path.join(dir_path, "shpdctl.json")
+    values_path = os.path.join(dir_path, "shpdctl.conf")
+    with open(config_path, "w") as f:
+        json.dump(config_data, f, indent=2)
+    with open(values_path, "w") as f:
+        f.write(values)
+    return [config_path, values_path]
@@ -34,6 +34,18 @@ from .config import (
     Upstream,
     load_config,
 )
+from .effective import (
+    EffectiveDatabase,
+    EffectiveEnvironment,
+    EffectiveService,
+)
+from .shards import (
+    ShardedEnvs,
+    remove_environment,
+    shard_config,
+    write_environment,
+)
+from .template import TemplateEngine, compile_template
 
 __all__ = [
     "CAConfig",
@@ -41,11 +53,20 @@ __all__ = [
     "Config",
     "Database",
     "DbDefault",
+    "EffectiveDatabase",
+    "EffectiveEnvironment",
+    "EffectiveService",
     "Environment",
     "OracleConfig",
     "PostgresConfig",
     "Service",
+    "ShardedEnvs",
     "ShpdRegistry",
+    "TemplateEngine",
     "Upstream",
+    "compile_template",
     "load_config",
+    "remove_environment",
+    "shard_config",
+    "write_environment",
 ]
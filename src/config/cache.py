@@ -0,0 +1,108 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import os
+import pickle
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+
+# Bump whenever the pickled layout of Config changes.
+CACHE_FORMAT_VERSION = 5
+
+
+@dataclass(frozen=True)
+class FileFingerprint:
+    size: int
+    mtime_ns: int
+    sha256: str
+
+
+def read_fingerprinted(file_path: str) -> Tuple[bytes, FileFingerprint]:
+    """
+    Reads a file and fingerprints exactly the bytes that were read.
+
+    :param file_path: Path to the file.
+    :return: The file content and its fingerprint.
+    """
+    with open(file_path, "rb") as f:
+        st = os.fstat(f.fileno())
+        content = f.read()
+    return content, FileFingerprint(
+        size=len(content),
+        mtime_ns=st.st_mtime_ns,
+        sha256=hashlib.sha256(content).hexdigest(),
+    )
+
+
+def read_cache(cache_path: str) -> Optional[Tuple[Any, ...]]:
+    """
+    Reads a cache entry.
+
+    :param cache_path: Path to the cache file.
+    :return: The cached tuple, or None if missing, stale in format,
+             or unreadable.
+    """
+    try:
+        with open(cache_path, "rb") as f:
+            entry = pickle.load(f)
+    except Exception:
+        return None
+
+    if (
+        not isinstance(entry, tuple)
+        or not entry
+        or entry[0] != CACHE_FORMAT_VERSION
+    ):
+        return None
+    return entry[1:]
+
+
+def write_cache(cache_path: str, *payload: Any) -> None:
+    """
+    Atomically writes a cache entry; failures are silently ignored
+    since the cache is only an optimization.
+
+    :param cache_path: Path to the cache file.
+    :param payload: Picklable values to store.
+    """
+    cache_dir = os.path.dirname(os.path.abspath(cache_path))
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(
+                (CACHE_FORMAT_VERSION, *payload),
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, cache_path)
+        tmp_path = None
+    except Exception:
+        pass
+    finally:
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
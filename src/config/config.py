@@ -22,11 +22,25 @@
 
 import json
 import os
+import sys
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
 
+from .cache import read_cache, read_fingerprinted, write_cache
+from .effective import EffectiveEnvironment, effective_environment
+from .shards import ShardedEnvs
+from .template import TemplateEngine
 
-@dataclass
+# The config model is slotted, and strings repeated across the fleet are
+# interned while building it: long-running tools keep thousands of these
+# objects in memory.
+
+# Parallel FTP connections per transfer, unless the registry sets
+# `ftp_connections`.
+DEFAULT_FTP_CONNECTIONS = 4
+
+
+@dataclass(slots=True)
 class Upstream:
     tag: str
     type: str
@@ -40,7 +54,7 @@ class Upstream:
     enabled: bool
 
 
-@dataclass
+@dataclass(slots=True)
 class Database:
     type: str
     image: Optional[str]
@@ -51,7 +65,7 @@ class Database:
     upstreams: List[Upstream] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class Service:
     type: str
     tag: str
@@ -61,9 +75,10 @@ class Service:
     ports: Optional[dict[str, str]] = field(default_factory=dict)
     properties: Optional[dict[str, str]] = field(default_factory=dict)
     subject_alternative_name: Optional[str] = None
+    depends_on: List[str] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class Environment:
     tag: str
     db: Database
@@ -72,7 +87,7 @@ class Environment:
     active: bool
 
 
-@dataclass
+@dataclass(slots=True)
 class OracleConfig:
     image: str
     empty_env: str
@@ -82,23 +97,24 @@ class OracleConfig:
     net_listener_port: str
 
 
-@dataclass
+@dataclass(slots=True)
 class PostgresConfig:
     image: str
     empty_env: str
     net_listener_port: str
 
 
-@dataclass
+@dataclass(slots=True)
 class ShpdRegistry:
     ftp_server: str
     ftp_user: str
     ftp_psw: str
     ftp_shpd_path: str
     ftp_env_imgs_path: str
+    ftp_connections: int = DEFAULT_FTP_CONNECTIONS
 
 
-@dataclass
+@dataclass(slots=True)
 class CAConfig:
     country: str
     state: str
@@ -110,7 +126,7 @@ class CAConfig:
     passphrase: str
 
 
-@dataclass
+@dataclass(slots=True)
 class CertConfig:
     country: str
     state: str
@@ -122,7 +138,7 @@ class CertConfig:
     subject_alternative_names: List[str] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class DbDefault:
     sys_user: str
     sys_psw: str
@@ -130,7 +146,7 @@ class DbDefault:
     psw: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Config:
     ora: OracleConfig
     pg: PostgresConfig
@@ -142,131 +158,264 @@ class Config:
     cert: CertConfig
     envs_dir: str
     db_default: DbDefault
-    envs: List[Environment] = field(default_factory=list)
+    envs_layout: str = "inline"
+    envs: Sequence[Environment] = field(default_factory=list)
+    effective: Dict[str, EffectiveEnvironment] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+
+    def get_environment(self, tag: str) -> Optional[Environment]:
+        """
+        Gets an environment by tag.
+
+        :param tag: The environment's tag.
+        :return: The environment or None if not found.
+        """
+        if isinstance(self.envs, ShardedEnvs):
+            return self.envs.get(tag)
+        return next((env for env in self.envs if env.tag == tag), None)
+
+    def get_active_environment(self) -> Optional[Environment]:
+        """
+        Gets the active environment, if any.
+
+        :return: The active environment or None.
+        """
+        if isinstance(self.envs, ShardedEnvs):
+            tag = self.envs.active_tag()
+            return self.envs.get(tag) if tag is not None else None
+        return next((env for env in self.envs if env.active), None)
+
+    def get_effective_environment(
+        self, tag: str
+    ) -> Optional[EffectiveEnvironment]:
+        """
+        Gets the effective, fully merged view of an environment,
+        building it on first access.
+
+        :param tag: The environment's tag.
+        :return: The effective environment or None if not found.
+        """
+        effective = self.effective.get(tag)
+        if effective is not None:
+            return effective
+
+        env = self.get_environment(tag)
+        if env is None:
+            return None
+        effective = effective_environment(self, env)
+        self.effective[tag] = effective
+        return effective
+
+    def resolve_effective(self) -> None:
+        """
+        Builds the effective view of every inline environment up
+        front; sharded environments keep being resolved on access.
+        """
+        if isinstance(self.envs, ShardedEnvs):
+            return
+        for env in self.envs:
+            if env.tag not in self.effective:
+                self.effective[env.tag] = effective_environment(self, env)
 
 
 def parse_config(json_str: str) -> Config:
-    data = json.loads(json_str)
+    return build_config(json.loads(json_str))
+
+
+def build_config(data: Any, values: Optional[Dict[str, str]] = None) -> Config:
+    """
+    Builds a Config from a parsed JSON tree, resolving placeholders
+    against `values` while walking it, so that no intermediate tree
+    is ever built.
+
+    :param data: The parsed JSON configuration.
+    :param values: Optional placeholder values; when omitted the tree
+                   is taken verbatim.
+    :return: A Config object with resolved values.
+    """
+    return ConfigBuilder(values).config(data)
+
+
+class ConfigBuilder:
+    """
+    Builds the config model out of parsed JSON items, resolving
+    placeholders leaf by leaf.
+    """
+
+    def __init__(self, values: Optional[Dict[str, str]] = None):
+        self.values = values
+        self.engine = TemplateEngine(values) if values is not None else None
+
+    @property
+    def unresolved(self) -> Set[str]:
+        """Placeholder keys met so far that have no value."""
+        return self.engine.unresolved if self.engine is not None else set()
+
+    def resolve(self, value: Any) -> Any:
+        if self.engine is None or not isinstance(value, str):
+            return value
+        return self.engine.render(value)
+
+    def resolve_interned(self, value: Any) -> Any:
+        """
+        Resolves a value which is typically repeated across the fleet
+        (types, images, registry URLs) and interns it, so that all
+        occurrences share a single string.
+        """
+        value = self.resolve(value)
+        return sys.intern(value) if isinstance(value, str) else value
+
+    def resolve_tree(self, value: Any) -> Any:
+        if self.engine is None:
+            return value
+        if isinstance(value, dict):
+            valDict: Dict[Any, Any] = value
+            return {k: self.resolve_tree(v) for k, v in valDict.items()}
+        elif isinstance(value, list):
+            valList: List[Any] = value
+            return [self.resolve_tree(v) for v in valList]
+        return self.resolve(value)
 
-    def parse_upstream(item: Any) -> Upstream:
+    def upstream(self, item: Any) -> Upstream:
         return Upstream(
-            tag=item["tag"],
-            type=item["type"],
-            user=item["user"],
-            psw=item["psw"],
-            host=item["host"],
-            port=item["port"],
-            database=item["database"],
-            unix_user=item["unix_user"],
-            dump_dir=item["dump_dir"],
-            enabled=item["enabled"],
+            tag=self.resolve(item["tag"]),
+            type=self.resolve_interned(item["type"]),
+            user=self.resolve(item["user"]),
+            psw=self.resolve(item["psw"]),
+            host=self.resolve(item["host"]),
+            port=self.resolve(item["port"]),
+            database=self.resolve(item["database"]),
+            unix_user=self.resolve(item["unix_user"]),
+            dump_dir=self.resolve(item["dump_dir"]),
+            enabled=self.resolve(item["enabled"]),
         )
 
-    def parse_database(item: Any) -> Database:
+    def database(self, item: Any) -> Database:
         return Database(
-            type=item["type"],
-            image=item["image"],
-            sys_user=item["sys_user"],
-            sys_psw=item["sys_psw"],
-            user=item["user"],
-            psw=item["psw"],
+            type=self.resolve_interned(item["type"]),
+            image=self.resolve_interned(item["image"]),
+            sys_user=self.resolve(item["sys_user"]),
+            sys_psw=self.resolve(item["sys_psw"]),
+            user=self.resolve(item["user"]),
+            psw=self.resolve(item["psw"]),
             upstreams=[
-                parse_upstream(upstream) for upstream in item["upstreams"]
+                self.upstream(upstream) for upstream in item["upstreams"]
             ],
         )
 
-    def parse_service(item: Any) -> Service:
+    def service(self, item: Any) -> Service:
         return Service(
-            type=item["type"],
-            tag=item["tag"],
-            image=item["image"],
-            ingress=item.get("ingress"),
-            envvars=item.get("envvars", {}),
-            ports=item.get("ports", {}),
-            properties=item.get("properties", {}),
-            subject_alternative_name=item.get("subject_alternative_name"),
+            type=self.resolve_interned(item["type"]),
+            tag=self.resolve_interned(item["tag"]),
+            image=self.resolve_interned(item["image"]),
+            ingress=self.resolve(item.get("ingress")),
+            envvars=self.resolve_tree(item.get("envvars", {})),
+            ports=self.resolve_tree(item.get("ports", {})),
+            properties=self.resolve_tree(item.get("properties", {})),
+            subject_alternative_name=self.resolve(
+                item.get("subject_alternative_name")
+            ),
+            depends_on=[
+                self.resolve_interned(tag)
+                for tag in item.get("depends_on") or []
+            ],
         )
 
-    def parse_environment(item: Any) -> Environment:
+    def environment(self, item: Any) -> Environment:
         return Environment(
-            tag=item["tag"],
-            db=parse_database(item["db"]),
-            services=[parse_service(service) for service in item["services"]],
-            archived=item["archived"],
-            active=item["active"],
+            tag=self.resolve(item["tag"]),
+            db=self.database(item["db"]),
+            services=[self.service(service) for service in item["services"]],
+            archived=self.resolve(item["archived"]),
+            active=self.resolve(item["active"]),
         )
 
-    def parse_oracle_config(item: Any) -> OracleConfig:
+    def oracle_config(self, item: Any) -> OracleConfig:
         return OracleConfig(
-            image=item["image"],
-            empty_env=item["empty_env"],
-            pump_dir_name=item["pump_dir_name"],
-            root_db_name=item["root_db_name"],
-            plug_db_name=item["plug_db_name"],
-            net_listener_port=item["net_listener_port"],
+            image=self.resolve_interned(item["image"]),
+            empty_env=self.resolve(item["empty_env"]),
+            pump_dir_name=self.resolve(item["pump_dir_name"]),
+            root_db_name=self.resolve(item["root_db_name"]),
+            plug_db_name=self.resolve(item["plug_db_name"]),
+            net_listener_port=self.resolve(item["net_listener_port"]),
         )
 
-    def parse_postgres_config(item: Any) -> PostgresConfig:
+    def postgres_config(self, item: Any) -> PostgresConfig:
         return PostgresConfig(
-            image=item["image"],
-            empty_env=item["empty_env"],
-            net_listener_port=item["net_listener_port"],
+            image=self.resolve_interned(item["image"]),
+            empty_env=self.resolve(item["empty_env"]),
+            net_listener_port=self.resolve(item["net_listener_port"]),
         )
 
-    def parse_shpd_registry(item: Any) -> ShpdRegistry:
+    def shpd_registry(self, item: Any) -> ShpdRegistry:
         return ShpdRegistry(
-            ftp_server=item["ftp_server"],
-            ftp_user=item["ftp_user"],
-            ftp_psw=item["ftp_psw"],
-            ftp_shpd_path=item["ftp_shpd_path"],
-            ftp_env_imgs_path=item["ftp_env_imgs_path"],
+            ftp_server=self.resolve_interned(item["ftp_server"]),
+            ftp_user=self.resolve(item["ftp_user"]),
+            ftp_psw=self.resolve(item["ftp_psw"]),
+            ftp_shpd_path=self.resolve(item["ftp_shpd_path"]),
+            ftp_env_imgs_path=self.resolve(item["ftp_env_imgs_path"]),
+            ftp_connections=int(
+                self.resolve(
+                    item.get("ftp_connections") or DEFAULT_FTP_CONNECTIONS
+                )
+            ),
         )
 
-    def parse_ca_config(item: Any) -> CAConfig:
+    def ca_config(self, item: Any) -> CAConfig:
         return CAConfig(
-            country=item["country"],
-            state=item["state"],
-            locality=item["locality"],
-            organization=item["organization"],
-            organizational_unit=item["organizational_unit"],
-            common_name=item["common_name"],
-            email=item["email"],
-            passphrase=item["passphrase"],
+            country=self.resolve(item["country"]),
+            state=self.resolve(item["state"]),
+            locality=self.resolve(item["locality"]),
+            organization=self.resolve(item["organization"]),
+            organizational_unit=self.resolve(item["organizational_unit"]),
+            common_name=self.resolve(item["common_name"]),
+            email=self.resolve(item["email"]),
+            passphrase=self.resolve(item["passphrase"]),
         )
 
-    def parse_cert_config(item: Any) -> CertConfig:
+    def cert_config(self, item: Any) -> CertConfig:
         return CertConfig(
-            country=item["country"],
-            state=item["state"],
-            locality=item["locality"],
-            organization=item["organization"],
-            organizational_unit=item["organizational_unit"],
-            common_name=item["common_name"],
-            email=item["email"],
-            subject_alternative_names=item.get("subject_alternative_names", []),
+            country=self.resolve(item["country"]),
+            state=self.resolve(item["state"]),
+            locality=self.resolve(item["locality"]),
+            organization=self.resolve(item["organization"]),
+            organizational_unit=self.resolve(item["organizational_unit"]),
+            common_name=self.resolve(item["common_name"]),
+            email=self.resolve(item["email"]),
+            subject_alternative_names=self.resolve_tree(
+                item.get("subject_alternative_names", [])
+            ),
         )
 
-    def parse_db_default(item: Any) -> DbDefault:
+    def db_default(self, item: Any) -> DbDefault:
         return DbDefault(
-            sys_user=item["sys_user"],
-            sys_psw=item["sys_psw"],
-            user=item["user"],
-            psw=item["psw"],
+            sys_user=self.resolve(item["sys_user"]),
+            sys_psw=self.resolve(item["sys_psw"]),
+            user=self.resolve(item["user"]),
+            psw=self.resolve(item["psw"]),
         )
 
-    return Config(
-        ora=parse_oracle_config(data["ora"]),
-        pg=parse_postgres_config(data["pg"]),
-        shpd_registry=parse_shpd_registry(data["shpd_registry"]),
-        host_inet_ip=data["host_inet_ip"],
-        domain=data["domain"],
-        dns_type=data["dns_type"],
-        ca=parse_ca_config(data["ca"]),
-        cert=parse_cert_config(data["cert"]),
-        envs_dir=data["envs_dir"],
-        db_default=parse_db_default(data["db_default"]),
-        envs=[parse_environment(env) for env in data["envs"]],
-    )
+    def config(self, data: Any) -> Config:
+        return Config(
+            ora=self.oracle_config(data["ora"]),
+            pg=self.postgres_config(data["pg"]),
+            shpd_registry=self.shpd_registry(data["shpd_registry"]),
+            host_inet_ip=self.resolve(data["host_inet_ip"]),
+            domain=self.resolve(data["domain"]),
+            dns_type=self.resolve(data["dns_type"]),
+            ca=self.ca_config(data["ca"]),
+            cert=self.cert_config(data["cert"]),
+            envs_dir=self.resolve(data["envs_dir"]),
+            db_default=self.db_default(data["db_default"]),
+            envs_layout=data.get("envs_layout", "inline"),
+            envs=self.envs(data),
+        )
+
+    def envs(self, data: Any) -> Sequence[Environment]:
+        if data.get("envs_layout") == "sharded":
+            return ShardedEnvs(self.resolve(data["envs_dir"]), self.values)
+        return [self.environment(env) for env in data["envs"]]
 
 
 def load_user_values(file_path: str) -> Dict[str, str]:
@@ -285,8 +434,6 @@ def load_user_values(file_path: str) -> Dict[str, str]:
         FileNotFoundError: If the configuration file does not exist.
         ValueError: If the file is improperly formatted.
     """
-    user_values: Dict[str, str] = {}
-
     if not os.path.exists(file_path):
         raise FileNotFoundError(
             f"The configuration file '{file_path}' does not exist."
@@ -294,21 +441,37 @@ def load_user_values(file_path: str) -> Dict[str, str]:
 
     try:
         with open(file_path, "r") as file:
-            for line in file:
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-
-                if "=" in line:
-                    key, value = line.split("=", 1)
-                    user_values[key.strip()] = value.strip()
-                else:
-                    raise ValueError(
-                        f"Invalid line format in config file: '{line}'"
-                    )
+            return parse_user_values(file)
     except Exception as e:
         raise ValueError(f"Error reading configuration file: {e}")
 
+
+def parse_user_values(lines: Iterable[str]) -> Dict[str, str]:
+    """
+    Parses the user's values in key=value format into a dictionary.
+
+    Args:
+        lines (Iterable[str]): Lines of the user's values file.
+
+    Returns:
+        Dict[str, str]: A dictionary containing the key-value pairs.
+
+    Raises:
+        ValueError: If a line is improperly formatted.
+    """
+    user_values: Dict[str, str] = {}
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        if "=" in line:
+            key, value = line.split("=", 1)
+            user_values[key.strip()] = value.strip()
+        else:
+            raise ValueError(f"Invalid line format in config file: '{line}'")
+
     return user_values
 
 
@@ -328,39 +491,125 @@ def substitute_placeholders(
     """
 
     def replace(value: Any) -> Any:
-        if (
-            isinstance(value, str)
-            and value.startswith("${")
-            and value.endswith("}")
-        ):
-            key = value[2:-1]
-            return values.get(key, None)
-        elif isinstance(value, dict):
+        if isinstance(value, dict):
             valDict: Dict[Any, Any] = value
             return {k: replace(v) for k, v in valDict.items()}
         elif isinstance(value, list):
             valList: List[Any] = value
             return [replace(v) for v in valList]
-        return value
+        return resolve_placeholder(value, values)
 
     return replace(config_data)
 
 
-def load_config(file_config_path: str, file_values_path: str) -> Config:
+def resolve_placeholder(value: Any, values: Dict[str, str]) -> Any:
+    """
+    Resolves a single scalar value: a "${key}" string is replaced with
+    its value from `values`, or `None` if missing; anything else is
+    returned untouched.
+    """
+    if (
+        isinstance(value, str)
+        and value.startswith("${")
+        and value.endswith("}")
+    ):
+        return values.get(value[2:-1], None)
+    return value
+
+
+def load_config(
+    file_config_path: str,
+    file_values_path: str,
+    cache_path: Optional[str] = None,
+) -> Config:
     """
     Loads a JSON configuration file, substitutes placeholders with
-    values from another file, and returns a parsed Config object.
+    values from another file, and returns a parsed Config object with
+    the effective view of its environments already resolved.
+
+    When `cache_path` is given, the resolved Config is persisted there
+    and reused as long as size, mtime and content hash of both files
+    are unchanged, skipping parsing and substitution entirely.
 
     :param file_config_path: Path to the JSON configuration file
                              containing placeholders.
     :param file_values_path: Path to the JSON file with key-value
                              pairs for substitution.
+    :param cache_path: Optional path to the resolved config cache.
     :return: A Config object with resolved values.
     """
+    if cache_path is not None:
+        return load_config_cached(
+            file_config_path, file_values_path, cache_path
+        )
+
     with open(file_config_path, "r", encoding="utf-8") as f:
         config_data = json.load(f)
 
-    values = load_user_values(file_values_path)
-    substituted_config = substitute_placeholders(config_data, values)
+    builder = ConfigBuilder(load_user_values(file_values_path))
+    config = builder.config(config_data)
+    config.resolve_effective()
+    report_unresolved(builder.unresolved)
+    return config
+
+
+def load_config_cached(
+    file_config_path: str, file_values_path: str, cache_path: str
+) -> Config:
+    """
+    Cache-backed variant of `load_config`.
+
+    Both files are read once; their fingerprints are computed on the
+    very bytes that get parsed on a miss, so an edit racing with the
+    load can never be cached under the old fingerprint.
+
+    :param file_config_path: Path to the JSON configuration file.
+    :param file_values_path: Path to the user's values file.
+    :param cache_path: Path to the resolved config cache.
+    :return: A Config object with resolved values.
+    """
+    config_bytes, config_fp = read_fingerprinted(file_config_path)
+    if not os.path.exists(file_values_path):
+        raise FileNotFoundError(
+            f"The configuration file '{file_values_path}' does not exist."
+        )
+    values_bytes, values_fp = read_fingerprinted(file_values_path)
+
+    entry = read_cache(cache_path)
+    if entry is not None and len(entry) == 4:
+        cached_config_fp, cached_values_fp, cached_config, unresolved = entry
+        if (
+            cached_config_fp == config_fp
+            and cached_values_fp == values_fp
+            and isinstance(cached_config, Config)
+        ):
+            report_unresolved(unresolved)
+            return cached_config
 
-    return parse_config(json.dumps(substituted_config))
+    try:
+        values = parse_user_values(values_bytes.decode("utf-8").splitlines())
+    except Exception as e:
+        raise ValueError(f"Error reading configuration file: {e}")
+
+    builder = ConfigBuilder(values)
+    config = builder.config(json.loads(config_bytes.decode("utf-8")))
+    config.resolve_effective()
+    report_unresolved(builder.unresolved)
+
+    write_cache(
+        cache_path, config_fp, values_fp, config, sorted(builder.unresolved)
+    )
+    return config
+
+
+def report_unresolved(keys: Iterable[str]) -> None:
+    """
+    Warns about placeholders left without a value, which stay in the
+    configuration as they are written.
+    """
+    keys = sorted(keys)
+    if keys:
+        print(
+            f"Warning: no value for placeholders {', '.join(keys)}.",
+            file=sys.stderr,
+        )
@@ -0,0 +1,200 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from .config import Config, Database, Environment, Service, Upstream
+
+
+@dataclass(slots=True, frozen=True)
+class EffectiveDatabase:
+    type: str
+    image: Optional[str]
+    empty_env: Optional[str]
+    net_listener_port: Optional[str]
+    sys_user: str
+    sys_psw: str
+    user: str
+    psw: str
+    upstreams: List["Upstream"]
+
+    def spec_hash(self) -> str:
+        """Hash of the settings the DBMS container is created from."""
+        return spec_hash(
+            [
+                self.type,
+                self.image,
+                self.empty_env,
+                self.net_listener_port,
+                self.sys_user,
+                self.sys_psw,
+                self.user,
+                self.psw,
+            ]
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class EffectiveService:
+    type: str
+    tag: str
+    image: str
+    ingress: bool
+    envvars: Dict[str, Any]
+    ports: Dict[str, Any]
+    properties: Dict[str, Any]
+    subject_alternative_name: Optional[str]
+    depends_on: List[str]
+
+    def spec_hash(self, db: EffectiveDatabase) -> str:
+        """
+        Hash of the settings the service container is created from,
+        including those of the database it connects to.
+
+        :param db: The effective database of the environment.
+        :return: The hex digest.
+        """
+        return spec_hash(
+            [
+                self.type,
+                self.image,
+                self.ingress,
+                self.envvars,
+                self.ports,
+                self.properties,
+                self.subject_alternative_name,
+                db.spec_hash(),
+            ]
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class EffectiveEnvironment:
+    tag: str
+    db: EffectiveDatabase
+    services: List[EffectiveService]
+    services_by_tag: Dict[str, EffectiveService]
+
+    def get_service(self, tag: str) -> Optional[EffectiveService]:
+        """
+        Gets a service by tag.
+
+        :param tag: The service's tag.
+        :return: The service or None if not found.
+        """
+        return self.services_by_tag.get(tag)
+
+
+def spec_hash(spec: Any) -> str:
+    """
+    Hashes a JSON-like spec; dict key order does not matter.
+
+    :param spec: The spec.
+    :return: The hex digest.
+    """
+    data = json.dumps(spec, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def flatten(value: Any) -> Dict[str, Any]:
+    """
+    Normalizes `envvars`/`ports`/`properties` into a flat dict: they
+    may be given as a dict, as a list of single-key dicts, or be
+    missing altogether.
+
+    :param value: The value as found in the config.
+    :return: A new flat dict; later keys win over earlier ones.
+    """
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        flat: Dict[str, Any] = {}
+        for item in value:
+            if not isinstance(item, dict):
+                raise ValueError(
+                    f"Expected a list of single-key objects, got '{item}'."
+                )
+            flat.update(item)
+        return flat
+    raise ValueError(f"Expected an object or a list of objects, got '{value}'.")
+
+
+def effective_database(config: "Config", db: "Database") -> EffectiveDatabase:
+    """
+    Resolves a database block: empty fields fall back to `db_default`,
+    image, empty environment and listener port to the `ora`/`pg`
+    section matching the database type.
+    """
+    default = config.db_default
+    engine: Any = {"ora": config.ora, "pg": config.pg}.get(db.type)
+    return EffectiveDatabase(
+        type=db.type,
+        image=db.image or (engine.image if engine else None),
+        empty_env=engine.empty_env if engine else None,
+        net_listener_port=engine.net_listener_port if engine else None,
+        sys_user=db.sys_user or default.sys_user,
+        sys_psw=db.sys_psw or default.sys_psw,
+        user=db.user or default.user,
+        psw=db.psw or default.psw,
+        upstreams=db.upstreams,
+    )
+
+
+def effective_service(service: "Service") -> EffectiveService:
+    return EffectiveService(
+        type=service.type,
+        tag=service.tag,
+        image=service.image,
+        ingress=bool(service.ingress),
+        envvars=flatten(service.envvars),
+        ports=flatten(service.ports),
+        properties=flatten(service.properties),
+        subject_alternative_name=service.subject_alternative_name,
+        depends_on=list(service.depends_on),
+    )
+
+
+def effective_environment(
+    config: "Config", env: "Environment"
+) -> EffectiveEnvironment:
+    """
+    Builds the fully merged view of an environment. Its state flags
+    are not part of it: they stay on the Environment, where the
+    state journal updates them.
+
+    :param config: The config the environment belongs to.
+    :param env: The environment.
+    :return: The effective environment.
+    """
+    services = [effective_service(service) for service in env.services]
+    return EffectiveEnvironment(
+        tag=env.tag,
+        db=effective_database(config, env.db),
+        services=services,
+        services_by_tag={service.tag: service for service in services},
+    )
@@ -0,0 +1,337 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import fcntl
+import json
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Union,
+    overload,
+)
+
+if TYPE_CHECKING:
+    from .config import Environment
+
+# Sharded layout: every environment definition lives in its own file
+# under <envs_dir>/.env_defs, next to an index mapping tags to files and
+# holding the active/archived flags.
+ENV_DEFS_DIR = ".env_defs"
+INDEX_FILE = "index.json"
+INDEX_FORMAT_VERSION = 1
+
+# Tags name the definition files, so they must be plain file names.
+TAG_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+
+
+def env_defs_dir(envs_dir: str) -> str:
+    return os.path.join(os.path.expanduser(envs_dir), ENV_DEFS_DIR)
+
+
+def read_index(envs_dir: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Reads the environments index.
+
+    :param envs_dir: The environments base directory.
+    :return: The index entries by tag; empty if there is no index yet.
+    """
+    index_path = os.path.join(env_defs_dir(envs_dir), INDEX_FILE)
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return data["envs"]
+
+
+def write_json_atomic(file_path: str, data: Any) -> None:
+    """
+    Writes `data` as JSON to `file_path` through a temporary file and
+    a rename, so that readers never see a partial file.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(file_path), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_index(envs_dir: str, index: Dict[str, Dict[str, Any]]) -> None:
+    write_json_atomic(
+        os.path.join(env_defs_dir(envs_dir), INDEX_FILE),
+        {"version": INDEX_FORMAT_VERSION, "envs": index},
+    )
+
+
+def check_tag(tag: Any) -> str:
+    """
+    Validates an environment tag for use as a file name.
+
+    :param tag: The tag.
+    :return: The tag.
+    :raises ValueError: If the tag is not a plain file name.
+    """
+    if not isinstance(tag, str) or not TAG_PATTERN.fullmatch(tag):
+        raise ValueError(f"Invalid environment tag '{tag}'.")
+    return tag
+
+
+@contextmanager
+def _locked(envs_dir: str) -> Generator[None, None, None]:
+    # Index updates are read-modify-write: serialize them.
+    lock_path = os.path.join(env_defs_dir(envs_dir), INDEX_FILE + ".lock")
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def write_environments(envs_dir: str, items: Iterable[Dict[str, Any]]) -> None:
+    """
+    Stores environment definitions each in its own file and registers
+    them in the index, creating the layout if needed.
+
+    :param envs_dir: The environments base directory.
+    :param items: The environment definitions, as found in `envs`.
+    :raises ValueError: If a tag is not a plain file name.
+    """
+    items = list(items)
+    for item in items:
+        check_tag(item.get("tag"))
+    defs_dir = env_defs_dir(envs_dir)
+    os.makedirs(defs_dir, exist_ok=True)
+
+    with _locked(envs_dir):
+        index = read_index(envs_dir)
+        for item in items:
+            tag: str = item["tag"]
+            file_name = f"{tag}.json"
+            write_json_atomic(os.path.join(defs_dir, file_name), item)
+            index[tag] = {
+                "file": file_name,
+                "active": bool(item.get("active", False)),
+                "archived": bool(item.get("archived", False)),
+            }
+        write_index(envs_dir, index)
+
+
+def write_environment(envs_dir: str, item: Dict[str, Any]) -> None:
+    """
+    Stores an environment definition in its own file and registers it
+    in the index, creating the layout if needed.
+
+    :param envs_dir: The environments base directory.
+    :param item: The environment definition, as found in `envs`.
+    :raises ValueError: If the tag is not a plain file name.
+    """
+    write_environments(envs_dir, [item])
+
+
+def remove_environment(envs_dir: str, tag: str) -> None:
+    """
+    Unregisters an environment from the index and removes its file.
+
+    :param envs_dir: The environments base directory.
+    :param tag: The environment's tag.
+    """
+    if not os.path.isdir(env_defs_dir(envs_dir)):
+        return
+    with _locked(envs_dir):
+        index = read_index(envs_dir)
+        entry = index.pop(tag, None)
+        if entry is None:
+            return
+        write_index(envs_dir, index)
+        try:
+            os.unlink(os.path.join(env_defs_dir(envs_dir), entry["file"]))
+        except FileNotFoundError:
+            pass
+
+
+def shard_config(config_path: str, envs_dir: str) -> int:
+    """
+    Moves the inline environments of a config file to the sharded
+    layout, then rewrites the config file without them.
+
+    :param config_path: The config file.
+    :param envs_dir: The resolved environments base directory.
+    :return: The number of environments moved.
+    :raises ValueError: If the config already uses the sharded layout.
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("envs_layout") == "sharded":
+        raise ValueError("Environments are already sharded.")
+
+    items = data.pop("envs", [])
+    write_environments(envs_dir, items)
+    data["envs_layout"] = "sharded"
+    mode = os.stat(config_path).st_mode
+    write_json_atomic(config_path, data)
+    os.chmod(config_path, mode)
+    return len(items)
+
+
+class ShardedEnvs(Sequence["Environment"]):
+    """
+    Read-only sequence of environments backed by the sharded layout.
+
+    The index is read on first use and each environment is parsed only
+    when accessed, so the cost of loading the config does not depend on
+    the number of environments.
+    """
+
+    def __init__(self, envs_dir: str, values: Optional[Dict[str, str]]):
+        self.envs_dir = envs_dir
+        self.values = values
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._parsed: Dict[str, "Environment"] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Only the location is persisted: shards may change on disk
+        # independently from shpdctl.json, so they are always re-read.
+        return {"envs_dir": self.envs_dir, "values": self.values}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["envs_dir"], state["values"])
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ShardedEnvs):
+            return NotImplemented
+        return (self.envs_dir, self.values) == (other.envs_dir, other.values)
+
+    def __repr__(self) -> str:
+        return f"ShardedEnvs({self.envs_dir!r}, tags={self.tags()!r})"
+
+    @property
+    def index_data(self) -> Dict[str, Dict[str, Any]]:
+        if self._index is None:
+            self._index = read_index(self.envs_dir)
+        return self._index
+
+    def tags(self) -> List[str]:
+        return list(self.index_data)
+
+    def active_tag(self) -> Optional[str]:
+        """Tells the active environment without parsing any of them."""
+        for tag, entry in self.index_data.items():
+            if entry.get("active"):
+                return tag
+        return None
+
+    def set_flags(
+        self,
+        tag: str,
+        active: Optional[bool] = None,
+        archived: Optional[bool] = None,
+    ) -> None:
+        """
+        Overrides the state of an environment in memory, without
+        parsing it.
+        """
+        entry = self.index_data[tag]
+        env = self._parsed.get(tag)
+        if active is not None:
+            entry["active"] = active
+            if env is not None:
+                env.active = active
+        if archived is not None:
+            entry["archived"] = archived
+            if env is not None:
+                env.archived = archived
+
+    def get(self, tag: str) -> Optional["Environment"]:
+        """
+        Gets an environment by tag, parsing it on first access.
+
+        :param tag: The environment's tag.
+        :return: The environment or None if not registered.
+        """
+        env = self._parsed.get(tag)
+        if env is not None:
+            return env
+
+        entry = self.index_data.get(tag)
+        if entry is None:
+            return None
+
+        from .config import ConfigBuilder, report_unresolved
+
+        file_path = os.path.join(env_defs_dir(self.envs_dir), entry["file"])
+        builder = ConfigBuilder(self.values)
+        with open(file_path, "r", encoding="utf-8") as f:
+            env = builder.environment(json.load(f))
+        report_unresolved(builder.unresolved)
+        # The index is authoritative for the environment's state.
+        env.active = bool(entry.get("active", False))
+        env.archived = bool(entry.get("archived", False))
+        self._parsed[tag] = env
+        return env
+
+    def __contains__(self, value: object) -> bool:
+        if isinstance(value, str):
+            return value in self.index_data
+        return super().__contains__(value)
+
+    def __len__(self) -> int:
+        return len(self.index_data)
+
+    def __iter__(self) -> Iterator["Environment"]:
+        for tag in self.tags():
+            env = self.get(tag)
+            if env is not None:
+                yield env
+
+    @overload
+    def __getitem__(self, i: int) -> "Environment": ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List["Environment"]: ...
+
+    def __getitem__(
+        self, i: Union[int, slice]
+    ) -> Union["Environment", List["Environment"]]:
+        tags = self.tags()
+        if isinstance(i, slice):
+            return [env for env in map(self.get, tags[i]) if env is not None]
+        env = self.get(tags[i])
+        if env is None:
+            raise IndexError(i)
+        return env
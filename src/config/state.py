@@ -0,0 +1,211 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import fcntl
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional
+
+from .config import Config
+from .shards import ShardedEnvs
+
+# Journal operations.
+OP_CHECKOUT = "checkout"
+OP_NOACTIVE = "noactive"
+OP_ARCHIVE = "archive"
+OP_RESTORE = "restore"
+OP_SNAPSHOT = "snapshot"
+
+# Journal size beyond which an append triggers a compaction.
+COMPACT_THRESHOLD_BYTES = 64 * 1024
+
+
+@dataclass(slots=True)
+class EnvState:
+    """
+    Environments' state resulting from a journal replay, relative to
+    the static config: `active_set` tells whether the active
+    environment was decided by the journal at all.
+    """
+
+    active_set: bool = False
+    active: Optional[str] = None
+    archived: Dict[str, bool] = field(default_factory=dict)
+
+    def apply_record(self, record: Dict[str, Any]) -> None:
+        op = record.get("op")
+        if op == OP_CHECKOUT:
+            self.active_set, self.active = True, record["tag"]
+        elif op == OP_NOACTIVE:
+            self.active_set, self.active = True, None
+        elif op == OP_ARCHIVE:
+            self.archived[record["tag"]] = True
+        elif op == OP_RESTORE:
+            self.archived[record["tag"]] = False
+        elif op == OP_SNAPSHOT:
+            self.active_set = record["active_set"]
+            self.active = record["active"]
+            self.archived = dict(record["archived"])
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            "op": OP_SNAPSHOT,
+            "active_set": self.active_set,
+            "active": self.active,
+            "archived": self.archived,
+        }
+
+    def apply_to(self, config: Config) -> None:
+        """
+        Overlays this state on a config's environments.
+
+        For the sharded layout only the index entries are touched, so
+        no environment gets parsed.
+        """
+        if isinstance(config.envs, ShardedEnvs):
+            sharded = config.envs
+            for tag in sharded.tags():
+                flags: Dict[str, bool] = {}
+                if self.active_set:
+                    flags["active"] = tag == self.active
+                if tag in self.archived:
+                    flags["archived"] = self.archived[tag]
+                    if self.archived[tag]:
+                        # An archived environment cannot be active.
+                        flags["active"] = False
+                if flags:
+                    sharded.set_flags(tag, **flags)
+            return
+
+        for env in config.envs:
+            if self.active_set:
+                env.active = env.tag == self.active
+            if env.tag in self.archived:
+                env.archived = self.archived[env.tag]
+                if env.archived:
+                    env.active = False
+
+
+class StateJournal:
+    """
+    Append-only journal of the environments' state changes, kept next
+    to the config.
+
+    Each change is a single JSON line appended with O_APPEND, so it
+    costs O(1) I/O however large the config is; the current state is
+    rebuilt by replaying the journal over the static config. Once the
+    journal grows past a threshold it is compacted into a single
+    snapshot record. Appends hold a shared lock and compaction an
+    exclusive one, so that no concurrent append is lost.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compact_threshold: int = COMPACT_THRESHOLD_BYTES,
+    ):
+        self.path = path
+        self.compact_threshold = compact_threshold
+
+    @contextmanager
+    def _locked(self, operation: int) -> Iterator[None]:
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, operation)
+            yield
+        finally:
+            os.close(fd)
+
+    def append(self, op: str, tag: Optional[str] = None) -> None:
+        """
+        Appends a state change.
+
+        :param op: The operation (checkout, noactive, archive, restore).
+        :param tag: The environment's tag, where the operation has one.
+        """
+        record: Dict[str, Any] = {"op": op}
+        if tag is not None:
+            record["tag"] = tag
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+
+        with self._locked(fcntl.LOCK_SH):
+            fd = os.open(
+                self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+            )
+            try:
+                os.write(fd, line)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+
+        if size > self.compact_threshold:
+            self.compact()
+
+    def replay(self) -> EnvState:
+        """
+        Rebuilds the state recorded by the journal.
+
+        :return: The state, relative to the static config.
+        """
+        state = EnvState()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn trailing line from an interrupted write.
+                        continue
+                    state.apply_record(record)
+        except FileNotFoundError:
+            pass
+        return state
+
+    def compact(self) -> None:
+        """Rewrites the journal as a single snapshot record."""
+        with self._locked(fcntl.LOCK_EX):
+            state = self.replay()
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.path)),
+                suffix=".tmp",
+            )
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(json.dumps(state.to_record()) + "\n")
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def apply(self, config: Config) -> Config:
+        """
+        Replays the journal over a config.
+
+        :param config: The static config.
+        :return: The same config, with the current state.
+        """
+        if os.path.exists(self.path):
+            self.replay().apply_to(config)
+        return config
@@ -0,0 +1,195 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+
+@dataclass(frozen=True, slots=True)
+class Placeholder:
+    """A "${...}" segment; its key may itself be a template."""
+
+    key: Union[str, "Template"]
+    source: str
+
+
+@dataclass(frozen=True, slots=True)
+class Template:
+    """A string compiled into literal and placeholder segments."""
+
+    source: str
+    segments: Tuple[Union[str, Placeholder], ...]
+
+    @property
+    def is_placeholder(self) -> bool:
+        """Tells whether the whole string is a single placeholder."""
+        return len(self.segments) == 1 and isinstance(
+            self.segments[0], Placeholder
+        )
+
+
+def _closing_brace(text: str, start: int) -> int:
+    """
+    Finds the brace closing the placeholder whose key starts at
+    `start`, honouring nested placeholders; -1 if unterminated.
+    """
+    depth = 1
+    i = start
+    while i < len(text):
+        c = text[i]
+        if c == "$" and text.startswith("${", i):
+            depth += 1
+            i += 2
+            continue
+        if c == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return -1
+
+
+@lru_cache(maxsize=65536)
+def compile_template(text: str) -> Template:
+    """
+    Compiles a string into literal and placeholder segments.
+
+    :param text: The string to compile.
+    :return: The compiled template.
+    """
+    segments: List[Union[str, Placeholder]] = []
+    pos = 0
+    while True:
+        start = text.find("${", pos)
+        if start < 0:
+            break
+        end = _closing_brace(text, start + 2)
+        if end < 0:
+            break
+        if start > pos:
+            segments.append(text[pos:start])
+        key_source = text[start + 2 : end]
+        key: Union[str, Template] = (
+            compile_template(key_source) if "${" in key_source else key_source
+        )
+        segments.append(Placeholder(key=key, source=text[start : end + 1]))
+        pos = end + 1
+    if pos < len(text):
+        segments.append(text[pos:])
+    return Template(source=text, segments=tuple(segments))
+
+
+class TemplateEngine:
+    """
+    Renders strings holding "${key}" placeholders against a set of
+    values.
+
+    Values may themselves hold placeholders and keys may be nested, as
+    in "${${env}_image}". Every string is compiled once and every
+    rendering is memoized for the engine's value set, so resolving a
+    config costs a single pass over it. Keys that cannot be resolved
+    are collected in `unresolved` along the way.
+
+    A string made of a single placeholder renders to its value, or to
+    None if missing; placeholders embedded in a longer string are left
+    verbatim when missing.
+    """
+
+    def __init__(self, values: Dict[str, str]):
+        self.values = values
+        self.unresolved: Set[str] = set()
+        self._rendered: Dict[str, Optional[str]] = {}
+        self._resolved: Dict[str, Optional[str]] = {}
+        self._resolving: Set[str] = set()
+
+    def render(self, text: str) -> Optional[str]:
+        """
+        Renders a string.
+
+        :param text: The string to render.
+        :return: The rendered string, or None for a missing single
+                 placeholder.
+        :raises ValueError: If values reference each other in a cycle.
+        """
+        if "${" not in text:
+            return text
+        try:
+            return self._rendered[text]
+        except KeyError:
+            pass
+        rendered = self._render(compile_template(text))
+        self._rendered[text] = rendered
+        return rendered
+
+    def lookup(self, key: str) -> Optional[str]:
+        """
+        Gets the fully rendered value of a key.
+
+        :param key: The key to look up.
+        :return: The value, or None if missing.
+        """
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+        if key in self._resolving:
+            raise ValueError(f"Circular placeholder reference: '{key}'")
+
+        raw = self.values.get(key)
+        if raw is None:
+            self.unresolved.add(key)
+            resolved = None
+        else:
+            self._resolving.add(key)
+            try:
+                resolved = self.render(raw)
+            finally:
+                self._resolving.discard(key)
+        self._resolved[key] = resolved
+        return resolved
+
+    def _render(self, template: Template) -> Optional[str]:
+        if template.is_placeholder:
+            placeholder = template.segments[0]
+            assert isinstance(placeholder, Placeholder)
+            key = self._render_key(placeholder)
+            return self.lookup(key) if key is not None else None
+
+        parts: List[str] = []
+        for segment in template.segments:
+            if isinstance(segment, str):
+                parts.append(segment)
+                continue
+            key = self._render_key(segment)
+            value = self.lookup(key) if key is not None else None
+            parts.append(segment.source if value is None else value)
+        return "".join(parts)
+
+    def _render_key(self, placeholder: Placeholder) -> Optional[str]:
+        if isinstance(placeholder.key, str):
+            return placeholder.key
+        key = self._render(placeholder.key)
+        if key is None or "${" in key:
+            self.unresolved.add(placeholder.key.source)
+            return None
+        return key
@@ -0,0 +1,150 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import stat
+import sys
+from typing import Any, Dict, List, Optional
+
+# This module is imported on every shpdctl invocation: modules needed
+# only to talk to a running daemon are imported when that happens.
+
+# Only short, read-only commands are forwarded to the daemon: it runs
+# them one at a time and returns their output once done, so anything
+# long-running, interactive or changing state runs in-process.
+FORWARDED_COMMANDS = [("env", "list"), ("env", "status"), ("reg", "list")]
+# Variables of the caller's environment the daemon runs commands with.
+FORWARDED_ENV_PREFIX = "SHPD_"
+RECV_BUFSIZE = 65536
+
+
+def default_socket_path() -> str:
+    """Path of the daemon's Unix socket."""
+    path = os.environ.get("SHPD_DAEMON_SOCKET")
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "shpdctl.sock")
+    return f"/tmp/shpdctl-{os.getuid()}.sock"
+
+
+def is_trusted_socket(socket_path: str) -> bool:
+    """
+    Tells whether a socket was created by the current user: the
+    default path may be in a world-writable directory, where anybody
+    could have bound it to receive the forwarded variables.
+    """
+    try:
+        st = os.lstat(socket_path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid()
+
+
+def is_forwardable(argv: List[str]) -> bool:
+    """Tells whether a command line can be served by the daemon."""
+    if os.environ.get("SHPD_NO_DAEMON"):
+        return False
+    if "--help" in argv:
+        return False
+    words = [arg for arg in argv if not arg.startswith("-")]
+    return tuple(words[:2]) in FORWARDED_COMMANDS
+
+
+def forwarded_env() -> Dict[str, str]:
+    """The caller's variables the daemon runs a command with."""
+    return {
+        key: value
+        for key, value in os.environ.items()
+        if key.startswith(FORWARDED_ENV_PREFIX)
+    }
+
+
+def send_request(
+    request: Dict[str, Any], socket_path: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Sends a request to the daemon and waits for its response.
+
+    :param request: The request.
+    :param socket_path: The daemon's socket, default one if omitted.
+    :return: The response.
+    :raises OSError: If the daemon cannot be reached.
+    """
+    import json
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path or default_socket_path())
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        chunks: List[bytes] = []
+        while True:
+            chunk = sock.recv(RECV_BUFSIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return json.loads(b"".join(chunks))
+
+
+def forward(
+    argv: List[str], config_path: str, socket_path: Optional[str] = None
+) -> Optional[int]:
+    """
+    Runs a command line through the daemon, if one is serving the same
+    configuration.
+
+    :param argv: The command line, without the program name.
+    :param config_path: Path of the configuration the caller would use.
+    :param socket_path: The daemon's socket, default one if omitted.
+    :return: The command's exit code, or None if the command must run
+             in-process.
+    """
+    socket_path = socket_path or default_socket_path()
+    if not is_forwardable(argv) or not is_trusted_socket(socket_path):
+        return None
+    try:
+        response = send_request(
+            {
+                "op": "run",
+                "argv": argv,
+                "config": config_path,
+                "cwd": os.getcwd(),
+                "env": forwarded_env(),
+            },
+            socket_path,
+        )
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Stale socket: no daemon is listening.
+        return None
+    except (OSError, ValueError) as e:
+        # The command may have run already: never run it twice.
+        sys.stderr.write(f"Error: lost connection to shpdctl daemon: {e}\n")
+        return 1
+    if response.get("status") != "ok":
+        return None
+
+    sys.stdout.write(response["stdout"])
+    sys.stdout.flush()
+    sys.stderr.write(response["stderr"])
+    return int(response["exit_code"])
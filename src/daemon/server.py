@@ -0,0 +1,205 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .client import (
+    FORWARDED_ENV_PREFIX,
+    default_socket_path,
+    forwarded_env,
+    send_request,
+)
+
+# Seconds the daemon reuses a container listing for: automation polls
+# `env status` in tight loops.
+CONTAINER_STATE_TTL = 1.0
+
+FileStamp = Optional[Tuple[int, int]]
+
+
+def file_stamp(path: str) -> FileStamp:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def set_env(env: Dict[str, str]) -> None:
+    """Replaces the process' SHPD_* variables."""
+    for key in list(os.environ):
+        if key.startswith(FORWARDED_ENV_PREFIX) and key not in env:
+            del os.environ[key]
+    os.environ.update(env)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "_Server"
+
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline())
+            response = self.server.daemon.handle(request)
+        except Exception as e:
+            response = {"status": "error", "error": str(e)}
+        self.wfile.write(json.dumps(response).encode())
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, daemon: "Daemon"):
+        self.daemon = daemon
+        super().__init__(socket_path, _Handler)
+
+
+class Daemon:
+    """
+    Resident shpdctl serving commands over a Unix socket.
+
+    The daemon keeps the parsed configuration and the subsystem objects
+    in memory across commands. Before serving a command it checks the
+    watched files (configuration, user's values, state journal) and the
+    caller's SHPD_* variables, and resets everything it built if any of
+    them changed. Commands run one at a time, with the caller's
+    variables, since they share the process' stdout and state.
+    """
+
+    def __init__(
+        self,
+        config_path: str,
+        run_command: Callable[[List[str]], int],
+        reset: Callable[[], None],
+        watched_paths: Callable[[], List[str]],
+        socket_path: Optional[str] = None,
+    ):
+        self.config_path = config_path
+        self.run_command = run_command
+        self.reset = reset
+        self.watched_paths = watched_paths
+        self.socket_path = socket_path or default_socket_path()
+        self._lock = threading.Lock()
+        self._stamps: Dict[str, FileStamp] = {}
+        self._env: Optional[Dict[str, str]] = None
+        self._server: Optional[_Server] = None
+
+    def refresh(self) -> bool:
+        """
+        Resets the resident state if a watched file changed.
+
+        :return: True if a reset happened.
+        """
+        stamps = {path: file_stamp(path) for path in self.watched_paths()}
+        if stamps == self._stamps:
+            return False
+        self.reset()
+        # Re-stamp after the reset, as loading may add watched paths.
+        self._stamps = stamps
+        return True
+
+    def run(
+        self, argv: List[str], cwd: str, env: Dict[str, str]
+    ) -> Dict[str, Any]:
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with self._lock:
+            prev_cwd = os.getcwd()
+            prev_stdin = sys.stdin
+            prev_env = forwarded_env()
+            try:
+                set_env(env)
+                if env != self._env:
+                    # The configuration and the engine depend on them.
+                    self._env = env
+                    self._stamps = {}
+                self.refresh()
+                os.chdir(cwd)
+                sys.stdin = io.StringIO()
+                with redirect_stdout(stdout), redirect_stderr(stderr):
+                    exit_code = self.run_command(argv)
+                # Commands may change watched files themselves (e.g.
+                # the journal): their effects are already in memory.
+                self._stamps = {
+                    path: file_stamp(path) for path in self.watched_paths()
+                }
+            finally:
+                set_env(prev_env)
+                sys.stdin = prev_stdin
+                os.chdir(prev_cwd)
+        return {
+            "status": "ok",
+            "exit_code": exit_code,
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue(),
+        }
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        if op == "run":
+            if request.get("config") != self.config_path:
+                return {"status": "mismatch"}
+            return self.run(
+                request["argv"], request["cwd"], request.get("env", {})
+            )
+        if op == "status":
+            return {
+                "status": "ok",
+                "pid": os.getpid(),
+                "config": self.config_path,
+            }
+        if op == "stop":
+            threading.Thread(target=self.shutdown).start()
+            return {"status": "ok"}
+        return {"status": "error", "error": f"Unknown operation '{op}'"}
+
+    def serve_forever(self) -> None:
+        """Serves until stopped; the socket is removed on exit."""
+        if os.path.exists(self.socket_path):
+            try:
+                send_request({"op": "status"}, self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)
+            else:
+                raise ValueError(
+                    f"A daemon is already serving on {self.socket_path}."
+                )
+        prev_umask = os.umask(0o077)
+        try:
+            self._server = _Server(self.socket_path, self)
+        finally:
+            os.umask(prev_umask)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
@@ -20,8 +20,15 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from typing import Dict, Optional
+
+from config import Config
+
 
 class Database:
+    def __init__(self, config: Config):
+        self.config = config
+
     def build_dbms_image(self) -> None:
         """Stub for building DBMS image."""
         pass
@@ -30,14 +37,25 @@ class Database:
         """Stub for bootstrapping DBMS service."""
         pass
 
-    def start_dbms_service(self) -> None:
-        """Stub for starting DBMS service."""
+    def start_dbms_service(
+        self,
+        labels: Optional[Dict[str, str]] = None,
+        data_dir: Optional[str] = None,
+    ) -> None:
+        """
+        Stub for starting DBMS service with a labelled container,
+        mounting the environment's data from `data_dir`.
+        """
         pass
 
     def halt_dbms_service(self) -> None:
         """Stub for halting DBMS service."""
         pass
 
+    def is_dbms_ready(self) -> bool:
+        """Stub for probing whether the DBMS accepts connections."""
+        return True
+
     def show_dbms_stdout(self) -> None:
         """Stub for showing DBMS stdout."""
         pass
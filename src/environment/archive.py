@@ -0,0 +1,408 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import errno
+import io
+import os
+import tarfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, BinaryIO, List, Literal, Optional, Tuple
+
+from util.pgzip import DEFAULT_LEVEL, DEFAULT_THREADS, ParallelGzipWriter
+from util.progress import Progress
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+ARCHIVE_SUFFIX = ".tar.gz"
+
+# Restore: file data is handed to the writers in chunks, and aligned
+# blocks of zeros are left as holes.
+RESTORE_CHUNK_SIZE = 4 * 1024 * 1024
+MAX_INFLIGHT_BYTES = 64 * 1024 * 1024
+HOLE_BLOCK_SIZE = 4096
+# Stream modes archives are read with, compressed or not.
+TarReadMode = Literal["r|", "r|gz"]
+
+
+@dataclass(slots=True, frozen=True)
+class ArchiveStats:
+    bytes_in: int
+    bytes_out: int
+    seconds: float
+
+
+class _CountingWriter(io.RawIOBase):
+    """Forwards writes, reporting their size to a Progress."""
+
+    def __init__(self, target: io.RawIOBase, progress: Optional[Progress]):
+        super().__init__()
+        self.target = target
+        self.progress = progress
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:  # type: ignore[override]
+        written = self.target.write(data)
+        if self.progress is not None:
+            self.progress.update(len(data))
+        return written if written is not None else len(data)
+
+
+def write_tar(
+    src_dir: str,
+    arcname: str,
+    fileobj: io.RawIOBase,
+    progress: Optional[Progress] = None,
+) -> None:
+    """
+    Streams a tar of a directory into a writable file object.
+    """
+    with tarfile.open(
+        fileobj=_CountingWriter(fileobj, progress),
+        mode="w|",
+        format=tarfile.PAX_FORMAT,
+    ) as tar:
+        tar.add(src_dir, arcname=arcname)
+
+
+def write_archive(
+    src_dir: str,
+    arcname: str,
+    archive_path: str,
+    level: int = DEFAULT_LEVEL,
+    threads: int = DEFAULT_THREADS,
+    progress: Optional[Progress] = None,
+) -> ArchiveStats:
+    """
+    Archives a directory as a tar.gz, streaming the tar straight into
+    a block-parallel gzip compressor; no uncompressed tarball is ever
+    written. The archive appears at `archive_path` only once complete.
+
+    :param src_dir: The directory to archive.
+    :param arcname: Its name inside the archive.
+    :param archive_path: The archive to write.
+    :param level: The compression level.
+    :param threads: The number of compression threads.
+    :param progress: Optional progress, fed with uncompressed bytes.
+    :return: The archive statistics.
+    """
+    start = time.monotonic()
+    tmp_path = archive_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            gz = ParallelGzipWriter(f, level=level, threads=threads)
+            try:
+                write_tar(src_dir, arcname, gz, progress)
+                gz.close()
+            finally:
+                gz.abort()
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, archive_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return ArchiveStats(
+        bytes_in=gz.bytes_in,
+        bytes_out=gz.bytes_out,
+        seconds=time.monotonic() - start,
+    )
+
+
+def zero_runs(data: bytes, block_size: int) -> List[Tuple[int, int]]:
+    """
+    Splits a buffer into the (offset, length) runs holding data,
+    leaving out whole blocks of zeros.
+    """
+    runs: List[Tuple[int, int]] = []
+    zero = bytes(block_size)
+    start = -1
+    for offset in range(0, len(data), block_size):
+        block = data[offset : offset + block_size]
+        if block == zero[: len(block)]:
+            if start >= 0:
+                runs.append((start, offset - start))
+                start = -1
+        elif start < 0:
+            start = offset
+    if start >= 0:
+        runs.append((start, len(data) - start))
+    return runs
+
+
+class _ChunkWriter:
+    """
+    Writes file chunks on a pool of threads, with at most
+    `max_inflight` bytes waiting to be written.
+    """
+
+    def __init__(self, threads: int, max_inflight: int, chunk_size: int):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.pool = ThreadPoolExecutor(max_workers=max(1, threads))
+        self.slots = threading.BoundedSemaphore(
+            max(1, max_inflight // chunk_size)
+        )
+        self.futures: List["Future[None]"] = []
+
+    def submit(
+        self, path: str, offset: int, data: bytes, sparse: bool = True
+    ) -> None:
+        """
+        Queues a write; unless `sparse` is unset, blocks of zeros are
+        skipped, as they read back as zeros from a fresh file anyway.
+        """
+        self.slots.acquire()
+        try:
+            future = self.pool.submit(self.write, path, offset, data, sparse)
+        except BaseException:
+            self.slots.release()
+            raise
+        self.futures.append(future)
+        if len(self.futures) > 1024:
+            self.reap()
+
+    def write(self, path: str, offset: int, data: bytes, sparse: bool) -> None:
+        try:
+            fd = os.open(path, os.O_WRONLY)
+            try:
+                view = memoryview(data)
+                runs = (
+                    zero_runs(data, HOLE_BLOCK_SIZE)
+                    if sparse
+                    else [(0, len(data))]
+                )
+                for start, length in runs:
+                    pos = 0
+                    while pos < length:
+                        pos += os.pwrite(
+                            fd,
+                            view[start + pos : start + length],
+                            offset + start + pos,
+                        )
+            finally:
+                os.close(fd)
+        finally:
+            self.slots.release()
+
+    def reap(self) -> None:
+        """Raises the first error of the writes done so far."""
+        remaining: List["Future[None]"] = []
+        for future in self.futures:
+            if future.done():
+                future.result()
+            else:
+                remaining.append(future)
+        self.futures = remaining
+
+    def close(self) -> None:
+        """Waits for all writes, raising the first error."""
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+
+def member_path(root: str, arcname: str, name: str) -> str:
+    """
+    Maps an archive member to its path under `root`.
+
+    :raises ValueError: If the member is outside of `arcname`.
+    """
+    parts = name.rstrip("/").split("/")
+    if parts[0] != arcname or any(p in ("..", "") for p in parts[1:]):
+        raise ValueError(f"Unexpected archive member '{name}'.")
+    return os.path.join(root, *parts[1:])
+
+
+def check_inside(root: str, path: str) -> None:
+    """
+    :raises ValueError: If `path` resolves outside of `root`, as when
+                        a restored symlink leads elsewhere.
+    """
+    real_root = os.path.realpath(root)
+    real_path = os.path.realpath(path)
+    if real_path != real_root and not real_path.startswith(real_root + os.sep):
+        raise ValueError(f"Archive member path escapes '{root}': '{path}'.")
+
+
+def check_symlink(root: str, path: str, target: str) -> None:
+    """
+    :raises ValueError: If a symlink at `path` to `target` is absolute
+                        or resolves outside of `root`.
+    """
+    if os.path.isabs(target):
+        raise ValueError(f"Archive symlink '{path}' is absolute: '{target}'.")
+    check_inside(root, os.path.join(os.path.dirname(path), target))
+
+
+def extract_archive(
+    archive_path: str,
+    arcname: str,
+    dst_dir: str,
+    threads: int = DEFAULT_THREADS,
+    max_inflight: int = MAX_INFLIGHT_BYTES,
+    progress: Optional[Progress] = None,
+    base_dir: Optional[str] = None,
+) -> int:
+    """
+    Restores a tar.gz written by `write_archive`, or by
+    `write_delta_archive`, into `dst_dir`, which must not exist; see
+    `extract_tar`.
+
+    :param archive_path: The archive.
+    :param arcname: The name of the archived directory.
+    :param dst_dir: The directory to restore it to.
+    :param threads: The number of writer threads.
+    :param max_inflight: Bytes decoded but not yet written, at most.
+    :param progress: Optional progress, fed with restored bytes.
+    :param base_dir: The baseline of a delta archive.
+    :return: The number of bytes restored.
+    """
+    with open(archive_path, "rb") as f:
+        return extract_tar(
+            f,
+            "r|gz",
+            arcname,
+            dst_dir,
+            threads,
+            max_inflight,
+            progress,
+            base_dir,
+        )
+
+
+def extract_tar(
+    fileobj: BinaryIO,
+    mode: TarReadMode,
+    arcname: str,
+    dst_dir: str,
+    threads: int = DEFAULT_THREADS,
+    max_inflight: int = MAX_INFLIGHT_BYTES,
+    progress: Optional[Progress] = None,
+    base_dir: Optional[str] = None,
+) -> int:
+    """
+    Restores a tar stream into `dst_dir`, which must not exist.
+    Decoding streams straight into extraction: the decoder reads file
+    data in chunks and hands them to a pool of writer threads, with a
+    bounded amount of data in flight. Blocks of zeros are not written,
+    so sparse data files stay sparse.
+
+    :param fileobj: The stream.
+    :param mode: The tarfile stream mode, "r|gz" or "r|".
+    :param base_dir: The baseline files stored as deltas apply to.
+    :return: The number of bytes restored.
+    """
+    if os.path.lexists(dst_dir):
+        raise FileExistsError(errno.EEXIST, "Destination exists", dst_dir)
+
+    from .delta import DELTA_HEADER, extract_delta_file
+
+    restored = 0
+    deferred: List[Tuple[str, tarfile.TarInfo]] = []
+    writer = _ChunkWriter(threads, max_inflight, RESTORE_CHUNK_SIZE)
+    try:
+        with tarfile.open(fileobj=fileobj, mode=mode) as tar:
+            for member in tar:
+                path = member_path(dst_dir, arcname, member.name)
+                if path != dst_dir:
+                    check_inside(dst_dir, os.path.dirname(path))
+                if member.isdir():
+                    os.makedirs(path, 0o700, exist_ok=True)
+                elif member.isfile() and DELTA_HEADER in member.pax_headers:
+                    if base_dir is None:
+                        raise ValueError(
+                            f"Archive member '{member.name}' is a delta, "
+                            "but no baseline was given."
+                        )
+                    restored += extract_delta_file(
+                        tar,
+                        member,
+                        path,
+                        member_path(base_dir, arcname, member.name),
+                        writer,
+                    )
+                elif member.isfile():
+                    restored += extract_file(tar, member, path, writer)
+                elif member.issym():
+                    check_symlink(dst_dir, path, member.linkname)
+                    os.symlink(member.linkname, path)
+                elif member.islnk():
+                    target = member_path(dst_dir, arcname, member.linkname)
+                    check_inside(dst_dir, target)
+                    os.link(target, path, follow_symlinks=False)
+                else:
+                    # Devices and FIFOs have no place in an environment.
+                    continue
+                deferred.append((path, member))
+                if progress is not None:
+                    progress.update(member.size if member.isfile() else 0)
+    finally:
+        writer.close()
+
+    # Symlinks restored later may have redirected earlier ones.
+    for path, member in deferred:
+        if member.issym():
+            check_symlink(dst_dir, path, member.linkname)
+    # Deepest first, as filling a directory changes its mtime.
+    for path, member in reversed(deferred):
+        restore_metadata(path, member)
+    return restored
+
+
+def extract_file(
+    tar: tarfile.TarFile,
+    member: tarfile.TarInfo,
+    path: str,
+    writer: _ChunkWriter,
+) -> int:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        os.ftruncate(fd, member.size)
+    finally:
+        os.close(fd)
+
+    source = tar.extractfile(member)
+    assert source is not None
+    offset = 0
+    while offset < member.size:
+        data = source.read(min(RESTORE_CHUNK_SIZE, member.size - offset))
+        if not data:
+            raise ValueError(f"Truncated archive member '{member.name}'.")
+        writer.submit(path, offset, data)
+        offset += len(data)
+    return offset
+
+
+def restore_metadata(path: str, member: tarfile.TarInfo) -> None:
+    if os.geteuid() == 0:
+        os.lchown(path, member.uid, member.gid)
+    if not member.issym():
+        os.chmod(path, member.mode)
+        os.utime(path, (member.mtime, member.mtime))
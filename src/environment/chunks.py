@@ -0,0 +1,391 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import fcntl
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Deque, Iterator, List, Optional, Tuple
+
+from config.shards import write_json_atomic
+from util.progress import Progress
+
+from .archive import write_tar
+
+# Content-defined chunking: a chunk ends right after an anchor, a byte
+# pair occurring once every 32 KiB of random data on average, found by
+# the regex engine at C speed. Cut points thus move along with the
+# content when bytes are inserted or removed, and the following chunks
+# keep their hashes.
+ANCHOR = re.compile(rb"\x9e[\x00\x01]")
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 256 * 1024
+
+CHUNKS_DIR = "chunks"
+OBJECTS_DIR = "objects"
+MANIFESTS_DIR = "manifests"
+INDEX_DB = "index.db"
+LOCK_FILE = "lock"
+MANIFEST_FORMAT_VERSION = 1
+DEFAULT_LEVEL = 6
+DEFAULT_THREADS = os.cpu_count() or 1
+
+Manifest = List[Tuple[str, int]]
+
+
+@dataclass(slots=True, frozen=True)
+class ChunkStats:
+    bytes_in: int
+    bytes_new: int
+    chunks: int
+    chunks_new: int
+    seconds: float
+
+
+def cut_point(data: bytes, start: int, final: bool) -> int:
+    """
+    Finds where the chunk starting at `start` ends.
+
+    :return: The end offset, or -1 if more data is needed to tell.
+    """
+    match = ANCHOR.search(
+        data, start + MIN_CHUNK_SIZE - 2, start + MAX_CHUNK_SIZE
+    )
+    if match is not None:
+        return match.end()
+    if len(data) - start >= MAX_CHUNK_SIZE:
+        return start + MAX_CHUNK_SIZE
+    return len(data) if final and len(data) > start else -1
+
+
+def split_chunks(data: bytes) -> List[bytes]:
+    """Splits a buffer into content-defined chunks."""
+    chunks: List[bytes] = []
+    start = 0
+    while (end := cut_point(data, start, final=True)) > 0:
+        chunks.append(data[start:end])
+        start = end
+    return chunks
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Writable stream cutting its input into chunks and storing them.
+    """
+
+    def __init__(self, store: "ChunkStore", progress: Optional[Progress]):
+        super().__init__()
+        self.store = store
+        self.progress = progress
+        self.buffer = bytearray()
+        self.manifest: Manifest = []
+        self.pending: Deque[Future[int]] = deque()
+        self.bytes_in = 0
+        self.bytes_new = 0
+        self.chunks_new = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:  # type: ignore[override]
+        self.buffer += data
+        self.bytes_in += len(data)
+        if self.progress is not None:
+            self.progress.update(len(data))
+        if len(self.buffer) >= 4 * MAX_CHUNK_SIZE:
+            self.cut(final=False)
+        return len(data)
+
+    def cut(self, final: bool) -> None:
+        data = bytes(self.buffer)
+        start = 0
+        while (end := cut_point(data, start, final)) > 0:
+            self.add(data[start:end])
+            start = end
+        del self.buffer[:start]
+
+    def add(self, chunk: bytes) -> None:
+        digest = hashlib.sha256(chunk).hexdigest()
+        self.manifest.append((digest, len(chunk)))
+        self.pending.append(
+            self.store.pool.submit(self.store.put, digest, chunk)
+        )
+        while len(self.pending) > 4 * self.store.threads:
+            self.reap(self.pending.popleft())
+
+    def reap(self, future: "Future[int]") -> None:
+        stored = future.result()
+        if stored:
+            self.bytes_new += stored
+            self.chunks_new += 1
+
+    def finish(self) -> Manifest:
+        self.cut(final=True)
+        while self.pending:
+            self.reap(self.pending.popleft())
+        return self.manifest
+
+
+class _ChunkReader(io.RawIOBase):
+    """
+    Readable stream concatenating the chunks of a manifest, loading
+    and verifying a few chunks ahead on a pool of threads.
+    """
+
+    def __init__(self, store: "ChunkStore", manifest: Manifest):
+        super().__init__()
+        self.store = store
+        self.manifest = iter(manifest)
+        self.ahead: Deque[Future[bytes]] = deque()
+        self.current = memoryview(b"")
+        self.fill()
+
+    def readable(self) -> bool:
+        return True
+
+    def fill(self) -> None:
+        while len(self.ahead) < 4 * self.store.threads:
+            item = next(self.manifest, None)
+            if item is None:
+                return
+            self.ahead.append(self.store.pool.submit(self.store.get, item[0]))
+
+    def readinto(self, b) -> int:  # type: ignore[override]
+        while not self.current:
+            if not self.ahead:
+                return 0
+            self.current = memoryview(self.ahead.popleft().result())
+            self.fill()
+        size = min(len(b), len(self.current))
+        b[:size] = self.current[:size]
+        self.current = self.current[size:]
+        return size
+
+
+class ChunkStore:
+    """
+    Content-addressed store of zlib-compressed chunks under
+    .env_images/chunks, shared by all environments.
+
+    Each archived environment is a manifest listing the chunks of its
+    tar stream. Chunks are reference-counted, by occurrence across
+    manifests, in a SQLite index; chunks no manifest references any
+    longer are removed by `gc`.
+    """
+
+    def __init__(
+        self,
+        images_dir: str,
+        level: int = DEFAULT_LEVEL,
+        threads: int = DEFAULT_THREADS,
+    ):
+        self.root = os.path.join(images_dir, CHUNKS_DIR)
+        self.level = level
+        self.threads = max(1, threads)
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.threads)
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def __enter__(self) -> "ChunkStore":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.root, OBJECTS_DIR, digest[:2], digest)
+
+    def manifest_path(self, tag: str) -> str:
+        return os.path.join(self.root, MANIFESTS_DIR, f"{tag}.json")
+
+    def has_manifest(self, tag: str) -> bool:
+        return os.path.isfile(self.manifest_path(tag))
+
+    def tags(self) -> List[str]:
+        try:
+            names = os.listdir(os.path.join(self.root, MANIFESTS_DIR))
+        except FileNotFoundError:
+            return []
+        return sorted(n[: -len(".json")] for n in names if n.endswith(".json"))
+
+    @contextmanager
+    def locked(self) -> Iterator[sqlite3.Connection]:
+        """
+        Serializes writers of the store and yields its index.
+        """
+        os.makedirs(os.path.join(self.root, MANIFESTS_DIR), exist_ok=True)
+        with open(os.path.join(self.root, LOCK_FILE), "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            db = sqlite3.connect(os.path.join(self.root, INDEX_DB))
+            try:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS chunks ("
+                    "digest TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                    "refs INTEGER NOT NULL)"
+                )
+                yield db
+            finally:
+                db.close()
+
+    def put(self, digest: str, chunk: bytes) -> int:
+        """
+        Stores a chunk unless already there.
+
+        :return: The bytes written, 0 if the chunk was already stored.
+        """
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            return 0
+        data = zlib.compress(chunk, self.level)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return len(data)
+
+    def get(self, digest: str) -> bytes:
+        """
+        Loads a chunk, verifying its content.
+
+        :raises ValueError: If the chunk is corrupted.
+        """
+        with open(self.object_path(digest), "rb") as f:
+            chunk = zlib.decompress(f.read())
+        if hashlib.sha256(chunk).hexdigest() != digest:
+            raise ValueError(f"Corrupted chunk '{digest}'.")
+        return chunk
+
+    def read_manifest(self, tag: str) -> Manifest:
+        with open(self.manifest_path(tag), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return [(digest, size) for digest, size in data["chunks"]]
+
+    def archive(
+        self, src_dir: str, tag: str, progress: Optional[Progress] = None
+    ) -> ChunkStats:
+        """
+        Archives a directory: its tar stream is chunked, new chunks are
+        compressed and stored on a pool of threads, and the manifest
+        replaces any previous one of `tag`.
+
+        :return: The archive statistics.
+        """
+        start = time.monotonic()
+        with self.locked() as db:
+            sink = _ChunkSink(self, progress)
+            write_tar(src_dir, tag, sink, progress=None)
+            manifest = sink.finish()
+            self.commit_manifest(db, tag, manifest)
+        return ChunkStats(
+            bytes_in=sink.bytes_in,
+            bytes_new=sink.bytes_new,
+            chunks=len(manifest),
+            chunks_new=sink.chunks_new,
+            seconds=time.monotonic() - start,
+        )
+
+    def commit_manifest(
+        self, db: sqlite3.Connection, tag: str, manifest: Manifest
+    ) -> None:
+        """
+        Publishes a manifest, moving the references of the previous one
+        of `tag`, if any, to the new one in a single transaction.
+        """
+        refs: Counter[Tuple[str, int]] = Counter(manifest)
+        if self.has_manifest(tag):
+            refs.subtract(Counter(self.read_manifest(tag)))
+        with db:
+            db.executemany(
+                "INSERT INTO chunks (digest, size, refs) VALUES (?, ?, ?) "
+                "ON CONFLICT(digest) DO UPDATE SET refs = refs + excluded.refs",
+                [(digest, size, n) for (digest, size), n in refs.items() if n],
+            )
+            write_json_atomic(
+                self.manifest_path(tag),
+                {"version": MANIFEST_FORMAT_VERSION, "chunks": manifest},
+            )
+
+    def remove_manifest(self, tag: str) -> None:
+        """Drops the manifest of `tag` and its references."""
+        if not self.has_manifest(tag):
+            return
+        with self.locked() as db:
+            if not self.has_manifest(tag):
+                return
+            self.commit_manifest(db, tag, [])
+            os.unlink(self.manifest_path(tag))
+
+    def open(self, tag: str) -> io.BufferedReader:
+        """
+        Opens the tar stream of an archived environment.
+        """
+        return io.BufferedReader(
+            _ChunkReader(self, self.read_manifest(tag)),
+            buffer_size=MAX_CHUNK_SIZE,
+        )
+
+    def gc(self) -> Tuple[int, int]:
+        """
+        Removes the chunks no manifest references, including chunks
+        left behind by an interrupted archive.
+
+        :return: The number of chunks removed and the bytes freed.
+        """
+        removed = freed = 0
+        with self.locked() as db:
+            with db:
+                db.execute("DELETE FROM chunks WHERE refs <= 0")
+            live = {row[0] for row in db.execute("SELECT digest FROM chunks")}
+            objects_dir = os.path.join(self.root, OBJECTS_DIR)
+            for dir_path, _, names in os.walk(objects_dir):
+                for name in names:
+                    if name in live:
+                        continue
+                    path = os.path.join(dir_path, name)
+                    freed += os.path.getsize(path)
+                    os.unlink(path)
+                    removed += 1
+        return removed, freed
@@ -0,0 +1,373 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import os
+import stat
+import tarfile
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from util.fscopy import copy_range, data_segments, reflink
+from util.pgzip import DEFAULT_LEVEL, DEFAULT_THREADS, ParallelGzipWriter
+from util.progress import Progress
+
+from .archive import (
+    ARCHIVE_SUFFIX,
+    RESTORE_CHUNK_SIZE,
+    ArchiveStats,
+    _ChunkWriter,
+)
+
+DELTA_SUFFIX = ".delta.tar.gz"
+
+# Files are stored against the baseline's file of the same path:
+# unchanged ones as a reference only, large ones as their changed
+# blocks, the others in full. The delta is recorded in PAX headers, so
+# the archive remains a well-formed tar.gz. The baseline version a
+# delta applies to is identified by its SHA-256.
+DELTA_HEADER = "SHPD.delta"
+BASE_HEADER = "SHPD.base"
+SIZE_HEADER = "SHPD.size"
+BLOCKS_HEADER = "SHPD.blocks"
+DELTA_SAME = "same"
+DELTA_BLOCKS = "blocks"
+
+BLOCK_SIZE = 64 * 1024
+BLOCK_DELTA_MIN_SIZE = 1024 * 1024
+COMPARE_SIZE = 4 * 1024 * 1024
+
+# Ranges of changed blocks, as (first block, block count).
+BlockRanges = List[Tuple[int, int]]
+
+
+def image_tag(name: str) -> str:
+    """Maps an archive file name of .env_images to its environment."""
+    for suffix in (DELTA_SUFFIX, ARCHIVE_SUFFIX):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def fingerprint(st: os.stat_result) -> str:
+    """
+    Tells files a clone of the baseline never wrote, without reading
+    them: cloning preserves modification times.
+    """
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def file_digest(path: str) -> str:
+    """
+    Identifies the version of a baseline file a delta applies to. Its
+    content is hashed, as restoring the baseline from a tar.gz keeps
+    modification times to the microsecond only.
+    """
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def is_base_version(base_path: str, st: os.stat_result, recorded: str) -> bool:
+    """
+    Tells whether a baseline file is the version a delta was made
+    against.
+
+    :param base_path: The baseline file.
+    :param st: Its stat result.
+    :param recorded: The version recorded in the delta.
+    """
+    if ":" in recorded:
+        # Deltas made before digests were recorded.
+        return fingerprint(st) == recorded
+    return file_digest(base_path) == recorded
+
+
+def changed_blocks(path: str, base_path: str, size: int) -> BlockRanges:
+    """
+    Compares a file with its baseline version, block by block.
+
+    :return: The ranges of blocks differing from the baseline.
+    """
+    ranges: BlockRanges = []
+    fd = os.open(path, os.O_RDONLY)
+    base_fd = os.open(base_path, os.O_RDONLY)
+    try:
+        for offset in range(0, size, COMPARE_SIZE):
+            data = os.pread(fd, COMPARE_SIZE, offset)
+            base = os.pread(base_fd, len(data), offset)
+            if data == base:
+                continue
+            for start in range(0, len(data), BLOCK_SIZE):
+                end = start + BLOCK_SIZE
+                if data[start:end] == base[start:end]:
+                    continue
+                block = (offset + start) // BLOCK_SIZE
+                if ranges and sum(ranges[-1]) == block:
+                    ranges[-1] = (ranges[-1][0], ranges[-1][1] + 1)
+                else:
+                    ranges.append((block, 1))
+    finally:
+        os.close(base_fd)
+        os.close(fd)
+    return ranges
+
+
+def format_ranges(ranges: BlockRanges) -> str:
+    return ",".join(f"{first}+{count}" for first, count in ranges)
+
+
+def parse_ranges(text: str) -> BlockRanges:
+    ranges: BlockRanges = []
+    for item in filter(None, text.split(",")):
+        first, count = item.split("+")
+        ranges.append((int(first), int(count)))
+    return ranges
+
+
+def block_spans(ranges: BlockRanges, size: int) -> List[Tuple[int, int]]:
+    """Maps block ranges to the (offset, length) spans of a file."""
+    spans = []
+    for first, count in ranges:
+        offset = first * BLOCK_SIZE
+        spans.append((offset, min(count * BLOCK_SIZE, size - offset)))
+    return spans
+
+
+class _SpansReader:
+    """Reads the given spans of a file as one stream."""
+
+    def __init__(self, fd: int, spans: List[Tuple[int, int]]):
+        self.fd = fd
+        self.spans = spans
+
+    def read(self, size: int = -1) -> bytes:
+        while self.spans and self.spans[0][1] == 0:
+            self.spans.pop(0)
+        if not self.spans:
+            return b""
+        offset, length = self.spans[0]
+        if size < 0 or size > length:
+            size = length
+        data = os.pread(self.fd, size, offset)
+        if not data:
+            raise ValueError("File truncated while archiving.")
+        self.spans[0] = (offset + len(data), length - len(data))
+        return data
+
+
+def add_file(
+    tar: tarfile.TarFile,
+    info: tarfile.TarInfo,
+    path: str,
+    base_path: str,
+) -> int:
+    """
+    Adds a regular file, as a delta against `base_path` if worth it.
+
+    :return: The number of data bytes stored.
+    """
+    try:
+        base_st = os.stat(base_path)
+    except FileNotFoundError:
+        base_st = None
+    if base_st is not None and stat.S_ISREG(base_st.st_mode):
+        st = os.stat(path)
+        if fingerprint(st) == fingerprint(base_st):
+            info.pax_headers = {
+                DELTA_HEADER: DELTA_SAME,
+                BASE_HEADER: file_digest(base_path),
+            }
+            info.size = 0
+            tar.addfile(info)
+            return 0
+        if st.st_size >= BLOCK_DELTA_MIN_SIZE:
+            ranges = changed_blocks(path, base_path, st.st_size)
+            spans = block_spans(ranges, st.st_size)
+            stored = sum(length for _, length in spans)
+            if stored < st.st_size // 2:
+                info.pax_headers = {
+                    DELTA_HEADER: DELTA_BLOCKS,
+                    BASE_HEADER: file_digest(base_path),
+                    SIZE_HEADER: str(st.st_size),
+                    BLOCKS_HEADER: format_ranges(ranges),
+                }
+                info.size = stored
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    tar.addfile(info, _SpansReader(fd, spans))
+                finally:
+                    os.close(fd)
+                return stored
+
+    with open(path, "rb") as f:
+        tar.addfile(info, f)
+    return info.size
+
+
+def write_delta_archive(
+    src_dir: str,
+    base_dir: str,
+    arcname: str,
+    archive_path: str,
+    level: int = DEFAULT_LEVEL,
+    threads: int = DEFAULT_THREADS,
+    progress: Optional[Progress] = None,
+) -> ArchiveStats:
+    """
+    Archives a directory as a tar.gz delta against a baseline
+    directory; see `add_file`. Directories, links and metadata are
+    stored in full, so the archive lists the whole tree.
+
+    :param src_dir: The directory to archive.
+    :param base_dir: The baseline it derives from.
+    :param arcname: Its name inside the archive.
+    :param archive_path: The archive to write.
+    :param level: The compression level.
+    :param threads: The number of compression threads.
+    :param progress: Optional progress, fed with file bytes scanned.
+    :return: The archive statistics.
+    """
+    start = time.monotonic()
+    scanned = 0
+    tmp_path = archive_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            gz = ParallelGzipWriter(f, level=level, threads=threads)
+            try:
+                with tarfile.open(
+                    fileobj=gz, mode="w|", format=tarfile.PAX_FORMAT
+                ) as tar:
+                    for rel in walk_tree(src_dir):
+                        path = os.path.join(src_dir, rel)
+                        name = arcname if rel == "." else f"{arcname}/{rel}"
+                        info = tar.gettarinfo(path, name)
+                        if info is None:
+                            continue
+                        if not info.isfile():
+                            tar.addfile(info)
+                            continue
+                        size = info.size
+                        add_file(tar, info, path, os.path.join(base_dir, rel))
+                        scanned += size
+                        if progress is not None:
+                            progress.update(size)
+                gz.close()
+            finally:
+                gz.abort()
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, archive_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return ArchiveStats(
+        bytes_in=scanned,
+        bytes_out=gz.bytes_out,
+        seconds=time.monotonic() - start,
+    )
+
+
+def walk_tree(root: str) -> Iterator[str]:
+    """
+    Yields the paths under `root`, relative to it, parents first and
+    in a stable order; symlinks to directories are not followed.
+    """
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        rel_dir = os.path.relpath(dir_path, root)
+        yield rel_dir
+        for name in sorted(file_names + dir_names):
+            if name in dir_names and not os.path.islink(
+                os.path.join(dir_path, name)
+            ):
+                continue
+            yield os.path.normpath(os.path.join(rel_dir, name))
+
+
+def clone_file(src_path: str, dst_path: str, size: int) -> None:
+    """
+    Creates `dst_path` as a copy of the first `size` bytes of
+    `src_path`, sharing extents when the filesystem allows it.
+    """
+    src_fd = os.open(src_path, os.O_RDONLY)
+    try:
+        dst_fd = os.open(dst_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            src_size = os.fstat(src_fd).st_size
+            if not reflink(src_fd, dst_fd):
+                for offset, length in data_segments(src_fd, src_size):
+                    copy_range(src_fd, dst_fd, offset, length)
+            os.ftruncate(dst_fd, size)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+
+def extract_delta_file(
+    tar: tarfile.TarFile,
+    member: tarfile.TarInfo,
+    path: str,
+    base_path: str,
+    writer: _ChunkWriter,
+) -> int:
+    """
+    Rebuilds a file stored as a delta: a clone of its baseline version
+    with the changed blocks written over.
+
+    :raises ValueError: If the baseline file is not the one the delta
+                        was made against.
+    :return: The size of the rebuilt file.
+    """
+    try:
+        base_st: Optional[os.stat_result] = os.stat(base_path)
+    except FileNotFoundError:
+        base_st = None
+    recorded = member.pax_headers.get(BASE_HEADER, "")
+    if base_st is None or not is_base_version(base_path, base_st, recorded):
+        raise ValueError(
+            f"Baseline file '{base_path}' differs from the one "
+            f"'{member.name}' was archived against."
+        )
+
+    kind = member.pax_headers.get(DELTA_HEADER)
+    if kind == DELTA_SAME:
+        clone_file(base_path, path, base_st.st_size)
+        return base_st.st_size
+    if kind != DELTA_BLOCKS:
+        raise ValueError(f"Unknown delta '{kind}' of '{member.name}'.")
+
+    size = int(member.pax_headers[SIZE_HEADER])
+    clone_file(base_path, path, size)
+    source = tar.extractfile(member)
+    assert source is not None
+    spans = block_spans(parse_ranges(member.pax_headers[BLOCKS_HEADER]), size)
+    for offset, length in spans:
+        end = offset + length
+        while offset < end:
+            data = source.read(min(RESTORE_CHUNK_SIZE, end - offset))
+            if not data:
+                raise ValueError(f"Truncated archive member '{member.name}'.")
+            writer.submit(path, offset, data, sparse=False)
+            offset += len(data)
+    return size
@@ -20,40 +20,682 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
+import sys
+from functools import cached_property
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import Config, EffectiveEnvironment, shard_config
+from config.shards import check_tag
+from config.state import (
+    OP_ARCHIVE,
+    OP_CHECKOUT,
+    OP_NOACTIVE,
+    OP_RESTORE,
+    EnvState,
+    StateJournal,
+)
+from database import Database
+from service import Service
+from util import human_size
+from util.container import (
+    ENV_LABEL,
+    NODE_LABEL,
+    SPEC_HASH_LABEL,
+    ContainerEngine,
+    ContainerInfo,
+    container_labels,
+)
+
+from .kept import set_kept
+from .scheduler import (
+    DB_NODE,
+    DagScheduler,
+    Graph,
+    NodeTiming,
+    build_start_graph,
+    reverse_graph,
+    subgraph,
+)
+from .sizes import SizeIndex
+
+# Archived environment images, under envs_dir.
+ENV_IMAGES_DIR = ".env_images"
+# Symlink to the active environment, the path its containers mount;
+# dot-prefixed so that no environment tag can name it.
+CURRENT_LINK = ".current"
+
+GiB = 1024**3
+
 
 class Environment:
+    def __init__(self, config: Config, journal: StateJournal):
+        self.config = config
+        self.journal = journal
+
+    @cached_property
+    def database(self) -> Database:
+        return Database(self.config)
+
+    @cached_property
+    def service(self) -> Service:
+        return Service(self.config)
+
+    @cached_property
+    def engine(self) -> ContainerEngine:
+        return ContainerEngine()
+
+    @cached_property
+    def sizes(self) -> SizeIndex:
+        return SizeIndex(self.config.envs_dir)
+
+    def get_active_environment(self) -> EffectiveEnvironment:
+        """
+        Gets the effective view of the active environment.
+
+        :raises ValueError: If no environment is active.
+        """
+        env = self.config.get_active_environment()
+        if env is None:
+            raise ValueError("No active environment.")
+        effective = self.config.get_effective_environment(env.tag)
+        assert effective is not None
+        return effective
+
     def init_environment(self, db_type: str, env_tag: str) -> None:
         """Stub for initializing an environment."""
         pass
 
+    def get_environment_path(self, env_tag: str) -> str:
+        return os.path.join(os.path.expanduser(self.config.envs_dir), env_tag)
+
     def clone_environment(self, src_env_tag: str, dst_env_tag: str) -> None:
-        """Stub for cloning an environment."""
-        pass
+        """
+        Clone an environment's data. Files are reflinked on filesystems
+        supporting it, otherwise copied in parallel, holes included.
+        """
+        if self.config.get_environment(src_env_tag) is None:
+            raise ValueError(f"Environment '{src_env_tag}' does not exist.")
+        check_tag(dst_env_tag)
+        src_path = self.get_environment_path(src_env_tag)
+        if not os.path.isdir(src_path):
+            raise ValueError(f"Environment '{src_env_tag}' has no data.")
+
+        from util.fscopy import copy_tree
+
+        stats = copy_tree(src_path, self.get_environment_path(dst_env_tag))
+        self.sizes.invalidate(dst_env_tag)
+
+        size, unit = human_size(stats.bytes)
+        if stats.reflinked:
+            how = "reflinked"
+        else:
+            rate, rate_unit = human_size(stats.throughput)
+            how = f"{rate} ({rate_unit})/s"
+        print(f"Cloned {src_env_tag} to {dst_env_tag}.")
+        print(
+            f"{stats.files} files, {size} ({unit}) in "
+            f"{stats.seconds:.1f}s, {how}."
+        )
+        if stats.skipped:
+            print(
+                f"Warning: skipped {stats.skipped} device nodes, "
+                "which only root can create.",
+                file=sys.stderr,
+            )
+
+    def shard_environments(self, config_path: str) -> None:
+        """
+        Move the environments defined inline in the config file to the
+        sharded layout, one file per environment under envs_dir.
+
+        :param config_path: The config file.
+        """
+        count = shard_config(config_path, self.config.envs_dir)
+        print(f"Moved {count} environments to the sharded layout.")
 
     def checkout_environment(self, env_tag: str) -> None:
-        """Stub for checking out an environment."""
-        pass
+        """Checkout an environment, making it the only active one."""
+        env = self.config.get_environment(env_tag)
+        if env is None:
+            raise ValueError(f"Environment '{env_tag}' does not exist.")
+        if env.archived:
+            raise ValueError(f"Environment '{env_tag}' is archived.")
+
+        self.journal.append(OP_CHECKOUT, env_tag)
+        EnvState(active_set=True, active=env_tag).apply_to(self.config)
+        self.switch_current(env_tag)
+        print(f"Switched to {env_tag}.")
 
     def set_all_non_active(self) -> None:
-        """Stub for setting all environments as non-active."""
-        pass
+        """Set all environments as non-active."""
+        self.journal.append(OP_NOACTIVE)
+        EnvState(active_set=True).apply_to(self.config)
+        self.switch_current(None)
+
+    def get_current_path(self) -> str:
+        return self.get_environment_path(CURRENT_LINK)
+
+    def switch_current(self, env_tag: Optional[str]) -> None:
+        """
+        Points the `.current` symlink of envs_dir at an environment, or
+        removes it. A new link is renamed over the old one, so the
+        switch is atomic and never copies nor moves any data.
+
+        :raises ValueError: If `.current` exists and is not a symlink.
+        """
+        link_path = self.get_current_path()
+        try:
+            target: Optional[str] = os.readlink(link_path)
+        except FileNotFoundError:
+            target = None
+        except OSError:
+            raise ValueError(f"'{link_path}' is not a symlink.")
+        if target == env_tag:
+            return
+        if env_tag is None:
+            os.unlink(link_path)
+            return
+
+        tmp_path = self.get_environment_path(f"{CURRENT_LINK}.{os.getpid()}")
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        os.makedirs(os.path.dirname(link_path), exist_ok=True)
+        os.symlink(env_tag, tmp_path)
+        os.replace(tmp_path, link_path)
+
+    def set_archived(self, env_tag: str, archived: bool) -> None:
+        """Record an environment as archived or restored."""
+        self.journal.append(OP_ARCHIVE if archived else OP_RESTORE, env_tag)
+        EnvState(archived={env_tag: archived}).apply_to(self.config)
+        self.sizes.invalidate(env_tag, ENV_IMAGES_DIR)
+
+    def get_archive_path(self, env_tag: str) -> str:
+        from .archive import ARCHIVE_SUFFIX
+
+        return os.path.join(
+            self.get_environment_path(ENV_IMAGES_DIR), env_tag + ARCHIVE_SUFFIX
+        )
+
+    def get_delta_path(self, env_tag: str) -> str:
+        from .delta import DELTA_SUFFIX
+
+        return os.path.join(
+            self.get_environment_path(ENV_IMAGES_DIR), env_tag + DELTA_SUFFIX
+        )
+
+    def get_baseline_path(self, env_tag: str) -> str:
+        """
+        Gets the data of the empty environment of an environment's
+        DBMS, the baseline its delta archive is made against.
+
+        :raises ValueError: If there is no such baseline locally.
+        """
+        env = self.config.get_effective_environment(env_tag)
+        base_tag = env.db.empty_env if env is not None else None
+        if not base_tag or base_tag == env_tag:
+            raise ValueError(f"Environment '{env_tag}' has no baseline.")
+        base_path = self.get_environment_path(base_tag)
+        if not os.path.isdir(base_path):
+            raise ValueError(
+                f"Baseline '{base_tag}' of '{env_tag}' has no local data."
+            )
+        return base_path
+
+    def archive_environment(
+        self,
+        env_tag: str,
+        keep: bool = False,
+        level: Optional[int] = None,
+        threads: Optional[int] = None,
+        chunked: bool = False,
+        delta: bool = False,
+    ) -> None:
+        """
+        Archive an environment into .env_images, dropping its live data
+        unless `keep` is set. Any other archive of the environment is
+        removed, so that restore cannot pick up a stale one.
+
+        :param env_tag: The environment's tag.
+        :param keep: Keep the live data.
+        :param level: The gzip compression level.
+        :param threads: The number of compression threads.
+        :param chunked: Archive into the deduplicated chunk store
+                        instead of a tar.gz.
+        :param delta: Archive as a delta against the empty environment
+                      of the environment's DBMS.
+        """
+        import shutil
+
+        from util.progress import Progress
+
+        from .archive import (
+            DEFAULT_LEVEL,
+            DEFAULT_THREADS,
+            ArchiveStats,
+            write_archive,
+        )
+        from .chunks import ChunkStats, ChunkStore
+        from .delta import write_delta_archive
+
+        env = self.config.get_environment(env_tag)
+        if env is None:
+            raise ValueError(f"Environment '{env_tag}' does not exist.")
+        if env.archived:
+            raise ValueError(f"Environment '{env_tag}' is already archived.")
+        if chunked and delta:
+            raise ValueError("Chunked and delta archives are exclusive.")
+        src_path = self.get_environment_path(env_tag)
+        if not os.path.isdir(src_path):
+            raise ValueError(f"Environment '{env_tag}' has no data.")
+        base_path = self.get_baseline_path(env_tag) if delta else None
+
+        archive_path = self.get_archive_path(env_tag)
+        delta_path = self.get_delta_path(env_tag)
+        images_dir = os.path.dirname(archive_path)
+        os.makedirs(images_dir, exist_ok=True)
+        level = level if level is not None else DEFAULT_LEVEL
+        threads = threads or DEFAULT_THREADS
+        progress = Progress(f"Archiving {env_tag}")
+        chunk_stats: Optional[ChunkStats] = None
+        if chunked:
+            with ChunkStore(images_dir, level=level, threads=threads) as store:
+                chunk_stats = store.archive(src_path, env_tag, progress)
+            stats = ArchiveStats(
+                chunk_stats.bytes_in,
+                chunk_stats.bytes_new,
+                chunk_stats.seconds,
+            )
+        elif base_path is not None:
+            stats = write_delta_archive(
+                src_path,
+                base_path,
+                env_tag,
+                delta_path,
+                level=level,
+                threads=threads,
+                progress=progress,
+            )
+        else:
+            stats = write_archive(
+                src_path,
+                env_tag,
+                archive_path,
+                level=level,
+                threads=threads,
+                progress=progress,
+            )
+        progress.finish()
+        if not chunked:
+            ChunkStore(images_dir).remove_manifest(env_tag)
+        written = None if chunked else delta_path if delta else archive_path
+        for path in (archive_path, delta_path):
+            if path != written and os.path.exists(path):
+                os.unlink(path)
+
+        if not keep:
+            shutil.rmtree(src_path)
+        self.set_archived(env_tag, True)
+        set_kept(images_dir, env_tag, None)
+
+        size_in, unit_in = human_size(stats.bytes_in)
+        size_out, unit_out = human_size(stats.bytes_out)
+        rate, rate_unit = human_size(
+            stats.bytes_in / stats.seconds if stats.seconds > 0 else 0
+        )
+        print(f"Archived {env_tag}.")
+        print(
+            f"{size_in} ({unit_in}) -> {size_out} ({unit_out}) in "
+            f"{stats.seconds:.1f}s, {rate} ({rate_unit})/s."
+        )
+        if chunk_stats is not None:
+            print(
+                f"{chunk_stats.chunks_new} new chunks, "
+                f"{chunk_stats.chunks - chunk_stats.chunks_new} shared."
+            )
+
+    def restore_environment(
+        self,
+        env_tag: str,
+        replace: bool = False,
+        threads: Optional[int] = None,
+    ) -> None:
+        """
+        Restore an environment from its archive in .env_images, be it
+        a tar.gz, a chunk store manifest or a delta, which applies to
+        the local data of its baseline. The data is restored aside and
+        moved in place once complete.
+
+        :param env_tag: The environment's tag.
+        :param replace: Replace the environment's data if present.
+        :param threads: The number of writer threads.
+        """
+        from util.progress import Progress
+
+        from .archive import DEFAULT_THREADS, extract_archive, extract_tar
+        from .chunks import ChunkStore
+
+        if self.config.get_environment(env_tag) is None:
+            raise ValueError(f"Environment '{env_tag}' does not exist.")
+        archive_path = self.get_archive_path(env_tag)
+        delta_path = self.get_delta_path(env_tag)
+        threads = threads or DEFAULT_THREADS
+        store = ChunkStore(os.path.dirname(archive_path), threads=threads)
+        chunked = store.has_manifest(env_tag)
+        base_path = None
+        if not chunked and os.path.isfile(delta_path):
+            archive_path = delta_path
+            base_path = self.get_baseline_path(env_tag)
+        elif not chunked and not os.path.isfile(archive_path):
+            raise ValueError(f"Environment '{env_tag}' has no archive.")
+        progress = Progress(f"Restoring {env_tag}")
+
+        def restore(tmp_path: str) -> int:
+            if chunked:
+                with store.open(env_tag) as stream:
+                    return extract_tar(
+                        stream,
+                        "r|",
+                        env_tag,
+                        tmp_path,
+                        threads=threads,
+                        progress=progress,
+                    )
+            return extract_archive(
+                archive_path,
+                env_tag,
+                tmp_path,
+                threads=threads,
+                progress=progress,
+                base_dir=base_path,
+            )
+
+        with store:
+            restored = self.replace_data(env_tag, restore, replace)
+        progress.finish()
+        # The image is the restored environment's own now.
+        set_kept(os.path.dirname(archive_path), env_tag, None)
+
+        size, unit = human_size(restored)
+        rate, rate_unit = human_size(progress.rate)
+        print(f"Restored {env_tag}.")
+        print(
+            f"{size} ({unit}) in {progress.elapsed:.1f}s, "
+            f"{rate} ({rate_unit})/s."
+        )
+
+    def replace_data(
+        self,
+        env_tag: str,
+        restore: Callable[[str], int],
+        replace: bool = False,
+    ) -> int:
+        """
+        Restore the data of an environment aside, with `restore`, and
+        move it in place once complete; the environment is recorded as
+        restored.
+
+        :param env_tag: The environment's tag.
+        :param restore: Restores the data into the directory it is
+                        given, which does not exist, and returns the
+                        number of bytes restored.
+        :param replace: Replace the environment's data if present.
+        :return: The number of bytes restored.
+        """
+        import shutil
+
+        env_path = self.get_environment_path(env_tag)
+        if os.path.lexists(env_path) and not replace:
+            raise ValueError(
+                f"Environment '{env_tag}' already has data; "
+                "use --replace to overwrite it."
+            )
+
+        tmp_path = self.get_environment_path(f".{env_tag}.restore")
+        if os.path.lexists(tmp_path):
+            shutil.rmtree(tmp_path)
+        try:
+            restored = restore(tmp_path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        if os.path.lexists(env_path):
+            old_path = self.get_environment_path(f".{env_tag}.replaced")
+            os.rename(env_path, old_path)
+            os.rename(tmp_path, env_path)
+            shutil.rmtree(old_path)
+        else:
+            os.rename(tmp_path, env_path)
+        self.set_archived(env_tag, False)
+        return restored
 
     def list_environments(self) -> None:
-        """Stub for listing all available environments."""
-        pass
+        """List all available environments."""
+        rows = [
+            (
+                env.tag,
+                "archived" if env.archived else "active" if env.active else "",
+            )
+            for env in self.config.envs
+        ]
+        width = max([len("Environment")] + [len(tag) for tag, _ in rows])
+        print(f"{'Environment':<{width}}  Flags")
+        print(f"{'-' * len('Environment'):<{width}}  -----")
+        for tag, flags in rows:
+            print(f"{tag:<{width}}  {flags}".rstrip())
+        print()
+        print(f"Environments   {len(rows)}")
+
+        roots = {tag: self.get_environment_path(tag) for tag, _ in rows}
+        roots[ENV_IMAGES_DIR] = self.get_environment_path(ENV_IMAGES_DIR)
+        sizes = self.sizes.sizes(roots)
+        archived = sizes.pop(ENV_IMAGES_DIR)
+        live = sum(sizes.values())
+        print(f"Live Size      {format_gib(live)}")
+        print(f"Archived Size  {format_gib(archived)}")
+        print(f"Total Size     {format_gib(live + archived)}")
+        if self.sizes.unreadable:
+            print(
+                f"Warning: {len(self.sizes.unreadable)} directories could "
+                "not be read and were not counted.",
+                file=sys.stderr,
+            )
 
     def start_environment(self) -> None:
-        """Stub for starting an environment."""
-        pass
+        """
+        Start the active environment: the database first, then ingress
+        services, then application services, each node as soon as the
+        ones it depends on are ready.
+        """
+        env = self.get_active_environment()
+        self.sizes.invalidate(env.tag)
+        timings = self.start_nodes(env, build_start_graph(env))
+        self.print_timings(timings)
+        print(f"Started {env.tag} in {total_time(timings):.1f}s.")
 
     def halt_environment(self) -> None:
-        """Stub for halting an environment."""
-        pass
+        """
+        Halt the active environment, in reverse start order.
+        """
+        env = self.get_active_environment()
+        timings = self.halt_nodes(env, build_start_graph(env))
+        self.sizes.invalidate(env.tag)
+        self.print_timings(timings)
+        print(f"Halted {env.tag} in {total_time(timings):.1f}s.")
 
-    def reload_environment(self) -> None:
-        """Stub for reloading an environment."""
-        pass
+    def reload_environment(self, dry_run: bool = False) -> None:
+        """
+        Reload the active environment, recreating only the services
+        whose effective spec no longer matches the spec hash their
+        running container was labelled with.
 
-    def environment_status(self) -> None:
-        """Stub for getting environment status."""
-        pass
+        :param dry_run: Only print what would be done.
+        """
+        env = self.get_active_environment()
+        graph = build_start_graph(env)
+
+        running: Dict[str, List[ContainerInfo]] = {}
+        for container in self.engine.list_containers({ENV_LABEL: env.tag}):
+            node = container.labels.get(NODE_LABEL)
+            if node:
+                running.setdefault(node, []).append(container)
+
+        plan: List[Tuple[str, str]] = []
+        for node in graph:
+            hashes = {
+                c.labels.get(SPEC_HASH_LABEL) for c in running.get(node, [])
+            }
+            if not hashes:
+                plan.append((node, "start"))
+            elif hashes != {self.spec_hash(env, node)}:
+                plan.append((node, "recreate"))
+        stale = sorted(node for node in running if node not in graph)
+        plan += [(node, "remove") for node in stale]
+
+        if not plan:
+            print("Nothing to reload.")
+            return
+
+        width = max([len("Service")] + [len(node) for node, _ in plan])
+        print(f"{'Service':<{width}}  Action")
+        print(f"{'-' * len('Service'):<{width}}  ------")
+        for node, action in plan:
+            print(f"{node:<{width}}  {action}")
+        if dry_run:
+            return
+
+        recreate = [node for node, action in plan if action == "recreate"]
+        self.halt_nodes(env, subgraph(graph, recreate))
+        for node in stale + recreate:
+            for container in running[node]:
+                self.engine.remove_container(container.id)
+        started = [node for node, action in plan if action != "remove"]
+        timings = self.start_nodes(env, subgraph(graph, started))
+        print()
+        print(f"Reloaded {env.tag} in {total_time(timings):.1f}s.")
+
+    def spec_hash(self, env: EffectiveEnvironment, node: str) -> str:
+        if node == DB_NODE:
+            return env.db.spec_hash()
+        return env.services_by_tag[node].spec_hash(env.db)
+
+    def start_nodes(
+        self, env: EffectiveEnvironment, graph: Graph
+    ) -> List[NodeTiming]:
+        # Containers mount the active environment through `.current`;
+        # repair the link should a checkout have been interrupted.
+        self.switch_current(env.tag)
+        data_dir = self.get_current_path()
+
+        def start(node: str) -> None:
+            labels = container_labels(env.tag, node, self.spec_hash(env, node))
+            if node == DB_NODE:
+                self.database.start_dbms_service(labels, data_dir)
+            else:
+                self.service.start_environment_service(
+                    env.tag, env.services_by_tag[node], labels, data_dir
+                )
+
+        def ready(node: str) -> bool:
+            if node == DB_NODE:
+                return self.database.is_dbms_ready()
+            return self.service.is_service_ready(
+                env.tag, env.services_by_tag[node]
+            )
+
+        return DagScheduler(graph, start, ready).run()
+
+    def halt_nodes(
+        self, env: EffectiveEnvironment, graph: Graph
+    ) -> List[NodeTiming]:
+        def halt(node: str) -> None:
+            if node == DB_NODE:
+                self.database.halt_dbms_service()
+            else:
+                self.service.halt_environment_service(
+                    env.tag, env.services_by_tag[node]
+                )
+
+        return DagScheduler(reverse_graph(graph), halt).run()
+
+    def print_timings(self, timings: List[NodeTiming]) -> None:
+        width = max([len("Service")] + [len(t.node) for t in timings])
+        print(f"{'Service':<{width}}  Time")
+        print(f"{'-' * len('Service'):<{width}}  ----")
+        for timing in timings:
+            print(f"{timing.node:<{width}}  {timing.elapsed:.1f}s")
+        print()
+
+    def environment_status(
+        self, all_envs: bool = False, porcelain: bool = False
+    ) -> None:
+        """
+        Print the state of the containers of the active environment, or
+        of every environment not archived, collected with a single
+        container engine query.
+
+        :param all_envs: Report all environments.
+        :param porcelain: Print tab-separated lines with no header:
+                          environment, service, type, state, container;
+                          "-" stands for no container.
+        """
+        if all_envs:
+            envs = [env.tag for env in self.config.envs if not env.archived]
+            labels: Dict[str, Optional[str]] = {ENV_LABEL: None}
+        else:
+            envs = [self.get_active_environment().tag]
+            labels = {ENV_LABEL: envs[0]}
+
+        containers: Dict[Tuple[str, str], ContainerInfo] = {}
+        for container in self.engine.list_containers(labels, all=True):
+            key = (
+                container.labels.get(ENV_LABEL, ""),
+                container.labels.get(NODE_LABEL, ""),
+            )
+            containers[key] = container
+
+        rows: List[Tuple[str, ...]] = []
+        for tag in envs:
+            env = self.config.get_effective_environment(tag)
+            assert env is not None
+            nodes = [(DB_NODE, env.db.type)]
+            nodes += [(svc.tag, svc.type) for svc in env.services]
+            for node, node_type in nodes:
+                container = containers.get((tag, node))
+                rows.append(
+                    (
+                        tag,
+                        node,
+                        node_type,
+                        container.state if container else "-",
+                        container.name if container else "-",
+                    )
+                )
+
+        if porcelain:
+            for row in rows:
+                print("\t".join(row))
+            return
+
+        header = ("Environment", "Service", "Type", "State", "Container")
+        widths = [
+            max([len(name)] + [len(row[i]) for row in rows])
+            for i, name in enumerate(header)
+        ]
+        print("  ".join(f"{n:<{w}}" for n, w in zip(header, widths)).rstrip())
+        print(
+            "  ".join(
+                f"{'-' * len(n):<{w}}" for n, w in zip(header, widths)
+            ).rstrip()
+        )
+        for row in rows:
+            print("  ".join(f"{v:<{w}}" for v, w in zip(row, widths)).rstrip())
+
+
+def total_time(timings: List[NodeTiming]) -> float:
+    return max((t.started + t.elapsed for t in timings), default=0.0)
+
+
+def format_gib(size: int) -> str:
+    return f"{size / GiB:.2f}  (G)" if size else "0  (G)"
@@ -0,0 +1,82 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from config.shards import write_json_atomic
+
+# Images fetched or pulled into .env_images that `sys prune` keeps
+# although their environment is not archived, by environment tag.
+KEPT_INDEX = ".kept.json"
+
+
+def read_kept(images_dir: str) -> Dict[str, str]:
+    """
+    Reads the kept images.
+
+    :param images_dir: The .env_images directory.
+    :return: The image file name of each environment that has one kept.
+    """
+    try:
+        with open(os.path.join(images_dir, KEPT_INDEX), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+@contextmanager
+def _locked(images_dir: str) -> Iterator[None]:
+    fd = os.open(
+        os.path.join(images_dir, KEPT_INDEX + ".lock"),
+        os.O_RDWR | os.O_CREAT,
+        0o644,
+    )
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def set_kept(images_dir: str, env_tag: str, name: Optional[str]) -> None:
+    """
+    Records the image kept for an environment, or drops it.
+
+    :param images_dir: The .env_images directory.
+    :param env_tag: The environment's tag.
+    :param name: The image file name, None to drop the entry.
+    """
+    if name is None and not os.path.isdir(images_dir):
+        return
+    os.makedirs(images_dir, exist_ok=True)
+    with _locked(images_dir):
+        kept = read_kept(images_dir)
+        if name is None:
+            if kept.pop(env_tag, None) is None:
+                return
+        else:
+            kept[env_tag] = name
+        write_json_atomic(os.path.join(images_dir, KEPT_INDEX), kept)
@@ -0,0 +1,223 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+)
+
+from config import EffectiveEnvironment
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+# Node of the database in an environment's graph; the other nodes are
+# the services' tags.
+DB_NODE = "db"
+
+DEFAULT_WORKERS = 4
+DEFAULT_READY_TIMEOUT = 300.0
+MAX_POLL_INTERVAL = 2.0
+
+Graph = Dict[str, Set[str]]
+
+
+@dataclass(slots=True, frozen=True)
+class NodeTiming:
+    node: str
+    started: float
+    elapsed: float
+
+
+def build_start_graph(env: EffectiveEnvironment) -> Graph:
+    """
+    Builds the start order of an environment as a dependency graph:
+    the database comes first, then ingress services, then application
+    services, plus any explicit `depends_on` between services.
+
+    :param env: The effective environment.
+    :return: A map from each node to the nodes it depends on.
+    :raises ValueError: On unknown dependencies or cycles.
+    """
+    ingress = {svc.tag for svc in env.services if svc.ingress}
+    graph: Graph = {DB_NODE: set()}
+    for svc in env.services:
+        if svc.tag == DB_NODE:
+            raise ValueError(f"Service tag '{DB_NODE}' is reserved.")
+        deps = {DB_NODE}
+        if not svc.ingress:
+            deps |= ingress
+        for dep in svc.depends_on:
+            if dep != DB_NODE and dep not in env.services_by_tag:
+                raise ValueError(
+                    f"Service '{svc.tag}' depends on unknown service '{dep}'."
+                )
+            deps.add(dep)
+        deps.discard(svc.tag)
+        graph[svc.tag] = deps
+
+    check_acyclic(graph)
+    return graph
+
+
+def reverse_graph(graph: Graph) -> Graph:
+    """
+    Reverses a dependency graph: each node then waits for the nodes
+    which depended on it, as needed to tear an environment down.
+    """
+    reversed_graph: Graph = {node: set() for node in graph}
+    for node, deps in graph.items():
+        for dep in deps:
+            reversed_graph[dep].add(node)
+    return reversed_graph
+
+
+def subgraph(graph: Graph, nodes: Iterable[str]) -> Graph:
+    """
+    Restricts a graph to `nodes`; dependencies on other nodes are
+    taken as already satisfied.
+    """
+    keep = set(nodes)
+    return {node: graph[node] & keep for node in graph if node in keep}
+
+
+def check_acyclic(graph: Graph) -> None:
+    """
+    :raises ValueError: If the graph has a cycle.
+    """
+    pending = {node: set(deps) for node, deps in graph.items()}
+    while pending:
+        free = [node for node, deps in pending.items() if not deps]
+        if not free:
+            raise ValueError(
+                "Dependency cycle between services: "
+                f"{', '.join(sorted(pending))}."
+            )
+        for node in free:
+            del pending[node]
+        for deps in pending.values():
+            deps.difference_update(free)
+
+
+class DagScheduler:
+    """
+    Runs an action on every node of a dependency graph, starting each
+    node as soon as all of its dependencies are done, on a bounded
+    pool of workers.
+
+    A node is done once its action returned and, if a readiness probe
+    is given, the probe reported it ready. On failure no further node
+    is started; nodes already running are waited for, then the first
+    error is raised.
+    """
+
+    def __init__(
+        self,
+        graph: Graph,
+        action: Callable[[str], None],
+        ready: Optional[Callable[[str], bool]] = None,
+        workers: int = DEFAULT_WORKERS,
+        ready_timeout: float = DEFAULT_READY_TIMEOUT,
+        poll_interval: float = 0.1,
+    ):
+        self.graph = graph
+        self.action = action
+        self.ready = ready
+        self.workers = max(1, workers)
+        self.ready_timeout = ready_timeout
+        self.poll_interval = poll_interval
+
+    def run(self) -> List[NodeTiming]:
+        """
+        Runs the graph.
+
+        :return: The timings of the nodes, in completion order.
+        """
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        pending = {node: set(deps) for node, deps in self.graph.items()}
+        dependents = reverse_graph(self.graph)
+        queue = sorted(node for node, deps in pending.items() if not deps)
+        timings: List[NodeTiming] = []
+        error: Optional[BaseException] = None
+        origin = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            running: Dict["Future[NodeTiming]", str] = {}
+            while queue or running:
+                while queue and error is None:
+                    node = queue.pop(0)
+                    future = pool.submit(self.run_node, node, origin)
+                    running[future] = node
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    try:
+                        timings.append(future.result())
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    for dependent in sorted(dependents[node]):
+                        pending[dependent].discard(node)
+                        if not pending[dependent]:
+                            queue.append(dependent)
+
+        if error is not None:
+            raise error
+        return timings
+
+    def run_node(self, node: str, origin: float) -> NodeTiming:
+        start = time.monotonic()
+        self.action(node)
+        if self.ready is not None:
+            self.wait_ready(node)
+        end = time.monotonic()
+        return NodeTiming(
+            node=node, started=start - origin, elapsed=end - start
+        )
+
+    def wait_ready(self, node: str) -> None:
+        """
+        Polls a node's readiness with a growing interval.
+
+        :raises TimeoutError: If not ready within the timeout.
+        """
+        assert self.ready is not None
+        deadline = time.monotonic() + self.ready_timeout
+        interval = self.poll_interval
+        while not self.ready(node):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(
+                    f"'{node}' not ready after {self.ready_timeout:.0f}s."
+                )
+            time.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
@@ -0,0 +1,210 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import os
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from config.shards import write_json_atomic
+
+# Disk usage of environments, persisted as the usage of each directory
+# (its files only, not its subdirectories) along with the directory's
+# mtime. A directory whose mtime is unchanged has had no entry created,
+# removed or renamed, so only changed directories are rescanned; the
+# commands rewriting files in place invalidate their environment.
+SIZE_INDEX_FILE = ".sizes.json"
+SIZE_INDEX_FORMAT_VERSION = 1
+DEFAULT_WORKERS = min(16, 4 * (os.cpu_count() or 1))
+
+# Directory levels of a tree walked by separate tasks.
+SPLIT_DEPTH = 2
+
+# Per directory, relative to its root: [mtime_ns, bytes, subdirectories].
+DirRecord = List[Any]
+WalkResult = List[Tuple[str, DirRecord]]
+
+
+def scan_dir(path: str) -> Tuple[int, List[str]]:
+    """
+    Sums the disk usage of the files of a directory.
+
+    :return: The bytes used and the names of the subdirectories.
+    """
+    used = 0
+    subdirs: List[str] = []
+    with os.scandir(path) as it:
+        for item in it:
+            try:
+                if item.is_dir(follow_symlinks=False):
+                    subdirs.append(item.name)
+                else:
+                    used += item.stat(follow_symlinks=False).st_blocks * 512
+            except FileNotFoundError:
+                pass
+    return used, subdirs
+
+
+class SizeIndex:
+    """
+    Persistent, incrementally revalidated disk usage of directory
+    trees, keyed by name.
+    """
+
+    def __init__(self, envs_dir: str, workers: int = DEFAULT_WORKERS):
+        self.envs_dir = os.path.expanduser(envs_dir)
+        self.path = os.path.join(self.envs_dir, SIZE_INDEX_FILE)
+        self.workers = workers
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        # Directories the last refresh could not read, left uncounted.
+        self.unreadable: List[str] = []
+
+    @property
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            self._entries = self.load()
+        return self._entries
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != SIZE_INDEX_FORMAT_VERSION:
+            return {}
+        return data["entries"]
+
+    def save(self) -> None:
+        """
+        Persists the index; failures are ignored, it is only a cache.
+        """
+        if not os.path.isdir(self.envs_dir):
+            return
+        try:
+            write_json_atomic(
+                self.path,
+                {
+                    "version": SIZE_INDEX_FORMAT_VERSION,
+                    "entries": self.entries,
+                },
+            )
+        except OSError:
+            pass
+
+    def invalidate(self, *keys: str) -> None:
+        """
+        Drops the given entries, forcing a full rescan on next access.
+        """
+        if any(self.entries.pop(key, None) is not None for key in keys):
+            self.save()
+
+    def sizes(self, roots: Mapping[str, str]) -> Dict[str, int]:
+        """
+        Gets the disk usage of the given trees, revalidating the index.
+
+        Entries of keys not in `roots` are dropped.
+
+        :param roots: Tree paths by key.
+        :return: The bytes used by each tree; 0 if missing. Directories
+                 which cannot be read are not counted, nor indexed, and
+                 are listed in `unreadable`.
+        """
+        results: Dict[str, Dict[str, DirRecord]] = {}
+        if roots:
+            results = self.refresh(roots)
+
+        stale = [key for key in self.entries if key not in roots]
+        for key in stale:
+            del self.entries[key]
+
+        changed = bool(stale)
+        sizes: Dict[str, int] = {}
+        for key, path in roots.items():
+            dirs = results.get(key, {})
+            entry = {"path": path, "dirs": dirs}
+            if self.entries.get(key) != entry:
+                self.entries[key] = entry
+                changed = True
+            sizes[key] = sum(record[1] for record in dirs.values())
+        if changed:
+            self.save()
+        return sizes
+
+    def refresh(
+        self, roots: Mapping[str, str]
+    ) -> Dict[str, Dict[str, DirRecord]]:
+        """
+        Walks the trees on a pool of threads. Every directory costs a
+        stat when unchanged, a rescan otherwise; the first levels of
+        each tree are split into separate tasks, the rest is walked by
+        the task which reached it.
+        """
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        results: Dict[str, Dict[str, DirRecord]] = {key: {} for key in roots}
+        self.unreadable = []
+
+        def check(key: str, rel: str) -> Optional[DirRecord]:
+            path = os.path.join(roots[key], rel)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                entry = self.entries.get(key)
+                if entry is not None and entry.get("path") == roots[key]:
+                    record = entry["dirs"].get(rel)
+                    if record is not None and record[0] == mtime:
+                        return record
+                used, subdirs = scan_dir(path)
+            except (FileNotFoundError, NotADirectoryError):
+                return None
+            except OSError:
+                self.unreadable.append(path)
+                return None
+            return [mtime, used, subdirs]
+
+        def visit(key: str, rel: str) -> Tuple[str, WalkResult, List[str]]:
+            walked: WalkResult = []
+            split: List[str] = []
+            stack = [rel]
+            while stack:
+                current = stack.pop()
+                record = check(key, current)
+                if record is None:
+                    continue
+                walked.append((current, record))
+                for name in record[2]:
+                    sub = os.path.join(current, name) if current else name
+                    if sub.count(os.sep) < SPLIT_DEPTH:
+                        split.append(sub)
+                    else:
+                        stack.append(sub)
+            return key, walked, split
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {pool.submit(visit, key, "") for key in roots}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, walked, split = future.result()
+                    results[key].update(walked)
+                    for sub in split:
+                        pending.add(pool.submit(visit, key, sub))
+        return results
@@ -0,0 +1,133 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import ftplib
+import posixpath
+import re
+from typing import Callable, Optional, Tuple
+
+from config import ShpdRegistry
+
+FTP_PORT = 21
+FTP_TIMEOUT = 60
+
+# Builds an unconnected client; tests substitute a stand-in server.
+FtpFactory = Callable[[], ftplib.FTP]
+
+
+def parse_server(server: str) -> Tuple[str, int]:
+    """Splits `host[:port]`."""
+    host, _, port = server.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return server, FTP_PORT
+
+
+def open_session(
+    registry: ShpdRegistry, factory: FtpFactory = ftplib.FTP
+) -> ftplib.FTP:
+    """
+    Connects and logs in to the registry, in binary mode and in its
+    `ftp_shpd_path`.
+
+    :raises OSError: If the registry is not configured or unreachable.
+    """
+    if not registry.ftp_server:
+        raise OSError("No registry configured.")
+    host, port = parse_server(registry.ftp_server)
+    ftp = factory()
+    try:
+        ftp.connect(host, port, timeout=FTP_TIMEOUT)
+        ftp.login(registry.ftp_user, registry.ftp_psw)
+        ftp.voidcmd("TYPE I")
+        if registry.ftp_shpd_path:
+            ftp.cwd(registry.ftp_shpd_path)
+    except ftplib.all_errors as e:
+        close_session(ftp)
+        raise OSError(f"Unable to open registry session: {e}") from e
+    return ftp
+
+
+def close_session(ftp: ftplib.FTP) -> None:
+    try:
+        ftp.quit()
+    except ftplib.all_errors:
+        ftp.close()
+
+
+def image_path(registry: ShpdRegistry, name: str) -> str:
+    """Path of an image file, relative to `ftp_shpd_path`."""
+    return posixpath.join(registry.ftp_env_imgs_path or ".", name)
+
+
+def ensure_dir(ftp: ftplib.FTP, path: str) -> None:
+    """Creates a directory, and its parents, unless it exists."""
+    current = ""
+    for part in path.split("/"):
+        if not part or part == ".":
+            continue
+        current = posixpath.join(current, part)
+        try:
+            ftp.mkd(current)
+        except ftplib.error_perm:
+            pass
+
+
+def remote_size(ftp: ftplib.FTP, path: str) -> Optional[int]:
+    """Size of a remote file, None if missing."""
+    try:
+        return ftp.size(path)
+    except ftplib.error_perm:
+        return None
+
+
+HASH_REPLY = re.compile(r"^213 \S+ \d+-\d+ ([0-9a-fA-F]+) ")
+
+
+def remote_sha256(ftp: ftplib.FTP, path: str) -> Optional[str]:
+    """
+    Asks the server for the SHA-256 of a file through the HASH
+    extension.
+
+    :return: The digest, None if the server does not support it.
+    """
+    try:
+        ftp.sendcmd("OPTS HASH SHA-256")
+        match = HASH_REPLY.match(ftp.sendcmd(f"HASH {path}"))
+    except ftplib.error_perm:
+        return None
+    return match.group(1).lower() if match else None
+
+
+def remote_mtime(ftp: ftplib.FTP, path: str) -> Optional[str]:
+    """
+    Modification time of a remote file, as the MDTM timestamp.
+
+    :raises FileNotFoundError: If the file does not exist.
+    :return: The timestamp, None if the server does not support MDTM.
+    """
+    try:
+        return ftp.sendcmd(f"MDTM {path}").split(" ", 1)[1].strip()
+    except ftplib.error_perm as e:
+        if str(e).startswith("550"):
+            raise FileNotFoundError(f"'{path}' not found: {e}") from e
+        return None
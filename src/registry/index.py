@@ -0,0 +1,264 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import fnmatch
+import ftplib
+import json
+import os
+import posixpath
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, cast
+
+from config import ShpdRegistry
+from config.shards import write_json_atomic
+
+from .ftp import image_path, remote_mtime, remote_size
+from .transfer import MANIFEST_SUFFIX, get_json, put_json
+
+INDEX_NAME = "index.json"
+# Bump whenever the layout of the index changes.
+INDEX_FORMAT_VERSION = 1
+
+SORT_KEYS = ("env", "size", "pushed")
+
+
+@dataclass(frozen=True)
+class IndexEntry:
+    """An image on the registry, as recorded by the index."""
+
+    env: str
+    file: str
+    size: int
+    sha256: str
+    base: Optional[str]
+    db_type: str
+    pushed: str
+
+    @classmethod
+    def from_manifest(cls, manifest: Dict[str, Any]) -> "IndexEntry":
+        return cls(
+            env=manifest["env"],
+            file=manifest["file"],
+            size=manifest["size"],
+            sha256=manifest["sha256"],
+            base=manifest.get("base"),
+            db_type=manifest.get("db_type", ""),
+            pushed=manifest.get("pushed", ""),
+        )
+
+
+Images = Dict[str, IndexEntry]
+
+
+def index_path(registry: ShpdRegistry) -> str:
+    """Path of the index, relative to `ftp_shpd_path`."""
+    return image_path(registry, INDEX_NAME)
+
+
+def decode_index(data: Any) -> Images:
+    if not isinstance(data, dict):
+        raise OSError("Unsupported registry index; run `reg prune`.")
+    index = cast(Dict[str, Any], data)
+    if index.get("version") != INDEX_FORMAT_VERSION:
+        raise OSError("Unsupported registry index; run `reg prune`.")
+    items: Dict[str, Dict[str, Any]] = index["images"]
+    return {env: IndexEntry(**item) for env, item in items.items()}
+
+
+def encode_index(images: Images) -> Dict[str, Any]:
+    return {
+        "version": INDEX_FORMAT_VERSION,
+        "images": {env: asdict(images[env]) for env in sorted(images)},
+    }
+
+
+def read_index(ftp: ftplib.FTP, registry: ShpdRegistry) -> Images:
+    """Reads the index, empty if the registry has none yet."""
+    try:
+        return decode_index(get_json(ftp, index_path(registry)))
+    except FileNotFoundError:
+        return {}
+
+
+def published_images(ftp: ftplib.FTP, registry: ShpdRegistry) -> List[str]:
+    """
+    Lists the images on the registry: the files published along with
+    their checksum manifest.
+    """
+    try:
+        names = {
+            posixpath.basename(name)
+            for name in ftp.nlst(registry.ftp_env_imgs_path or ".")
+        }
+    except ftplib.error_perm:
+        return []
+    return sorted(name for name in names if name + MANIFEST_SUFFIX in names)
+
+
+def reconcile_index(
+    ftp: ftplib.FTP,
+    registry: ShpdRegistry,
+    images: Images,
+    names: Sequence[str],
+) -> bool:
+    """
+    Brings the index in line with the images on the registry: entries
+    whose image is gone are dropped, images the index misses, as after
+    a concurrent update overwrote it, are added from their manifest.
+
+    :param names: The images on the registry, from `published_images`.
+    :return: Whether the index changed.
+    """
+    listed = set(names)
+    changed = False
+    for env in [env for env, e in images.items() if e.file not in listed]:
+        del images[env]
+        changed = True
+    indexed = {entry.file for entry in images.values()}
+    for name in names:
+        if name in indexed:
+            continue
+        try:
+            entry = IndexEntry.from_manifest(
+                get_json(ftp, image_path(registry, name) + MANIFEST_SUFFIX)
+            )
+        except (FileNotFoundError, ValueError, KeyError):
+            continue
+        current = images.get(entry.env)
+        if current is None or current.pushed < entry.pushed:
+            images[entry.env] = entry
+            changed = True
+    return changed
+
+
+def write_index(
+    ftp: ftplib.FTP, registry: ShpdRegistry, images: Images
+) -> None:
+    """Replaces the index, atomically through a rename."""
+    put_json(ftp, index_path(registry), encode_index(images))
+
+
+def update_index(
+    ftp: ftplib.FTP,
+    registry: ShpdRegistry,
+    update: Callable[[Images], None],
+) -> None:
+    """
+    Applies `update` to the index and writes it back. Concurrent
+    updates are last-writer-wins, but an image publishes its manifest
+    before it is indexed: entries an update lost are rebuilt from the
+    registry listing by the next update or `load_index`.
+    """
+    images = read_index(ftp, registry)
+    reconcile_index(ftp, registry, images, published_images(ftp, registry))
+    update(images)
+    write_index(ftp, registry, images)
+
+
+def load_index(
+    ftp: ftplib.FTP, registry: ShpdRegistry, cache_path: str
+) -> Images:
+    """
+    Reads the index, reconciled with the registry listing, through a
+    local copy: downloaded again only when the modification time or
+    size of the index, or the listed images, changed.
+
+    :param cache_path: Path to the local copy.
+    """
+    path = index_path(registry)
+    source = "/".join(
+        (
+            registry.ftp_server,
+            registry.ftp_shpd_path,
+            registry.ftp_env_imgs_path,
+        )
+    )
+    names = published_images(ftp, registry)
+    try:
+        mtime = remote_mtime(ftp, path)
+    except FileNotFoundError:
+        images: Images = {}
+        reconcile_index(ftp, registry, images, names)
+        return images
+    size = remote_size(ftp, path)
+
+    if mtime is not None:
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if (
+                cached["source"],
+                cached["mtime"],
+                cached["size"],
+                cached["names"],
+            ) == (source, mtime, size, names):
+                return decode_index(cached["index"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    images = read_index(ftp, registry)
+    reconcile_index(ftp, registry, images, names)
+    if mtime is not None:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            write_json_atomic(
+                cache_path,
+                {
+                    "source": source,
+                    "mtime": mtime,
+                    "size": size,
+                    "names": names,
+                    "index": encode_index(images),
+                },
+            )
+        except OSError:
+            pass
+    return images
+
+
+def select_images(
+    images: Images,
+    pattern: Optional[str] = None,
+    db_type: Optional[str] = None,
+    sort: str = "env",
+    reverse: bool = False,
+) -> List[IndexEntry]:
+    """
+    Filters and sorts index entries.
+
+    :param pattern: Shell-style pattern the environment tag matches.
+    :param db_type: DB type the environment has.
+    :param sort: One of SORT_KEYS.
+    :param reverse: Sort in descending order.
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort key '{sort}'.")
+    selected = [
+        entry
+        for entry in images.values()
+        if (pattern is None or fnmatch.fnmatchcase(entry.env, pattern))
+        and (db_type is None or entry.db_type == db_type)
+    ]
+    selected.sort(key=lambda entry: (getattr(entry, sort), entry.env))
+    if reverse:
+        selected.reverse()
+    return selected
@@ -0,0 +1,143 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import atexit
+import ftplib
+import threading
+import time
+from contextlib import contextmanager
+from functools import cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import ShpdRegistry
+
+from .ftp import FtpFactory, close_session, open_session
+
+MAX_PER_SERVER = 8
+# Idle sessions are probed with NOOP before reuse past this many
+# seconds, and closed past MAX_IDLE.
+CHECK_AFTER = 2.0
+MAX_IDLE = 120.0
+
+SessionKey = Tuple[str, str, str, str]
+
+
+class FtpPool:
+    """
+    Pool of authenticated FTP sessions, kept open between operations
+    so that only the first one pays for connecting and logging in.
+    Sessions are keyed by server, credentials and `ftp_shpd_path`, and
+    at most `max_per_server` are handed out at once per server.
+    """
+
+    def __init__(
+        self,
+        factory: FtpFactory = ftplib.FTP,
+        max_per_server: int = MAX_PER_SERVER,
+        check_after: float = CHECK_AFTER,
+        max_idle: float = MAX_IDLE,
+    ):
+        self.factory = factory
+        self.max_per_server = max_per_server
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle: Dict[SessionKey, List[Tuple[ftplib.FTP, float]]] = {}
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+
+    @contextmanager
+    def session(self, registry: ShpdRegistry) -> Iterator[ftplib.FTP]:
+        """
+        Hands out a session, in binary mode and in `ftp_shpd_path`,
+        waiting for a slot of the server if all are taken. It returns
+        to the pool unless an error escaped or it was closed.
+        """
+        key = (
+            registry.ftp_server,
+            registry.ftp_user,
+            registry.ftp_psw,
+            registry.ftp_shpd_path,
+        )
+        with self._lock:
+            slots = self._slots.setdefault(
+                registry.ftp_server,
+                threading.BoundedSemaphore(self.max_per_server),
+            )
+        with slots:
+            ftp = self.take(key) or open_session(registry, self.factory)
+            try:
+                yield ftp
+            except BaseException:
+                ftp.close()
+                raise
+            if ftp.sock is None:
+                # Closed by its user: not reusable.
+                return
+            with self._lock:
+                self._idle.setdefault(key, []).append((ftp, time.monotonic()))
+
+    def take(self, key: SessionKey) -> Optional[ftplib.FTP]:
+        """
+        Takes the most recently used idle session still alive; the
+        sessions idle for too long are closed on the way.
+        """
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                idle = self._idle.get(key, [])
+                expired = [
+                    ftp for ftp, since in idle if now - since > self.max_idle
+                ]
+                idle[:] = [
+                    (ftp, since)
+                    for ftp, since in idle
+                    if now - since <= self.max_idle
+                ]
+                ftp, since = idle.pop() if idle else (None, now)
+            for stale in expired:
+                close_session(stale)
+            if ftp is None or now - since <= self.check_after:
+                return ftp
+            try:
+                ftp.voidcmd("NOOP")
+            except (OSError, EOFError, ftplib.Error):
+                ftp.close()
+                continue
+            return ftp
+
+    def close(self) -> None:
+        """Closes all idle sessions."""
+        with self._lock:
+            idle = [
+                ftp for sessions in self._idle.values() for ftp, _ in sessions
+            ]
+            self._idle.clear()
+        for ftp in idle:
+            close_session(ftp)
+
+
+@cache
+def shared_pool() -> FtpPool:
+    """The pool of the process, shared by every registry operation."""
+    pool = FtpPool()
+    atexit.register(pool.close)
+    return pool
@@ -19,3 +19,424 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+
+import ftplib
+import os
+import sys
+import time
+from typing import TYPE_CHECKING, ContextManager, List, Optional, Tuple
+
+from config import Config
+from environment.archive import ARCHIVE_SUFFIX
+from environment.delta import DELTA_SUFFIX
+from environment.environment import ENV_IMAGES_DIR
+from environment.kept import set_kept
+from environment.sizes import SizeIndex
+from util import human_size
+
+from .ftp import ensure_dir, image_path, remote_size
+from .pool import FtpPool, shared_pool
+
+if TYPE_CHECKING:
+    from environment import Environment
+
+    from .transfer import TransferStats
+
+IMAGE_SUFFIXES = (DELTA_SUFFIX, ARCHIVE_SUFFIX)
+# Local copy of the registry index, in .env_images.
+INDEX_CACHE = ".registry-index.json"
+
+
+class Registry:
+    def __init__(self, config: Config, pool: Optional[FtpPool] = None):
+        self.config = config
+        self.pool = pool if pool is not None else shared_pool()
+
+    def session(self) -> ContextManager[ftplib.FTP]:
+        """Hands out a pooled session of the configured registry."""
+        return self.pool.session(self.config.shpd_registry)
+
+    def connections(self, requested: Optional[int]) -> int:
+        """
+        Number of parallel connections of a transfer, warning when the
+        request exceeds what the pool hands out per server.
+
+        :param requested: The number asked for, by default the
+                          registry's `ftp_connections`.
+        :return: The number of connections to open.
+        """
+        count = requested or self.config.shpd_registry.ftp_connections
+        limit = self.pool.max_per_server
+        if count > limit:
+            print(
+                f"Warning: using {limit} connections, the most opened "
+                f"to a server, instead of {count}.",
+                file=sys.stderr,
+            )
+            return limit
+        return count
+
+    def get_images_path(self) -> str:
+        return os.path.join(
+            os.path.expanduser(self.config.envs_dir), ENV_IMAGES_DIR
+        )
+
+    def find_image(self, env_tag: str) -> Tuple[str, bool]:
+        """
+        Finds the local image of an archived environment.
+
+        :raises ValueError: If there is none that can be pushed.
+        :return: The image path and whether it is a delta.
+        """
+        for suffix in IMAGE_SUFFIXES:
+            path = os.path.join(self.get_images_path(), env_tag + suffix)
+            if os.path.isfile(path):
+                return path, suffix == DELTA_SUFFIX
+        raise ValueError(
+            f"Environment '{env_tag}' has no image; archive it first, "
+            "as a tar.gz or a delta."
+        )
+
+    def push_environment(
+        self, env_tag: str, connections: Optional[int] = None
+    ) -> None:
+        """
+        Push an environment image to the registry, over parallel
+        connections, resuming an interrupted push.
+
+        :param env_tag: The environment's tag.
+        :param connections: The number of connections, by default the
+                            registry's `ftp_connections`.
+        """
+        from util.progress import Progress
+
+        from .index import IndexEntry, update_index
+        from .transfer import Uploader, manifest_path
+
+        env = self.config.get_effective_environment(env_tag)
+        if env is None:
+            raise ValueError(f"Environment '{env_tag}' does not exist.")
+        local_path, delta = self.find_image(env_tag)
+        name = os.path.basename(local_path)
+        registry = self.config.shpd_registry
+        remote_path = image_path(registry, name)
+
+        with self.session() as ftp:
+            ensure_dir(ftp, registry.ftp_env_imgs_path)
+
+        uploader = Uploader(self.session, self.connections(connections))
+        progress = Progress(f"Pushing {env_tag}", os.path.getsize(local_path))
+        stats, manifest = uploader.upload(
+            local_path,
+            remote_path,
+            os.path.join(self.get_images_path(), f".{name}.push"),
+            extra={
+                "env": env_tag,
+                "base": env.db.empty_env if delta else None,
+                "db_type": env.db.type,
+                "pushed": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            },
+            progress=progress,
+        )
+        progress.finish()
+
+        # An environment has one image on the registry too.
+        with self.session() as ftp:
+            for suffix in IMAGE_SUFFIXES:
+                other = image_path(registry, env_tag + suffix)
+                if other == remote_path:
+                    continue
+                for path in (other, manifest_path(other)):
+                    try:
+                        ftp.delete(path)
+                    except ftplib.error_perm:
+                        pass
+            update_index(
+                ftp,
+                registry,
+                lambda images: images.update(
+                    {env_tag: IndexEntry.from_manifest(manifest)}
+                ),
+            )
+
+        size, unit = human_size(stats.size)
+        rate, rate_unit = human_size(stats.throughput)
+        print(f"Pushed {env_tag}.")
+        print(
+            f"{size} ({unit}) in {stats.seconds:.1f}s, "
+            f"{rate} ({rate_unit})/s."
+        )
+
+    def find_remote_image(self, env_tag: str) -> str:
+        """
+        Finds the image of an environment on the registry.
+
+        :raises ValueError: If there is none.
+        :return: Its path, relative to `ftp_shpd_path`.
+        """
+        from .transfer import manifest_path
+
+        registry = self.config.shpd_registry
+        with self.session() as ftp:
+            for suffix in IMAGE_SUFFIXES:
+                path = image_path(registry, env_tag + suffix)
+                if remote_size(ftp, manifest_path(path)) is not None:
+                    return path
+        raise ValueError(f"Environment '{env_tag}' is not on the registry.")
+
+    def fetch_environment(
+        self, env_tag: str, connections: Optional[int] = None
+    ) -> None:
+        """
+        Fetch an environment image from the registry into .env_images,
+        over parallel connections, resuming an interrupted fetch. The
+        image replaces any other local image of the environment.
+
+        :param env_tag: The environment's tag.
+        :param connections: The number of connections, by default the
+                            registry's `ftp_connections`.
+        """
+        from util.progress import Progress
+
+        from .transfer import Downloader
+
+        remote_path = self.find_remote_image(env_tag)
+        name = os.path.basename(remote_path)
+        images_path = self.get_images_path()
+        os.makedirs(images_path, exist_ok=True)
+
+        downloader = Downloader(self.session, self.connections(connections))
+        progress = Progress(f"Fetching {env_tag}")
+        stats, _ = downloader.download(
+            remote_path,
+            os.path.join(images_path, name),
+            os.path.join(images_path, f".{name}.fetch"),
+            progress=progress,
+        )
+        progress.finish()
+
+        self.drop_other_images(env_tag, name)
+        set_kept(images_path, env_tag, name)
+
+        size, unit = human_size(stats.size)
+        rate, rate_unit = human_size(stats.throughput)
+        print(f"Fetched {env_tag}.")
+        print(
+            f"{size} ({unit}) in {stats.seconds:.1f}s, "
+            f"{rate} ({rate_unit})/s."
+        )
+
+    def drop_other_images(self, env_tag: str, name: str) -> None:
+        """
+        Removes the local images of an environment other than `name`,
+        the one just fetched: an environment has one image.
+        """
+        from environment.chunks import ChunkStore
+
+        images_path = self.get_images_path()
+        for suffix in IMAGE_SUFFIXES:
+            other = os.path.join(images_path, env_tag + suffix)
+            if suffix != name[len(env_tag) :] and os.path.exists(other):
+                os.unlink(other)
+        ChunkStore(images_path).remove_manifest(env_tag)
+        SizeIndex(self.config.envs_dir).invalidate(ENV_IMAGES_DIR)
+
+    def pull_environment(
+        self,
+        env_tag: str,
+        environment: "Environment",
+        replace: bool = False,
+        threads: Optional[int] = None,
+        keep_image: bool = False,
+    ) -> None:
+        """
+        Pull an environment from the registry: its image is
+        decompressed and restored while it downloads, without landing
+        in .env_images first unless `keep_image` is set.
+
+        :param env_tag: The environment's tag.
+        :param environment: Restores the environment's data.
+        :param replace: Replace the environment's data if present.
+        :param threads: The number of writer threads.
+        :param keep_image: Keep a copy of the image in .env_images.
+        """
+        from environment.archive import DEFAULT_THREADS, extract_tar
+        from util.progress import Progress
+
+        from .stream import StreamPuller
+        from .transfer import DOWNLOAD_SUFFIX
+
+        if self.config.get_environment(env_tag) is None:
+            raise ValueError(f"Environment '{env_tag}' does not exist.")
+        remote_path = self.find_remote_image(env_tag)
+        name = os.path.basename(remote_path)
+        base_path = None
+        if name.endswith(DELTA_SUFFIX):
+            base_path = environment.get_baseline_path(env_tag)
+        tee_path = None
+        if keep_image:
+            os.makedirs(self.get_images_path(), exist_ok=True)
+            image_path = os.path.join(self.get_images_path(), name)
+            tee_path = image_path + DOWNLOAD_SUFFIX
+
+        puller = StreamPuller(self.session)
+        progress = Progress(f"Pulling {env_tag}")
+        pulled: List["TransferStats"] = []
+
+        def restore(tmp_path: str) -> int:
+            stats, restored = puller.pull(
+                remote_path,
+                lambda stream: extract_tar(
+                    stream,
+                    "r|",
+                    env_tag,
+                    tmp_path,
+                    threads=threads or DEFAULT_THREADS,
+                    base_dir=base_path,
+                ),
+                tee_path,
+                progress,
+            )
+            pulled.append(stats)
+            return restored
+
+        try:
+            restored = environment.replace_data(env_tag, restore, replace)
+        except BaseException:
+            if tee_path is not None and os.path.exists(tee_path):
+                os.unlink(tee_path)
+            raise
+        progress.finish()
+        if tee_path is not None:
+            os.replace(tee_path, image_path)
+            self.drop_other_images(env_tag, name)
+            set_kept(self.get_images_path(), env_tag, name)
+
+        stats = pulled[0]
+        size, unit = human_size(stats.size)
+        rate, rate_unit = human_size(stats.throughput)
+        restored_size, restored_unit = human_size(restored)
+        print(f"Pulled {env_tag}.")
+        print(
+            f"{size} ({unit}) in {stats.seconds:.1f}s, "
+            f"{rate} ({rate_unit})/s; "
+            f"restored {restored_size} ({restored_unit})."
+        )
+
+    def get_index_cache_path(self) -> str:
+        return os.path.join(self.get_images_path(), INDEX_CACHE)
+
+    def list_images(
+        self,
+        pattern: Optional[str] = None,
+        db_type: Optional[str] = None,
+        sort: str = "env",
+        reverse: bool = False,
+        porcelain: bool = False,
+    ) -> None:
+        """
+        List the environment images on the registry, from its index.
+
+        :param pattern: Shell-style pattern the environment tag matches.
+        :param db_type: DB type the environments have.
+        :param sort: Sort by "env", "size" or "pushed".
+        :param reverse: Sort in descending order.
+        :param porcelain: Print tab-separated lines with no header:
+                          environment, image, size in bytes, DB type,
+                          base ("-" for none), push time, SHA-256.
+        """
+        from .index import load_index, select_images
+
+        registry = self.config.shpd_registry
+        with self.session() as ftp:
+            images = load_index(ftp, registry, self.get_index_cache_path())
+        entries = select_images(images, pattern, db_type, sort, reverse)
+
+        if porcelain:
+            for entry in entries:
+                row = (
+                    entry.env,
+                    entry.file,
+                    str(entry.size),
+                    entry.db_type,
+                    entry.base or "-",
+                    entry.pushed,
+                    entry.sha256,
+                )
+                print("\t".join(row))
+            return
+
+        rows: List[Tuple[str, ...]] = []
+        for entry in entries:
+            size, unit = human_size(entry.size)
+            rows.append(
+                (
+                    entry.env,
+                    f"{size} ({unit})",
+                    entry.db_type,
+                    entry.base or "-",
+                    entry.pushed,
+                )
+            )
+        header = ("Environment", "Size", "Type", "Base", "Pushed")
+        widths = [
+            max([len(name)] + [len(row[i]) for row in rows])
+            for i, name in enumerate(header)
+        ]
+        print("  ".join(f"{n:<{w}}" for n, w in zip(header, widths)).rstrip())
+        print(
+            "  ".join(
+                f"{'-' * len(n):<{w}}" for n, w in zip(header, widths)
+            ).rstrip()
+        )
+        for row in rows:
+            print("  ".join(f"{v:<{w}}" for v, w in zip(row, widths)).rstrip())
+        print()
+        size, unit = human_size(sum(entry.size for entry in entries))
+        print(f"Images  {len(entries)}")
+        print(f"Size    {size} ({unit})")
+
+    def prune_registry(self, older_than: Optional[float] = None) -> None:
+        """
+        Rebuild the registry index from the image manifests, removing
+        the images pushed more than `older_than` days ago.
+
+        :param older_than: Age in days, None to keep all images.
+        """
+        from .index import Images, IndexEntry, published_images, write_index
+        from .transfer import MANIFEST_SUFFIX, get_json
+
+        registry = self.config.shpd_registry
+        cutoff = None
+        if older_than is not None:
+            cutoff = time.strftime(
+                "%Y-%m-%dT%H:%M:%SZ",
+                time.gmtime(time.time() - older_than * 86400),
+            )
+
+        images: Images = {}
+        removed = 0
+        with self.session() as ftp:
+            for name in published_images(ftp, registry):
+                if not name.endswith(IMAGE_SUFFIXES):
+                    continue
+                path = image_path(registry, name)
+                try:
+                    entry = IndexEntry.from_manifest(
+                        get_json(ftp, path + MANIFEST_SUFFIX)
+                    )
+                except (FileNotFoundError, ValueError, KeyError):
+                    continue
+                if cutoff is not None and entry.pushed < cutoff:
+                    for stale in (path + MANIFEST_SUFFIX, path):
+                        try:
+                            ftp.delete(stale)
+                        except ftplib.error_perm:
+                            pass
+                    removed += 1
+                    continue
+                images[entry.env] = entry
+            write_index(ftp, registry, images)
+
+        print(f"Removed {removed} images.")
+        print(f"Indexed {len(images)} images.")
@@ -0,0 +1,249 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import io
+import queue
+import threading
+import time
+import zlib
+from typing import Any, BinaryIO, Callable, Optional, Tuple, TypeVar
+
+from util.progress import Progress
+
+from .transfer import (
+    BLOCK_SIZE,
+    SessionFactory,
+    TransferStats,
+    get_json,
+    manifest_path,
+)
+
+# Blocks each queue between two stages holds at most: memory stays
+# bounded by the queues whatever the size of the image.
+QUEUE_BLOCKS = 16
+# How often a blocked stage checks whether the pipeline was cancelled.
+POLL_INTERVAL = 0.1
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+T = TypeVar("T")
+
+
+class _Cancelled(Exception):
+    """Raised in a stage once another stage failed."""
+
+
+class _Pipe:
+    """
+    Bounded queue of blocks between two stages, closed by None or by
+    the exception the producing stage failed with.
+    """
+
+    def __init__(self, cancel: threading.Event, blocks: int):
+        self.cancel = cancel
+        self.queue: "queue.Queue[Any]" = queue.Queue(blocks)
+
+    def put(self, item: Any) -> None:
+        while True:
+            if self.cancel.is_set():
+                raise _Cancelled()
+            try:
+                self.queue.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def get(self) -> Any:
+        while True:
+            if self.cancel.is_set():
+                raise _Cancelled()
+            try:
+                return self.queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+
+
+class _PipeReader(io.RawIOBase):
+    """Readable stream of the blocks of a pipe."""
+
+    def __init__(self, pipe: _Pipe):
+        super().__init__()
+        self.pipe = pipe
+        self.pending = memoryview(b"")
+        self.eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while not self.pending and not self.eof:
+            item = self.pipe.get()
+            if isinstance(item, BaseException):
+                raise item
+            if item is None:
+                self.eof = True
+            else:
+                self.pending = memoryview(item)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def drain(self) -> None:
+        while self.read(BLOCK_SIZE):
+            pass
+
+
+class StreamPuller:
+    """
+    Pulls a gzip image and consumes its decompressed content while it
+    is still downloading. Three stages run concurrently, connected by
+    bounded pipes: the download, on a session of its own, optionally
+    teeing the image to a local file; the decompression; and the
+    consumer, on the calling thread. The image is checked against its
+    checksum manifest once the consumer is done.
+    """
+
+    def __init__(
+        self, session: SessionFactory, queue_blocks: int = QUEUE_BLOCKS
+    ):
+        self.session = session
+        self.queue_blocks = queue_blocks
+
+    def pull(
+        self,
+        remote_path: str,
+        consume: Callable[[BinaryIO], T],
+        tee_path: Optional[str] = None,
+        progress: Optional[Progress] = None,
+    ) -> Tuple[TransferStats, T]:
+        """
+        :param remote_path: The image, relative to `ftp_shpd_path`.
+        :param consume: Reads the decompressed stream; what it returns
+                        is returned. The stream is read to its end
+                        afterwards, if it did not.
+        :param tee_path: Where to write a copy of the image, if any.
+        :param progress: Optional progress, fed with downloaded bytes.
+        :raises OSError: If the image does not match its manifest.
+        :return: The download stats and what `consume` returned.
+        """
+        with self.session() as ftp:
+            manifest = get_json(ftp, manifest_path(remote_path))
+        if progress is not None:
+            progress.total = manifest["size"]
+
+        cancel = threading.Event()
+        compressed = _Pipe(cancel, self.queue_blocks)
+        plain = _Pipe(cancel, self.queue_blocks)
+        digest = hashlib.sha256()
+        received = 0
+        start = time.monotonic()
+
+        def download() -> None:
+            tee: Optional[BinaryIO] = None
+
+            def on_block(block: bytes) -> None:
+                nonlocal received
+                digest.update(block)
+                if tee is not None:
+                    tee.write(block)
+                received += len(block)
+                if progress is not None:
+                    progress.update(len(block))
+                compressed.put(block)
+
+            try:
+                if tee_path is not None:
+                    tee = open(tee_path, "wb")
+                with self.session() as ftp:
+                    ftp.retrbinary(f"RETR {remote_path}", on_block, BLOCK_SIZE)
+                compressed.put(None)
+            except _Cancelled:
+                pass
+            except BaseException as e:
+                forward(compressed, e)
+            finally:
+                if tee is not None:
+                    tee.close()
+
+        def inflate() -> None:
+            try:
+                reader = _PipeReader(compressed)
+                # Gzip members may be concatenated.
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+                while block := reader.read(BLOCK_SIZE):
+                    while block:
+                        if decompressor.eof:
+                            decompressor = zlib.decompressobj(GZIP_WBITS)
+                        # Bounded output: a block of zeros inflates to a
+                        # thousand times its size.
+                        data = decompressor.decompress(block, BLOCK_SIZE)
+                        while data:
+                            plain.put(data)
+                            data = decompressor.decompress(
+                                decompressor.unconsumed_tail, BLOCK_SIZE
+                            )
+                        block = decompressor.unused_data
+                if not decompressor.eof:
+                    raise OSError(f"'{remote_path}' is truncated.")
+                plain.put(None)
+            except _Cancelled:
+                pass
+            except zlib.error as e:
+                forward(plain, OSError(f"'{remote_path}' is corrupt: {e}"))
+            except BaseException as e:
+                forward(plain, e)
+
+        def forward(pipe: _Pipe, error: BaseException) -> None:
+            try:
+                pipe.put(error)
+            except _Cancelled:
+                pass
+
+        stages = [
+            threading.Thread(target=download, daemon=True),
+            threading.Thread(target=inflate, daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+        try:
+            reader = _PipeReader(plain)
+            result = consume(reader)
+            reader.drain()
+        except BaseException:
+            cancel.set()
+            raise
+        finally:
+            for stage in stages:
+                stage.join()
+
+        if received != manifest["size"] or (
+            digest.hexdigest() != manifest["sha256"]
+        ):
+            raise OSError(
+                f"Pulled '{remote_path}' does not match its checksum manifest."
+            )
+        stats = TransferStats(
+            manifest["size"], received, time.monotonic() - start
+        )
+        return stats, result
@@ -0,0 +1,557 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import ftplib
+import hashlib
+import io
+import json
+import os
+import posixpath
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    cast,
+)
+
+from config.shards import write_json_atomic
+from util.progress import Progress
+
+from .ftp import remote_sha256, remote_size
+
+PART_SIZE = 32 * 1024 * 1024
+PART_RETRIES = 2
+BLOCK_SIZE = 256 * 1024
+UPLOAD_SUFFIX = ".upload"
+DOWNLOAD_SUFFIX = ".fetch"
+MANIFEST_SUFFIX = ".json"
+MANIFEST_FORMAT_VERSION = 1
+
+# Hands out an authenticated session, in `ftp_shpd_path`.
+SessionFactory = Callable[[], ContextManager[ftplib.FTP]]
+Part = Tuple[int, int]
+
+
+@dataclass(slots=True, frozen=True)
+class TransferStats:
+    size: int
+    transferred: int
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        return self.transferred / self.seconds if self.seconds > 0 else 0.0
+
+
+def split_parts(size: int, part_size: int) -> List[Part]:
+    """Splits a file into (offset, length) parts; one for empty ones."""
+    return [
+        (offset, min(part_size, size - offset))
+        for offset in range(0, max(size, 1), part_size)
+    ]
+
+
+def sha256_file(path: str, offset: int = 0, length: int = -1) -> str:
+    """SHA-256 of a file, or of a range of it."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while length != 0:
+            data = f.read(BLOCK_SIZE if length < 0 else min(BLOCK_SIZE, length))
+            if not data:
+                break
+            digest.update(data)
+            length -= len(data)
+    return digest.hexdigest()
+
+
+def manifest_path(remote_path: str) -> str:
+    """Remote path of the checksum manifest of an image."""
+    return remote_path + MANIFEST_SUFFIX
+
+
+class _PartReader:
+    """Reads a part of a file for `storbinary`, hashing it."""
+
+    def __init__(
+        self, fd: int, part: Part, report: Callable[[int], None]
+    ) -> None:
+        self.fd = fd
+        self.offset, self.remaining = part
+        self.report = report
+        self.digest = hashlib.sha256()
+
+    def read(self, n: int = -1) -> bytes:
+        size = self.remaining if n < 0 else min(n, self.remaining)
+        data = os.pread(self.fd, size, self.offset)
+        if len(data) < size:
+            raise OSError("File truncated while uploading.")
+        self.offset += len(data)
+        self.remaining -= len(data)
+        self.digest.update(data)
+        self.report(len(data))
+        return data
+
+
+class _PartComplete(Exception):
+    """Stops a download once the part requested is received."""
+
+
+class _PartTransfer:
+    """
+    Transfers the parts of a file over several FTP connections: each
+    connection takes the next part left, retrying it on another
+    session on failure. Completed parts are recorded in a local state
+    file, so an interrupted transfer resumes with the missing ones.
+    """
+
+    def __init__(
+        self,
+        session: SessionFactory,
+        connections: int,
+        part_size: int = PART_SIZE,
+    ):
+        self.session = session
+        self.connections = max(1, connections)
+        self.part_size = part_size
+        self.transferred = 0
+        self.progress: Optional[Progress] = None
+        self._lock = threading.Lock()
+
+    def report(self, amount: int) -> None:
+        with self._lock:
+            self.transferred += amount
+            if self.progress is not None:
+                self.progress.update(amount)
+
+    def load_state(
+        self, state_path: str, key: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Loads the resume state, unless it belongs to another version
+        of the file or to another destination.
+        """
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                loaded: Any = json.load(f)
+        except (OSError, ValueError):
+            loaded = None
+        if isinstance(loaded, dict):
+            state = cast(Dict[str, Any], loaded)
+            if state.get("key") == key:
+                return state
+        return {"key": key, "done": {}}
+
+    def transfer_part(
+        self, transfer: Callable[[ftplib.FTP, int], str], index: int
+    ) -> str:
+        """
+        Transfers a part, retrying it on another session on failure.
+
+        :return: The SHA-256 of the part.
+        :raises OSError: Once the retries are exhausted.
+        """
+        error: Optional[BaseException] = None
+        for _ in range(PART_RETRIES + 1):
+            try:
+                with self.session() as ftp:
+                    return transfer(ftp, index)
+            except (OSError, EOFError, ftplib.Error) as e:
+                error = e
+        raise OSError(f"Unable to transfer part {index}: {error!r}") from error
+
+    def run_parts(
+        self,
+        pool: Any,
+        workers: int,
+        indexes: List[int],
+        transfer: Callable[[ftplib.FTP, int], str],
+        state: Dict[str, Any],
+        state_path: str,
+    ) -> None:
+        """
+        Transfers parts on up to `workers` connections. After a
+        failure, no new part is started; the first error is raised
+        once the running ones are over.
+
+        :param transfer: Transfers a part, returning its SHA-256.
+        """
+        queue: Iterator[int] = iter(indexes)
+        failed = threading.Event()
+
+        def next_part() -> Optional[int]:
+            with self._lock:
+                return None if failed.is_set() else next(queue, None)
+
+        def worker() -> None:
+            try:
+                while (index := next_part()) is not None:
+                    sha256 = self.transfer_part(transfer, index)
+                    with self._lock:
+                        state["done"][str(index)] = sha256
+                        write_json_atomic(state_path, state)
+            except BaseException:
+                failed.set()
+                raise
+
+        futures = [
+            pool.submit(worker) for _ in range(min(workers, len(indexes)))
+        ]
+        for future in futures:
+            future.exception()
+        for future in futures:
+            future.result()
+
+
+class Uploader(_PartTransfer):
+    """
+    Uploads a file over several FTP connections. Each part is stored
+    at its offset of the remote file through REST + STOR, so parts
+    land in place, in any order. Once the remote size and, where the
+    server supports HASH, the digest are verified, a checksum manifest
+    is published next to the file and the file renamed in place.
+    Without HASH a part corrupted in transit goes unnoticed until the
+    image is fetched, which checks every part: a warning says so.
+    """
+
+    def upload(
+        self,
+        local_path: str,
+        remote_path: str,
+        state_path: str,
+        extra: Optional[Dict[str, Any]] = None,
+        progress: Optional[Progress] = None,
+    ) -> Tuple[TransferStats, Dict[str, Any]]:
+        """
+        :param local_path: The file to upload.
+        :param remote_path: Its path on the server.
+        :param state_path: The local resume state.
+        :param extra: Fields added to the manifest.
+        :param progress: Optional progress, fed with bytes sent.
+        :return: The transfer statistics and the manifest.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        start = time.monotonic()
+        st = os.stat(local_path)
+        parts = split_parts(st.st_size, self.part_size)
+        key = {
+            "remote": remote_path,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "part_size": self.part_size,
+        }
+        state = self.load_state(state_path, key)
+        done: Dict[str, str] = state["done"]
+        self.transferred = 0
+        self.progress = progress
+        if progress is not None:
+            progress.update(sum(parts[int(i)][1] for i in done))
+
+        tmp_path = remote_path + UPLOAD_SUFFIX
+        fd = os.open(local_path, os.O_RDONLY)
+
+        def put(ftp: ftplib.FTP, index: int) -> str:
+            return self.put_part(ftp, fd, tmp_path, parts[index])
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.connections + 1) as pool:
+                digest = pool.submit(sha256_file, local_path)
+                pending = [i for i in range(len(parts)) if str(i) not in done]
+                # Servers may truncate the file on a STOR at offset 0: the
+                # first part goes alone, before any other.
+                if pending and pending[0] == 0:
+                    self.run_parts(pool, 1, [0], put, state, state_path)
+                    pending = pending[1:]
+                self.run_parts(
+                    pool, self.connections, pending, put, state, state_path
+                )
+                sha256 = digest.result()
+        finally:
+            os.close(fd)
+
+        manifest = {
+            "version": MANIFEST_FORMAT_VERSION,
+            "file": posixpath.basename(remote_path),
+            "size": st.st_size,
+            "sha256": sha256,
+            "part_size": self.part_size,
+            "parts": [done[str(i)] for i in range(len(parts))],
+            **(extra or {}),
+        }
+        with self.session() as ftp:
+            self.verify(ftp, tmp_path, manifest, state_path)
+            put_json(ftp, manifest_path(remote_path), manifest)
+            ftp.rename(tmp_path, remote_path)
+        drop_state(state_path)
+        return (
+            TransferStats(
+                size=st.st_size,
+                transferred=self.transferred,
+                seconds=time.monotonic() - start,
+            ),
+            manifest,
+        )
+
+    def put_part(
+        self, ftp: ftplib.FTP, fd: int, tmp_path: str, part: Part
+    ) -> str:
+        """
+        Stores a part at its offset of the remote file.
+
+        :return: The SHA-256 of the part.
+        """
+        reader = _PartReader(fd, part, self.report)
+        try:
+            ftp.storbinary(
+                f"STOR {tmp_path}", reader, BLOCK_SIZE, rest=part[0] or None
+            )
+        except BaseException:
+            # Sent again on retry.
+            self.report(-(reader.offset - part[0]))
+            raise
+        return reader.digest.hexdigest()
+
+    def verify(
+        self,
+        ftp: ftplib.FTP,
+        tmp_path: str,
+        manifest: Dict[str, Any],
+        state_path: str,
+    ) -> None:
+        """
+        Checks the uploaded file against the manifest. On a mismatch
+        the resume state is dropped, so the next upload starts over.
+
+        :raises OSError: If the uploaded file differs.
+        """
+        size = remote_size(ftp, tmp_path)
+        sha256 = remote_sha256(ftp, tmp_path)
+        if size != manifest["size"] or sha256 not in (None, manifest["sha256"]):
+            drop_state(state_path)
+            raise OSError(
+                f"Uploaded '{manifest['file']}' does not match its "
+                f"checksum manifest (size {size}, expected "
+                f"{manifest['size']}); push it again."
+            )
+        if sha256 is None:
+            print(
+                f"Warning: the registry does not support HASH, so "
+                f"'{manifest['file']}' was checked by size only; fetching "
+                "it verifies every part against the manifest.",
+                file=sys.stderr,
+            )
+
+
+class Downloader(_PartTransfer):
+    """
+    Downloads a file published with a checksum manifest over several
+    FTP connections. Each part is fetched from its offset through
+    REST + RETR, checked against its digest in the manifest, and
+    written in place into a preallocated file, verified as a whole
+    before it is renamed into place.
+    """
+
+    def download(
+        self,
+        remote_path: str,
+        local_path: str,
+        state_path: str,
+        progress: Optional[Progress] = None,
+    ) -> Tuple[TransferStats, Dict[str, Any]]:
+        """
+        :param remote_path: The file on the server.
+        :param local_path: Where to download it.
+        :param state_path: The local resume state.
+        :param progress: Optional progress, fed with bytes received.
+        :raises OSError: If the file does not match its manifest.
+        :return: The transfer statistics and the manifest.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        start = time.monotonic()
+        with self.session() as ftp:
+            manifest = get_json(ftp, manifest_path(remote_path))
+        size = manifest["size"]
+        parts = split_parts(size, manifest["part_size"])
+        if len(parts) != len(manifest["parts"]):
+            raise OSError(f"Invalid manifest of '{remote_path}'.")
+
+        key = {
+            "remote": remote_path,
+            "size": size,
+            "sha256": manifest["sha256"],
+            "part_size": manifest["part_size"],
+        }
+        state = self.load_state(state_path, key)
+        tmp_path = local_path + DOWNLOAD_SUFFIX
+        fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            done: Dict[str, str] = state["done"]
+            if os.fstat(fd).st_size != size or not done:
+                done = {}
+                state["done"] = done
+                preallocate(fd, size)
+            self.transferred = 0
+            self.progress = progress
+            if progress is not None:
+                progress.update(sum(parts[int(i)][1] for i in done))
+
+            def get(ftp: ftplib.FTP, index: int) -> str:
+                return self.get_part(
+                    ftp, fd, remote_path, parts[index], manifest["parts"][index]
+                )
+
+            with ThreadPoolExecutor(max_workers=self.connections) as pool:
+                pending = [i for i in range(len(parts)) if str(i) not in done]
+                self.run_parts(
+                    pool, self.connections, pending, get, state, state_path
+                )
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        if sha256_file(tmp_path) != manifest["sha256"]:
+            os.unlink(tmp_path)
+            drop_state(state_path)
+            raise OSError(
+                f"Downloaded '{remote_path}' does not match its checksum "
+                "manifest; fetch it again."
+            )
+        os.replace(tmp_path, local_path)
+        drop_state(state_path)
+        return (
+            TransferStats(
+                size=size,
+                transferred=self.transferred,
+                seconds=time.monotonic() - start,
+            ),
+            manifest,
+        )
+
+    def get_part(
+        self,
+        ftp: ftplib.FTP,
+        fd: int,
+        remote_path: str,
+        part: Part,
+        expected: str,
+    ) -> str:
+        """
+        Fetches a part from its offset of the remote file, writing it
+        at the same offset of the local one.
+
+        :raises OSError: If the part does not match its digest.
+        :return: The SHA-256 of the part.
+        """
+        offset, length = part
+        digest = hashlib.sha256()
+        received = 0
+
+        def write(data: bytes) -> None:
+            nonlocal received
+            view = memoryview(data)[: length - received]
+            written = 0
+            while written < len(view):
+                written += os.pwrite(
+                    fd, view[written:], offset + received + written
+                )
+            digest.update(view)
+            received += len(view)
+            self.report(len(view))
+            if received == length:
+                raise _PartComplete()
+
+        try:
+            if length:
+                ftp.retrbinary(
+                    f"RETR {remote_path}",
+                    write,
+                    BLOCK_SIZE,
+                    rest=offset or None,
+                )
+        except _PartComplete:
+            # Closing the data connection early aborts the transfer.
+            # Servers reply to that with a 426, a 226 or both, so the
+            # control connection cannot be trusted any longer: closing
+            # it keeps the session from returning to the pool.
+            ftp.close()
+        except BaseException:
+            self.report(-received)
+            raise
+        sha256 = digest.hexdigest()
+        if received != length or sha256 != expected:
+            self.report(-received)
+            raise OSError(
+                f"Part at {offset} of '{remote_path}' does not match its "
+                "checksum."
+            )
+        return sha256
+
+
+def preallocate(fd: int, size: int) -> None:
+    """Sizes a file, reserving its blocks where the filesystem can."""
+    os.ftruncate(fd, 0)
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError:
+        os.ftruncate(fd, size)
+
+
+def drop_state(state_path: str) -> None:
+    try:
+        os.unlink(state_path)
+    except FileNotFoundError:
+        pass
+
+
+def put_json(ftp: ftplib.FTP, remote_path: str, data: Any) -> None:
+    """Stores a JSON document, atomically through a rename."""
+    tmp_path = remote_path + UPLOAD_SUFFIX
+    ftp.storbinary(
+        f"STOR {tmp_path}",
+        io.BytesIO(json.dumps(data, indent=2).encode("utf-8")),
+    )
+    ftp.rename(tmp_path, remote_path)
+
+
+def get_json(ftp: ftplib.FTP, remote_path: str) -> Any:
+    """
+    Retrieves a JSON document.
+
+    :raises FileNotFoundError: If it does not exist.
+    """
+    buffer = io.BytesIO()
+    try:
+        ftp.retrbinary(f"RETR {remote_path}", buffer.write)
+    except ftplib.error_perm as e:
+        raise FileNotFoundError(f"'{remote_path}' not found: {e}") from e
+    return json.loads(buffer.getvalue())
@@ -20,8 +20,15 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from typing import Dict, Optional
+
+from config import Config, EffectiveService
+
 
 class Service:
+    def __init__(self, config: Config):
+        self.config = config
+
     def build_service_image(self, service_type: str) -> None:
         """Stub for building a service image."""
         pass
@@ -38,6 +45,29 @@ class Service:
         """Stub for stopping a service."""
         pass
 
+    def start_environment_service(
+        self,
+        env_tag: str,
+        service: EffectiveService,
+        labels: Dict[str, str],
+        data_dir: Optional[str] = None,
+    ) -> None:
+        """
+        Stub for starting a service of an environment, labelled,
+        mounting the environment's data from `data_dir`.
+        """
+        pass
+
+    def halt_environment_service(
+        self, env_tag: str, service: EffectiveService
+    ) -> None:
+        """Stub for halting a service of an environment."""
+        pass
+
+    def is_service_ready(self, env_tag: str, service: EffectiveService) -> bool:
+        """Stub for probing whether a service of an environment is up."""
+        return True
+
     def reload_service(self, service_type: str) -> None:
         """Stub for reloading a service."""
         pass
@@ -20,19 +20,105 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
+import sys
+from functools import cache
+from typing import TYPE_CHECKING, Dict, List, Optional
+
 import click
 
-from database.database import Database
-from environment.environment import Environment
-from service.service import Service
+if TYPE_CHECKING:
+    from config import Config
+    from config.state import StateJournal
+    from database import Database
+    from environment import Environment
+    from registry import Registry
+    from service import Service
+    from system import System
 
-# Initialize instances
-database = Database()
-environment = Environment()
-service = Service()
 
+def get_config_path() -> str:
+    """Path of shpdctl's config file."""
+    return os.path.expanduser(
+        os.environ.get("SHPD_CFG_PATH", "~/.shpdctl.json")
+    )
 
-@click.group()
+
+def get_config_sibling(ext: str) -> str:
+    """Path of a file living next to the config file, by extension."""
+    return os.path.splitext(get_config_path())[0] + ext
+
+
+@cache
+def get_state_journal() -> "StateJournal":
+    from config.state import StateJournal
+
+    return StateJournal(get_config_sibling(".journal"))
+
+
+@cache
+def get_config() -> "Config":
+    from config import load_config
+
+    try:
+        config = load_config(
+            get_config_path(),
+            get_config_sibling(".conf"),
+            cache_path=get_config_sibling(".cache"),
+        )
+    except (OSError, ValueError) as e:
+        raise click.ClickException(f"Unable to load configuration: {e}")
+    return get_state_journal().apply(config)
+
+
+# Subsystems are imported and instantiated on first use only, so that
+# every invocation pays just for the command group it actually runs.
+@cache
+def get_database() -> "Database":
+    from database import Database
+
+    return Database(get_config())
+
+
+@cache
+def get_environment() -> "Environment":
+    from environment import Environment
+
+    return Environment(get_config(), get_state_journal())
+
+
+@cache
+def get_service() -> "Service":
+    from service import Service
+
+    return Service(get_config())
+
+
+@cache
+def get_registry() -> "Registry":
+    from registry import Registry
+
+    return Registry(get_config())
+
+
+@cache
+def get_system() -> "System":
+    from system import System
+
+    return System(get_config())
+
+
+class ShpdGroup(click.Group):
+    """Root group reporting operational errors without a traceback."""
+
+    def invoke(self, ctx: click.Context):
+        try:
+            return super().invoke(ctx)
+        except (OSError, ValueError) as e:
+            raise click.ClickException(str(e))
+
+
+@click.group(cls=ShpdGroup)
 @click.option("-v", "--verbose", is_flag=True, help="Enable verbose mode.")
 @click.option("-b", "--brief", is_flag=True, help="Brief output.")
 @click.option(
@@ -60,7 +146,9 @@ service = Service()
 @click.option(
     "-n", "--no-gen-certs", is_flag=True, help="Do not generate certificates."
 )
+@click.pass_context
 def cli(
+    ctx: click.Context,
     verbose: bool,
     brief: bool,
     yes: bool,
@@ -76,7 +164,19 @@ def cli(
     """Shepherd CLI:
     A tool to manage your environment, services, and database.
     """
-    pass
+    ctx.obj = {
+        "verbose": verbose,
+        "brief": brief,
+        "yes": yes,
+        "all": all,
+        "follow": follow,
+        "porcelain": porcelain,
+        "keep": keep,
+        "replace": replace,
+        "checkout": checkout,
+        "network_host": network_host,
+        "no_gen_certs": no_gen_certs,
+    }
 
 
 @click.group()
@@ -88,43 +188,43 @@ def db() -> None:
 @db.command(name="build")
 def build_dbms() -> None:
     """Build dbms image."""
-    database.build_dbms_image()
+    get_database().build_dbms_image()
 
 
 @db.command(name="bootstrap")
 def bootstrap() -> None:
     """Bootstrap dbms service."""
-    database.bootstrap_dbms_service()
+    get_database().bootstrap_dbms_service()
 
 
 @db.command(name="start")
 def up() -> None:
     """Start dbms service."""
-    database.start_dbms_service()
+    get_database().start_dbms_service()
 
 
 @db.command(name="halt")
 def halt() -> None:
     """Halt dbms service."""
-    database.halt_dbms_service()
+    get_database().halt_dbms_service()
 
 
 @db.command(name="stdout")
 def stdout() -> None:
     """Show dbms service stdout."""
-    database.show_dbms_stdout()
+    get_database().show_dbms_stdout()
 
 
 @db.command(name="shell")
 def shell() -> None:
     """Get a shell session for the dbms service."""
-    database.get_dbms_shell_session()
+    get_database().get_dbms_shell_session()
 
 
 @db.command(name="sql")
 def sql_shell() -> None:
     """Get a SQL session for the dbms service."""
-    database.get_sql_shell_session()
+    get_database().get_sql_shell_session()
 
 
 # Environment commands
@@ -139,7 +239,7 @@ def env() -> None:
 @click.argument("env_tag")
 def init_environment(db_type: str, env_tag: str) -> None:
     """Init an environment with a dbms type and an environment's tag name."""
-    environment.init_environment(db_type, env_tag)
+    get_environment().init_environment(db_type, env_tag)
 
 
 @env.command(name="clone")
@@ -147,50 +247,167 @@ def init_environment(db_type: str, env_tag: str) -> None:
 @click.argument("dst_env_tag")
 def clone_environment(src_env_tag: str, dst_env_tag: str) -> None:
     """Clone an environment."""
-    environment.clone_environment(src_env_tag, dst_env_tag)
+    get_environment().clone_environment(src_env_tag, dst_env_tag)
+
+
+@env.command(name="shard")
+def shard_environments() -> None:
+    """Move the environments to one definition file each."""
+    get_environment().shard_environments(get_config_path())
 
 
 @env.command(name="checkout")
 @click.argument("env_tag")
 def checkout_environment(env_tag: str) -> None:
     """Checkout an environment."""
-    environment.checkout_environment(env_tag)
+    get_environment().checkout_environment(env_tag)
 
 
 @env.command(name="noactive")
 def set_noactive() -> None:
     """Set all environments as non-active."""
-    environment.set_all_non_active()
+    get_environment().set_all_non_active()
 
 
 @env.command(name="list")
 def list_environments() -> None:
     """List all available environments."""
-    environment.list_environments()
+    get_environment().list_environments()
+
+
+@env.command(name="archive")
+@click.argument("env_tag", type=str)
+@click.option(
+    "--level",
+    type=click.IntRange(0, 9),
+    default=None,
+    help="Compression level (default 6).",
+)
+@click.option(
+    "--threads",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Compression threads (default: all cores).",
+)
+@click.option(
+    "--chunked",
+    is_flag=True,
+    help="Store into the deduplicated chunk store.",
+)
+@click.option(
+    "--delta",
+    is_flag=True,
+    help="Store as a delta against the DBMS empty environment.",
+)
+@click.pass_obj
+def archive_environment(
+    flags: Dict[str, bool],
+    env_tag: str,
+    level: Optional[int],
+    threads: Optional[int],
+    chunked: bool,
+    delta: bool,
+) -> None:
+    """Archive an environment."""
+    get_environment().archive_environment(
+        env_tag, flags["keep"], level, threads, chunked, delta
+    )
+
+
+@env.command(name="restore")
+@click.argument("env_tag", type=str)
+@click.option(
+    "--threads",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Writer threads (default: all cores).",
+)
+@click.pass_obj
+def restore_environment(
+    flags: Dict[str, bool], env_tag: str, threads: Optional[int]
+) -> None:
+    """Restore an archived environment."""
+    get_environment().restore_environment(env_tag, flags["replace"], threads)
+
+
+@env.command(name="push")
+@click.argument("env_tag", type=str)
+@click.option(
+    "--connections",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Parallel connections (default: the registry's).",
+)
+def push_environment(env_tag: str, connections: Optional[int]) -> None:
+    """Push an environment image to the registry."""
+    get_registry().push_environment(env_tag, connections)
+
+
+@env.command(name="fetch")
+@click.argument("env_tag", type=str)
+@click.option(
+    "--connections",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Parallel connections (default: the registry's).",
+)
+def fetch_environment(env_tag: str, connections: Optional[int]) -> None:
+    """Fetch an environment image from the registry."""
+    get_registry().fetch_environment(env_tag, connections)
+
+
+@env.command(name="pull")
+@click.argument("env_tag", type=str)
+@click.option(
+    "--threads",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Writer threads (default: all cores).",
+)
+@click.option(
+    "--keep-image",
+    is_flag=True,
+    help="Keep a copy of the image in .env_images.",
+)
+@click.pass_obj
+def pull_environment(
+    flags: Dict[str, bool],
+    env_tag: str,
+    threads: Optional[int],
+    keep_image: bool,
+) -> None:
+    """Pull an environment from the registry and restore it."""
+    get_registry().pull_environment(
+        env_tag, get_environment(), flags["replace"], threads, keep_image
+    )
 
 
 @env.command(name="start")
 def start_environment() -> None:
     """Start environment."""
-    environment.start_environment()
+    get_environment().start_environment()
 
 
 @env.command(name="halt")
 def halt_environment() -> None:
     """Halt environment."""
-    environment.halt_environment()
+    get_environment().halt_environment()
 
 
 @env.command(name="reload")
-def reload_environment() -> None:
+@click.option(
+    "--dry-run", is_flag=True, help="Only list what would be restarted."
+)
+def reload_environment(dry_run: bool) -> None:
     """Reload environment."""
-    environment.reload_environment()
+    get_environment().reload_environment(dry_run)
 
 
 @env.command(name="status")
-def environment_status() -> None:
+@click.pass_obj
+def environment_status(flags: Dict[str, bool]) -> None:
     """Print environment's status."""
-    environment.environment_status()
+    get_environment().environment_status(flags["all"], flags["porcelain"])
 
 
 @click.group()
@@ -203,50 +420,220 @@ def svc() -> None:
 @click.argument("service_type", type=str)
 def build_service(service_type: str) -> None:
     """Build service image."""
-    service.build_service_image(service_type)
+    get_service().build_service_image(service_type)
 
 
 @svc.command(name="bootstrap")
 @click.argument("service_type", type=str)
 def bootstrap_service(service_type: str) -> None:
     """Bootstrap service."""
-    service.bootstrap_service(service_type)
+    get_service().bootstrap_service(service_type)
 
 
 @svc.command(name="start")
 @click.argument("service_type", type=str)
 def start_service(service_type: str) -> None:
     """Start service."""
-    service.start_service(service_type)
+    get_service().start_service(service_type)
 
 
 @svc.command(name="halt")
 @click.argument("service_type", type=str)
 def stop_service(service_type: str) -> None:
     """Stop service."""
-    service.stop_service(service_type)
+    get_service().stop_service(service_type)
 
 
 @svc.command(name="reload")
 @click.argument("service_type", type=str)
 def reload_service(service_type: str) -> None:
     """Reload service."""
-    service.reload_service(service_type)
+    get_service().reload_service(service_type)
 
 
 @svc.command(name="stdout")
 @click.argument("service_id", type=str)
 def service_stdout(service_id: str) -> None:
     """Show service stdout."""
-    service.show_service_stdout(service_id)
+    get_service().show_service_stdout(service_id)
 
 
 @svc.command(name="shell")
 @click.argument("service_id", type=str)
 def service_shell(service_id: str) -> None:
     """Get a shell session for the service."""
-    service.get_service_shell(service_id)
+    get_service().get_service_shell(service_id)
 
 
-if __name__ == "__main__":
+@click.group(name="reg")
+def registry_group() -> None:
+    """Environment registry commands."""
+    pass
+
+
+@registry_group.command(name="list")
+@click.option(
+    "--filter",
+    "pattern",
+    type=str,
+    default=None,
+    help="Shell-style pattern of the environment tags.",
+)
+@click.option(
+    "--db-type", type=str, default=None, help="DB type of the environments."
+)
+@click.option(
+    "--sort",
+    type=click.Choice(["env", "size", "pushed"]),
+    default="env",
+    show_default=True,
+    help="Sort key.",
+)
+@click.option("--reverse", is_flag=True, help="Sort in descending order.")
+@click.pass_obj
+def list_registry(
+    flags: Dict[str, bool],
+    pattern: Optional[str],
+    db_type: Optional[str],
+    sort: str,
+    reverse: bool,
+) -> None:
+    """List the environment images on the registry."""
+    get_registry().list_images(
+        pattern, db_type, sort, reverse, flags["porcelain"]
+    )
+
+
+@registry_group.command(name="prune")
+@click.option(
+    "--older-than",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="Remove the images pushed more than this many days ago.",
+)
+def prune_registry(older_than: Optional[float]) -> None:
+    """Rebuild the registry index, removing old images."""
+    get_registry().prune_registry(older_than)
+
+
+@click.group(name="sys")
+def system_group() -> None:
+    """System management commands."""
+    pass
+
+
+@system_group.command(name="prune")
+def prune_system() -> None:
+    """Remove unused environment images and chunks."""
+    get_system().prune()
+
+
+@click.group(name="daemon")
+def daemon_group() -> None:
+    """Resident daemon serving shpdctl commands."""
+    pass
+
+
+@daemon_group.command(name="start")
+def start_daemon() -> None:
+    """Start the daemon in the foreground."""
+    import util.container
+    from daemon.server import CONTAINER_STATE_TTL, Daemon
+
+    util.container.STATE_TTL = CONTAINER_STATE_TTL
+    server = Daemon(
+        get_config_path(), run_cli, reset_resident_state, get_watched_paths
+    )
+    click.echo(f"Serving on {server.socket_path}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+@daemon_group.command(name="stop")
+def stop_daemon() -> None:
+    """Stop the running daemon."""
+    from daemon import send_request
+
+    send_request({"op": "stop"})
+    click.echo("Daemon stopped.")
+
+
+@daemon_group.command(name="status")
+def daemon_status() -> None:
+    """Print the daemon's status."""
+    from daemon import send_request
+
+    try:
+        status = send_request({"op": "status"})
+    except OSError:
+        click.echo("Daemon not running.")
+        return
+    click.echo(
+        f"Daemon running, pid {status['pid']}, config {status['config']}."
+    )
+
+
+cli.add_command(db)
+cli.add_command(env)
+cli.add_command(svc)
+cli.add_command(registry_group)
+cli.add_command(system_group)
+cli.add_command(daemon_group)
+
+
+def reset_resident_state() -> None:
+    """Drops the configuration and the subsystems built so far."""
+    for accessor in (
+        get_config,
+        get_state_journal,
+        get_database,
+        get_environment,
+        get_service,
+        get_registry,
+        get_system,
+    ):
+        accessor.cache_clear()
+
+
+def get_watched_paths() -> List[str]:
+    """Files whose change invalidates the resident state."""
+    paths = [
+        get_config_path(),
+        get_config_sibling(".conf"),
+        get_config_sibling(".journal"),
+    ]
+    if get_config.cache_info().currsize:
+        from config.shards import INDEX_FILE, env_defs_dir
+
+        config = get_config()
+        if config.envs_layout == "sharded":
+            paths.append(
+                os.path.join(env_defs_dir(config.envs_dir), INDEX_FILE)
+            )
+    return paths
+
+
+def run_cli(argv: List[str]) -> int:
+    """Runs a command line in-process and returns its exit code."""
+    try:
+        cli.main(args=argv, prog_name="shpdctl")
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        return 1
+    return 0
+
+
+def main() -> None:
+    from daemon import forward
+
+    exit_code = forward(sys.argv[1:], get_config_path())
+    if exit_code is not None:
+        sys.exit(exit_code)
     cli()
+
+
+if __name__ == "__main__":
+    main()
@@ -19,3 +19,68 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+
+import os
+from typing import List
+
+from config import Config
+from environment.environment import ENV_IMAGES_DIR
+from environment.kept import read_kept
+from environment.sizes import SizeIndex
+from util import human_size
+
+
+class System:
+    def __init__(self, config: Config):
+        self.config = config
+
+    def get_images_path(self) -> str:
+        return os.path.join(
+            os.path.expanduser(self.config.envs_dir), ENV_IMAGES_DIR
+        )
+
+    def prune(self) -> None:
+        """
+        Remove the archives no environment needs any longer, those of
+        environments restored, then the chunks no remaining manifest
+        references. Images of environments not in the configuration,
+        and images fetched or pulled to be kept, are left alone.
+        """
+        from environment.archive import ARCHIVE_SUFFIX
+        from environment.chunks import ChunkStore
+        from environment.delta import image_tag
+
+        restored = {env.tag for env in self.config.envs if not env.archived}
+        images_path = self.get_images_path()
+        kept = read_kept(images_path)
+        store = ChunkStore(images_path)
+        freed = 0
+
+        stale: List[str] = []
+        if os.path.isdir(images_path):
+            stale = [
+                name
+                for name in os.listdir(images_path)
+                if name.endswith(ARCHIVE_SUFFIX)
+                and image_tag(name) in restored
+                and kept.get(image_tag(name)) != name
+            ]
+        for name in sorted(stale):
+            path = os.path.join(images_path, name)
+            freed += os.path.getsize(path)
+            os.unlink(path)
+            print(f"Removed {name}.")
+        for tag in store.tags():
+            if tag in restored:
+                store.remove_manifest(tag)
+                print(f"Removed manifest {tag}.")
+
+        chunks, chunk_bytes = (
+            store.gc() if os.path.isdir(store.root) else (0, 0)
+        )
+        freed += chunk_bytes
+        SizeIndex(self.config.envs_dir).invalidate(ENV_IMAGES_DIR)
+
+        size, unit = human_size(freed)
+        print(f"Removed {chunks} unreferenced chunks.")
+        print(f"Freed {size} ({unit}).")
@@ -0,0 +1,211 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import errno
+import gzip
+import io
+import os
+import shutil
+import tarfile
+from pathlib import Path
+from typing import Any, List
+
+import pytest
+from pytest_mock import MockerFixture
+
+from environment.archive import (
+    RESTORE_CHUNK_SIZE,
+    extract_archive,
+    extract_tar,
+    write_archive,
+)
+from util.pgzip import ParallelGzipWriter
+
+
+def test_parallel_gzip_is_standard_gzip() -> None:
+    """Test blocks compressed in parallel form one valid gzip member"""
+
+    data = os.urandom(100_000) + b"shepherd" * 200_000 + os.urandom(77)
+    out = io.BytesIO()
+    writer = ParallelGzipWriter(out, level=6, threads=3, block_size=64 * 1024)
+    for i in range(0, len(data), 9999):
+        writer.write(data[i : i + 9999])
+    writer.close()
+
+    assert gzip.decompress(out.getvalue()) == data
+    assert writer.bytes_in == len(data)
+    assert writer.bytes_out == len(out.getvalue())
+    # Priming each block with its predecessor keeps the ratio.
+    assert len(out.getvalue()) < 1.05 * len(gzip.compress(data, 6))
+
+    out = io.BytesIO()
+    ParallelGzipWriter(out).close()
+    assert gzip.decompress(out.getvalue()) == b""
+
+
+def test_write_archive(tmp_path: Path) -> None:
+    """Test the archive streams a tar of the environment"""
+
+    env_dir = tmp_path / "env-1"
+    (env_dir / "db" / "data").mkdir(parents=True)
+    (env_dir / "db" / "data" / "users.dbf").write_bytes(b"u" * 300_000)
+    os.chmod(env_dir / "db" / "data" / "users.dbf", 0o600)
+    archive_path = str(tmp_path / "env-1.tar.gz")
+
+    stats = write_archive(str(env_dir), "env-1", archive_path, threads=2)
+
+    assert not os.path.exists(archive_path + ".tmp")
+    assert stats.bytes_out == os.path.getsize(archive_path)
+    assert stats.bytes_in > 300_000
+    with tarfile.open(archive_path, "r:gz") as tar:
+        member = tar.getmember("env-1/db/data/users.dbf")
+        assert member.mode == 0o600
+        extracted = tar.extractfile(member)
+        assert extracted and extracted.read() == b"u" * 300_000
+
+
+def test_write_archive_stops_compressing_on_failure(
+    mocker: MockerFixture, tmp_path: Path
+) -> None:
+    """Test a failing tar stream shuts the compression pool down"""
+
+    env_dir = tmp_path / "env-1"
+    env_dir.mkdir()
+    writers: List[ParallelGzipWriter] = []
+
+    def failing_tar(src_dir: str, arcname: str, gz: Any, progress: Any) -> None:
+        writers.append(gz)
+        gz.write(os.urandom(3 * 1024 * 1024))
+        raise OSError(errno.EIO, "Input/output error")
+
+    mocker.patch("environment.archive.write_tar", side_effect=failing_tar)
+    archive_path = str(tmp_path / "env-1.tar.gz")
+
+    with pytest.raises(OSError):
+        write_archive(str(env_dir), "env-1", archive_path, threads=2)
+    assert writers[0].closed and writers[0].pool._shutdown
+    assert not os.path.exists(archive_path)
+    assert not os.path.exists(archive_path + ".tmp")
+
+
+def test_extract_archive_streams_sparse_files(tmp_path: Path) -> None:
+    """Test restore rebuilds files, links and holes from the stream"""
+
+    env_dir = tmp_path / "env-1"
+    (env_dir / "db" / "data").mkdir(parents=True)
+    with open(env_dir / "db" / "data" / "sparse.dbf", "wb") as f:
+        f.write(b"head")
+        f.seek(20 * 1024 * 1024)
+        f.write(b"tail")
+    (env_dir / "db" / "data" / "users.dbf").write_bytes(os.urandom(5_000_000))
+    os.symlink("data", env_dir / "db" / "link")
+    archive_path = str(tmp_path / "env-1.tar.gz")
+    write_archive(str(env_dir), "env-1", archive_path)
+
+    restored_dir = tmp_path / "restored"
+    restored = extract_archive(
+        archive_path,
+        "env-1",
+        str(restored_dir),
+        threads=3,
+        max_inflight=RESTORE_CHUNK_SIZE * 2,
+    )
+
+    assert restored == 20 * 1024 * 1024 + 4 + 5_000_000
+    for name in ("sparse.dbf", "users.dbf"):
+        assert (restored_dir / "db" / "data" / name).read_bytes() == (
+            env_dir / "db" / "data" / name
+        ).read_bytes()
+    sparse = os.stat(restored_dir / "db" / "data" / "sparse.dbf")
+    assert sparse.st_blocks * 512 < 1024 * 1024
+    assert os.readlink(restored_dir / "db" / "link") == "data"
+
+
+def test_extract_archive_rejects_escaping_members(tmp_path: Path) -> None:
+    """Test members outside of the environment are refused"""
+
+    def make_archive(*members: tarfile.TarInfo) -> str:
+        path = str(tmp_path / "evil.tar.gz")
+        with tarfile.open(path, "w:gz") as tar:
+            for member in members:
+                tar.addfile(member, io.BytesIO(b"x" * member.size))
+        return path
+
+    def file_member(name: str) -> tarfile.TarInfo:
+        member = tarfile.TarInfo(name)
+        member.size = 1
+        return member
+
+    link = tarfile.TarInfo("env-1/out")
+    link.type = tarfile.SYMTYPE
+    link.linkname = str(tmp_path)
+    root = tarfile.TarInfo("env-1")
+    root.type = tarfile.DIRTYPE
+
+    for members in (
+        [root, file_member("env-1/../evil")],
+        [root, file_member("other/evil")],
+        [root, link, file_member("env-1/out/evil")],
+    ):
+        with pytest.raises(ValueError):
+            extract_archive(
+                make_archive(*members), "env-1", str(tmp_path / "dst")
+            )
+        shutil.rmtree(tmp_path / "dst", ignore_errors=True)
+    assert not os.path.exists(tmp_path / "evil")
+
+
+def test_extract_archive_rejects_escaping_links(tmp_path: Path) -> None:
+    """Test links cannot reach outside of the environment"""
+
+    secret = tmp_path / "secret"
+    secret.write_bytes(b"secret")
+
+    def member(name: str, kind: bytes, linkname: str = "") -> tarfile.TarInfo:
+        info = tarfile.TarInfo(name)
+        info.type = kind
+        info.linkname = linkname
+        return info
+
+    root = member("env-1", tarfile.DIRTYPE)
+    up = member("env-1/up", tarfile.SYMTYPE, "..")
+    for members in (
+        [root, up, member("env-1/leak", tarfile.LNKTYPE, "env-1/up/secret")],
+        [root, up],
+        [root, member("env-1/abs", tarfile.SYMTYPE, str(secret))],
+        # Hardlinked while redirected by a symlink restored after it.
+        [root, member("env-1/a", tarfile.SYMTYPE, "b/../secret")]
+        + [member("env-1/b", tarfile.SYMTYPE, ".")]
+        + [member("env-1/leak", tarfile.LNKTYPE, "env-1/a")],
+        # Redirected by a symlink restored after it.
+        [root, member("env-1/a", tarfile.SYMTYPE, "b/../secret")]
+        + [member("env-1/b", tarfile.SYMTYPE, ".")],
+    ):
+        path = str(tmp_path / "evil.tar")
+        with tarfile.open(path, "w") as tar:
+            for info in members:
+                tar.addfile(info)
+        with pytest.raises(ValueError):
+            with open(path, "rb") as f:
+                extract_tar(f, "r|", "env-1", str(tmp_path / "dst"))
+        shutil.rmtree(tmp_path / "dst", ignore_errors=True)
+    assert secret.stat().st_nlink == 1
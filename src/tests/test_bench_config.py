@@ -0,0 +1,50 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import copy
+
+from benchmarks.bench_config import compare, run
+
+
+def test_bench_config_run_and_compare() -> None:
+    """Test the suite measures every stage and flags regressions"""
+
+    baseline = run(envs=[1, 5], shapes=["2x1"], repeat=1)
+    stages = {r["stage"] for r in baseline["results"]}
+    assert stages == {
+        "load_user_values",
+        "substitute_placeholders",
+        "parse_config",
+        "load_config",
+        "load_config_cached",
+    }
+    assert len(baseline["results"]) == 10
+    assert compare(baseline, baseline, threshold=0.2) == []
+
+    current = copy.deepcopy(baseline)
+    current["results"][3]["time_s"] *= 1.5
+    current["results"][4]["peak_bytes"] *= 1.1
+    regressions = compare(baseline, current, threshold=0.2)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("load_config [envs=1,services=2")
+    assert "time_s" in regressions[0]
+    assert compare(baseline, current, threshold=0.05)[1:] != []
@@ -0,0 +1,126 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import os
+import random
+from pathlib import Path
+from types import SimpleNamespace
+
+from environment.archive import extract_tar
+from environment.chunks import MAX_CHUNK_SIZE, ChunkStore, split_chunks
+from environment.environment import ENV_IMAGES_DIR
+from environment.kept import set_kept
+from system import System
+
+
+def make_env(path: Path, base: bytes, delta: bytes) -> None:
+    (path / "db" / "data").mkdir(parents=True)
+    (path / "db" / "data" / "system.dbf").write_bytes(base)
+    (path / "db" / "data" / "users.dbf").write_bytes(delta)
+
+
+def test_chunks_resist_insertions() -> None:
+    """Test cut points follow the content, not the offsets"""
+
+    data = random.Random(1).randbytes(4 * 1024 * 1024)
+    chunks = split_chunks(data)
+    shifted = split_chunks(b"inserted" + data)
+
+    assert b"".join(chunks) == data
+    assert max(len(c) for c in chunks) <= MAX_CHUNK_SIZE
+    assert len(chunks) > 50
+    digests = {hashlib.sha256(c).digest() for c in chunks}
+    common = [c for c in shifted if hashlib.sha256(c).digest() in digests]
+    assert len(common) >= len(chunks) - 2
+
+
+def test_store_deduplicates_environments(tmp_path: Path) -> None:
+    """Test environments share the chunks of their common base"""
+
+    rng = random.Random(2)
+    base = rng.randbytes(8 * 1024 * 1024)
+    for tag in ("env-1", "env-2"):
+        make_env(tmp_path / tag, base, rng.randbytes(300_000))
+    store = ChunkStore(str(tmp_path / "images"), threads=2)
+
+    first = store.archive(str(tmp_path / "env-1"), "env-1")
+    second = store.archive(str(tmp_path / "env-2"), "env-2")
+
+    assert first.bytes_new > 8 * 1024 * 1024
+    assert second.bytes_new < 1024 * 1024
+    assert store.tags() == ["env-1", "env-2"]
+
+    store.remove_manifest("env-1")
+    removed, _ = store.gc()
+    assert 0 < removed < first.chunks_new
+    with store.open("env-2") as stream:
+        extract_tar(stream, "r|", "env-2", str(tmp_path / "restored"))
+    for name in ("system.dbf", "users.dbf"):
+        assert (tmp_path / "restored" / "db" / "data" / name).read_bytes() == (
+            tmp_path / "env-2" / "db" / "data" / name
+        ).read_bytes()
+
+    store.remove_manifest("env-2")
+    store.gc()
+    assert not any(
+        files for _, _, files in os.walk(tmp_path / "images/chunks/objects")
+    )
+    store.close()
+
+
+def test_prune_drops_unused_images(tmp_path: Path) -> None:
+    """Test prune drops the images of restored environments only"""
+
+    images = tmp_path / ENV_IMAGES_DIR
+    make_env(tmp_path / "env-1", b"a" * 100_000, b"b")
+    store = ChunkStore(str(images))
+    store.archive(str(tmp_path / "env-1"), "env-1")
+    store.archive(str(tmp_path / "env-1"), "env-2")
+    store.close()
+    (images / "env-3.tar.gz").write_bytes(b"x")
+    (images / "env-4.tar.gz").write_bytes(b"x")
+    (images / "env-5.tar.gz").write_bytes(b"x")
+    (images / "env-6.tar.gz").write_bytes(b"x")
+    set_kept(str(images), "env-6", "env-6.tar.gz")
+    config = SimpleNamespace(
+        envs_dir=str(tmp_path),
+        envs=[
+            SimpleNamespace(tag="env-1", archived=True),
+            SimpleNamespace(tag="env-2", archived=False),
+            SimpleNamespace(tag="env-3", archived=True),
+            SimpleNamespace(tag="env-5", archived=False),
+            SimpleNamespace(tag="env-6", archived=False),
+        ],
+    )
+
+    System(config).prune()  # type: ignore[arg-type]
+
+    assert store.tags() == ["env-1"]
+    assert sorted(n for n in os.listdir(images) if n[0] != ".") == [
+        "chunks",
+        "env-3.tar.gz",
+        "env-4.tar.gz",
+        "env-6.tar.gz",
+    ]
+    with store.open("env-1") as stream:
+        extract_tar(stream, "r|", "env-1", str(tmp_path / "restored"))
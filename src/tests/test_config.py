@@ -20,12 +20,29 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import dataclasses
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Tuple
 from unittest.mock import mock_open
 
 import pytest
 from pytest_mock import MockerFixture
 
-from config import Config, load_config
+from benchmarks.bench_loader import legacy_load, measure_peak, single_pass_load
+from benchmarks.bench_memory import measure as measure_retained
+from benchmarks.synthetic import generate_config, make_environment
+from config import (
+    Config,
+    ShardedEnvs,
+    load_config,
+    remove_environment,
+    write_environment,
+)
+from config.cache import read_cache
+from config.config import ConfigBuilder, build_config, parse_user_values
 
 
 def test_load_config(mocker: MockerFixture):
@@ -286,3 +303,280 @@ def test_load_invalid_user_values(mocker: MockerFixture) -> None:
 
     with pytest.raises(ValueError):
         load_config("mock.1", "mock.2")
+
+
+@pytest.fixture
+def config_files(tmp_path: Path) -> Tuple[str, str, str]:
+    resources = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "resources",
+    )
+    for name in ("shpdctl.json", "shpdctl.conf"):
+        shutil.copy(os.path.join(resources, name), tmp_path)
+    return (
+        str(tmp_path / "shpdctl.json"),
+        str(tmp_path / "shpdctl.conf"),
+        str(tmp_path / "shpdctl.cache"),
+    )
+
+
+def test_load_config_cache_warm_start(
+    mocker: MockerFixture, config_files: Tuple[str, str, str]
+) -> None:
+    """Test a warm start skips parsing and substitution"""
+
+    cfg_path, values_path, cache_path = config_files
+    build = mocker.spy(ConfigBuilder, "config")
+    cold = load_config(cfg_path, values_path, cache_path=cache_path)
+    assert os.path.exists(cache_path)
+    assert build.call_count == 1
+
+    build.reset_mock()
+    warm = load_config(cfg_path, values_path, cache_path=cache_path)
+
+    build.assert_not_called()
+    assert warm == cold
+
+
+def test_load_config_cache_invalidation(
+    config_files: Tuple[str, str, str],
+) -> None:
+    """Test editing either file invalidates the cache"""
+
+    cfg_path, values_path, cache_path = config_files
+    config = load_config(cfg_path, values_path, cache_path=cache_path)
+    assert config.domain == "sslip.io"
+
+    with open(values_path, "a") as f:
+        f.write("domain=example.com\n")
+    config = load_config(cfg_path, values_path, cache_path=cache_path)
+    assert config.domain == "example.com"
+
+    with open(cfg_path, "r") as f:
+        data = json.load(f)
+    data["dns_type"] = "static"
+    with open(cfg_path, "w") as f:
+        json.dump(data, f)
+    config = load_config(cfg_path, values_path, cache_path=cache_path)
+    assert config.dns_type == "static"
+    assert config.domain == "example.com"
+
+
+def test_load_config_reports_unresolved(
+    config_files: Tuple[str, str, str], capsys: pytest.CaptureFixture[str]
+) -> None:
+    """Test placeholders without a value are reported on every load"""
+
+    cfg_path, values_path, cache_path = config_files
+    with open(cfg_path, "r") as f:
+        data = json.load(f)
+    data["dns_type"] = "dns-${dns_tpye}"
+    with open(cfg_path, "w") as f:
+        json.dump(data, f)
+
+    for cache in (None, cache_path, cache_path):
+        config = load_config(cfg_path, values_path, cache_path=cache)
+        assert config.dns_type == "dns-${dns_tpye}"
+        assert capsys.readouterr().err == (
+            "Warning: no value for placeholders dns_tpye.\n"
+        )
+
+
+def test_load_config_cache_corrupted(
+    config_files: Tuple[str, str, str],
+) -> None:
+    """Test a corrupted cache is ignored and rebuilt"""
+
+    cfg_path, values_path, cache_path = config_files
+    with open(cache_path, "wb") as f:
+        f.write(b"not a pickle")
+
+    config = load_config(cfg_path, values_path, cache_path=cache_path)
+    assert config.ora.empty_env == "fresh-ora-19300"
+    assert read_cache(cache_path) is not None
+
+
+def test_single_pass_load_matches_legacy() -> None:
+    """Test single-pass building matches and undercuts the legacy path"""
+
+    config_data, values_text = generate_config(200)
+    values = parse_user_values(values_text.splitlines())
+
+    single = single_pass_load(config_data, values)
+    legacy = legacy_load(config_data, values)
+    # Embedded placeholders are only resolved by the single-pass loader.
+    for env in legacy.envs:
+        for upstream in env.db.upstreams:
+            upstream.host = upstream.host.replace("${domain}", "sslip.io")
+        for svc in env.services[1:]:
+            svc.subject_alternative_name = f"DNS:{svc.tag}.sslip.io"
+    assert single == legacy
+    assert len(single.envs) == 200
+    assert single.envs[1].db.sys_user == "sys"
+    assert single.envs[1].services[1].envvars == {
+        "USER": "docker",
+        "PSW": "docker",
+    }
+
+    assert measure_peak(single_pass_load, config_data, values) < measure_peak(
+        legacy_load, config_data, values
+    )
+
+
+@pytest.fixture
+def sharded_config_files(
+    tmp_path: Path, config_files: Tuple[str, str, str]
+) -> Tuple[str, str, str]:
+    cfg_path, _, _ = config_files
+    with open(cfg_path, "r") as f:
+        data = json.load(f)
+    data["envs_layout"] = "sharded"
+    data["envs_dir"] = str(tmp_path / "envs")
+    del data["envs"]
+    with open(cfg_path, "w") as f:
+        json.dump(data, f)
+
+    for i in range(50):
+        write_environment(data["envs_dir"], make_environment(i, 3, 1))
+    return config_files
+
+
+def test_sharded_envs_parsed_on_access(
+    mocker: MockerFixture, sharded_config_files: Tuple[str, str, str]
+) -> None:
+    """Test sharded environments are parsed only when accessed"""
+
+    cfg_path, values_path, cache_path = sharded_config_files
+    parse_env = mocker.spy(ConfigBuilder, "environment")
+
+    config = load_config(cfg_path, values_path, cache_path=cache_path)
+    assert isinstance(config.envs, ShardedEnvs)
+    assert len(config.envs) == 50
+    assert "env-42" in config.envs
+    parse_env.assert_not_called()
+
+    active = config.get_active_environment()
+    assert active and active.tag == "env-0"
+    env = config.get_environment("env-42")
+    assert env and env.db.sys_user == "sys" and env.archived is False
+    assert config.get_environment("missing") is None
+    assert parse_env.call_count == 2
+
+    config.get_environment("env-42")
+    assert parse_env.call_count == 2
+    assert config.envs.index(env) == 42
+    assert [env.tag for env in config.envs[:3]] == ["env-0", "env-1", "env-2"]
+
+
+def test_sharded_envs_cached_config_sees_new_shards(
+    sharded_config_files: Tuple[str, str, str],
+) -> None:
+    """Test a cached config re-reads the index of a sharded layout"""
+
+    cfg_path, values_path, cache_path = sharded_config_files
+    config = load_config(cfg_path, values_path, cache_path=cache_path)
+    assert config.get_environment("env-0") is not None
+
+    write_environment(config.envs_dir, make_environment(50, 1, 0))
+    remove_environment(config.envs_dir, "env-0")
+
+    config = load_config(cfg_path, values_path, cache_path=cache_path)
+    assert len(config.envs) == 50
+    assert config.get_environment("env-0") is None
+    env = config.get_environment("env-50")
+    assert env and len(env.services) == 2
+
+
+def test_sharded_envs_reject_unsafe_tags(tmp_path: Path) -> None:
+    """Test tags that are not plain file names are refused"""
+
+    envs_dir = str(tmp_path / "envs")
+    for tag in ("../escape", "a/b", ".hidden", "", None):
+        item = make_environment(0, 1, 0)
+        item["tag"] = tag
+        with pytest.raises(ValueError, match="Invalid environment tag"):
+            write_environment(envs_dir, item)
+    assert not os.path.exists(tmp_path / "escape.json")
+
+    item = make_environment(0, 1, 0)
+    item["tag"] = "env_0.old-1"
+    write_environment(envs_dir, item)
+    assert os.path.exists(tmp_path / "envs" / ".env_defs" / "env_0.old-1.json")
+
+
+def test_config_model_is_compact() -> None:
+    """Test the config model is slotted and shares repeated strings"""
+
+    config_data, values_text = generate_config(2)
+    config = build_config(
+        json.loads(json.dumps(config_data)),
+        parse_user_values(values_text.splitlines()),
+    )
+
+    svc_0, svc_1 = config.envs[0].services[1], config.envs[1].services[1]
+    assert not hasattr(svc_0, "__dict__")
+    assert not hasattr(config, "__dict__")
+    assert svc_0.type is svc_1.type
+    assert svc_0.image is svc_1.image
+
+    slotted, plain = measure_retained(100)
+    assert slotted < plain
+
+
+def test_effective_environment_resolved_at_load(
+    mocker: MockerFixture, tmp_path: Path
+) -> None:
+    """Test the effective view merges defaults and is cached with Config"""
+
+    config_data, values = generate_config(2)
+    config_data["envs"][1]["db"]["user"] = "owner"
+    config_data["envs"][1]["services"][1]["envvars"] = [
+        {"USER": "${db_usr}"},
+        {"PSW": "${db_psw}"},
+    ]
+    cfg_path, values_path = str(tmp_path / "c.json"), str(tmp_path / "c.conf")
+    cache_path = str(tmp_path / "c.cache")
+    with open(cfg_path, "w") as f:
+        json.dump(config_data, f)
+    with open(values_path, "w") as f:
+        f.write(values)
+
+    config = load_config(cfg_path, values_path, cache_path=cache_path)
+    assert sorted(config.effective) == ["env-0", "env-1"]
+
+    ora = config.get_effective_environment("env-0")
+    assert ora and ora.db.image == config.ora.image
+    assert ora.db.empty_env == config.ora.empty_env
+    assert ora.db.user == "docker" and ora.db.sys_user == "sys"
+    traefik = ora.get_service("traefik-1")
+    assert traefik and traefik.ingress is True and traefik.envvars == {}
+
+    pg = config.get_effective_environment("env-1")
+    assert pg and pg.db.image == config.pg.image
+    assert pg.db.net_listener_port == config.pg.net_listener_port
+    assert pg.db.user == "owner" and pg.db.psw == "docker"
+    assert pg.services[1].envvars == {"USER": "docker", "PSW": "docker"}
+    assert config.get_effective_environment("missing") is None
+
+    build = mocker.patch("config.config.effective_environment")
+    warm = load_config(cfg_path, values_path, cache_path=cache_path)
+    assert warm.get_effective_environment("env-1") == pg
+    build.assert_not_called()
+
+
+def test_service_spec_hash_covers_database(tmp_path: Path) -> None:
+    """Test a database change alters the spec hash of the services"""
+
+    config_data, values = generate_config(2)
+    cfg_path, values_path = str(tmp_path / "c.json"), str(tmp_path / "c.conf")
+    with open(cfg_path, "w") as f:
+        json.dump(config_data, f)
+    with open(values_path, "w") as f:
+        f.write(values)
+
+    env = load_config(cfg_path, values_path).get_effective_environment("env-0")
+    assert env is not None
+    service = env.services[0]
+    moved = dataclasses.replace(env.db, psw="changed")
+    assert service.spec_hash(env.db) == service.spec_hash(env.db)
+    assert service.spec_hash(moved) != service.spec_hash(env.db)
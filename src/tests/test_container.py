@@ -0,0 +1,93 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import subprocess
+
+import pytest
+from pytest_mock import MockerFixture
+
+from util.container import ContainerEngine
+
+
+def test_list_containers(mocker: MockerFixture) -> None:
+    """Test label filters and both docker and podman label formats"""
+
+    lines = [
+        {"ID": "a1", "Names": "db", "State": "running", "Labels": "k=v,x=1"},
+        {"Id": "b2", "Names": ["svc"], "State": "exited", "Labels": {"k": "v"}},
+    ]
+    run = mocker.patch(
+        "subprocess.run",
+        return_value=subprocess.CompletedProcess(
+            [], 0, "\n".join(json.dumps(line) for line in lines) + "\n", ""
+        ),
+    )
+
+    containers = ContainerEngine("docker").list_containers(
+        {"k": "v", "x": None}, all=True
+    )
+
+    assert run.call_args.args[0] == [
+        "docker",
+        "ps",
+        "--no-trunc",
+        "--format",
+        "{{json .}}",
+        "--all",
+        "--filter",
+        "label=k=v",
+        "--filter",
+        "label=x",
+    ]
+    assert [c.id for c in containers] == ["a1", "b2"]
+    assert containers[0].labels == {"k": "v", "x": "1"}
+    assert containers[1].name == "svc" and containers[1].state == "exited"
+
+    run.return_value = subprocess.CompletedProcess([], 1, "", "daemon down")
+    with pytest.raises(OSError, match="daemon down"):
+        ContainerEngine("docker").list_containers({})
+
+
+def test_list_containers_reuses_state(mocker: MockerFixture) -> None:
+    """Test listings are reused within the TTL, until a change"""
+
+    run = mocker.patch(
+        "subprocess.run",
+        return_value=subprocess.CompletedProcess([], 0, "", ""),
+    )
+    engine = ContainerEngine("docker", state_ttl=60)
+
+    engine.list_containers({"k": None})
+    engine.list_containers({"k": None})
+    assert run.call_count == 1
+    engine.list_containers({"k": None}, all=True)
+    assert run.call_count == 2
+
+    engine.remove_container("a1")
+    engine.list_containers({"k": None})
+    assert run.call_count == 4
+
+    engine = ContainerEngine("docker")
+    engine.list_containers({})
+    engine.list_containers({})
+    assert run.call_count == 6
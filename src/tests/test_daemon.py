@@ -0,0 +1,184 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import pytest
+from pytest import CaptureFixture
+from pytest_mock import MockerFixture
+
+from daemon import forward, send_request
+from daemon.client import is_forwardable
+from daemon.server import Daemon
+
+CONFIG_PATH = "/etc/shpdctl.json"
+
+
+class Recorder:
+    def __init__(self, watched: str):
+        self.watched = watched
+        self.commands: List[List[str]] = []
+        self.engines: List[Optional[str]] = []
+        self.resets = 0
+
+    def run(self, argv: List[str]) -> int:
+        self.commands.append(argv)
+        self.engines.append(os.environ.get("SHPD_CONTAINER_ENGINE"))
+        print(f"ran {' '.join(argv)}")
+        return 3 if argv[-1] == "fail" else 0
+
+    def reset(self) -> None:
+        self.resets += 1
+
+    def watched_paths(self) -> List[str]:
+        return [self.watched]
+
+
+@pytest.fixture
+def daemon() -> Iterator[Tuple[Daemon, Recorder]]:
+    # Unix socket paths are short: stay close to the root.
+    work_dir = tempfile.mkdtemp(prefix="shpd-")
+    recorder = Recorder(os.path.join(work_dir, "shpdctl.conf"))
+    server = Daemon(
+        CONFIG_PATH,
+        recorder.run,
+        recorder.reset,
+        recorder.watched_paths,
+        socket_path=os.path.join(work_dir, "sock"),
+    )
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    while not os.path.exists(server.socket_path):
+        time.sleep(0.01)
+    yield server, recorder
+    server.shutdown()
+    thread.join()
+    shutil.rmtree(work_dir)
+
+
+def test_forward_to_daemon(
+    daemon: Tuple[Daemon, Recorder], capsys: CaptureFixture[str]
+) -> None:
+    """Test commands run by the daemon report output and exit code"""
+
+    server, recorder = daemon
+
+    fail = ["env", "status", "fail"]
+    assert forward(["env", "list"], CONFIG_PATH, server.socket_path) == 0
+    assert forward(fail, CONFIG_PATH, server.socket_path) == 3
+    assert capsys.readouterr().out == "ran env list\nran env status fail\n"
+    assert recorder.commands == [["env", "list"], fail]
+    assert send_request({"op": "status"}, server.socket_path)["pid"] > 0
+
+
+def test_forward_falls_back(daemon: Tuple[Daemon, Recorder]) -> None:
+    """Test commands run in-process when the daemon cannot serve them"""
+
+    server, recorder = daemon
+
+    assert forward(["env", "list"], "/other.json", server.socket_path) is None
+    assert forward(["db", "shell"], CONFIG_PATH, server.socket_path) is None
+    assert forward(["env", "list"], CONFIG_PATH, "/nonexistent") is None
+    assert recorder.commands == []
+
+
+def test_forward_stale_socket() -> None:
+    """Test a socket left behind by a dead daemon is ignored"""
+
+    work_dir = tempfile.mkdtemp(prefix="shpd-")
+    try:
+        socket_path = os.path.join(work_dir, "sock")
+        open(socket_path, "w").close()
+        assert forward(["env", "list"], CONFIG_PATH, socket_path) is None
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def test_forward_ignores_foreign_socket(
+    mocker: MockerFixture, daemon: Tuple[Daemon, Recorder]
+) -> None:
+    """Test a socket owned by another user is never forwarded to"""
+
+    server, recorder = daemon
+    mocker.patch("daemon.client.os.getuid", return_value=os.getuid() + 1)
+
+    assert forward(["env", "list"], CONFIG_PATH, server.socket_path) is None
+    assert recorder.commands == []
+
+
+def test_daemon_reloads_on_change(daemon: Tuple[Daemon, Recorder]) -> None:
+    """Test the resident state is reset when a watched file changes"""
+
+    server, recorder = daemon
+
+    forward(["env", "list"], CONFIG_PATH, server.socket_path)
+    forward(["env", "list"], CONFIG_PATH, server.socket_path)
+    assert recorder.resets == 1
+
+    with open(recorder.watched, "w") as f:
+        f.write("domain=example.com\n")
+    forward(["env", "list"], CONFIG_PATH, server.socket_path)
+    forward(["env", "list"], CONFIG_PATH, server.socket_path)
+    assert recorder.resets == 2
+
+
+def test_daemon_runs_with_caller_env(
+    daemon: Tuple[Daemon, Recorder], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test commands see the caller's SHPD_* variables"""
+
+    server, recorder = daemon
+
+    monkeypatch.setenv("SHPD_CONTAINER_ENGINE", "podman")
+    forward(["env", "status"], CONFIG_PATH, server.socket_path)
+    forward(["env", "status"], CONFIG_PATH, server.socket_path)
+    monkeypatch.delenv("SHPD_CONTAINER_ENGINE")
+    forward(["env", "status"], CONFIG_PATH, server.socket_path)
+
+    assert recorder.engines == ["podman", "podman", None]
+    assert recorder.resets == 2
+
+
+@pytest.mark.parametrize(
+    "argv,expected",
+    [
+        (["env", "list"], True),
+        (["-p", "env", "status"], True),
+        (["reg", "list", "--sort", "size"], True),
+        (["env", "archive", "env-1"], False),
+        (["env", "pull", "env-1"], False),
+        (["env", "list", "--help"], False),
+        (["daemon", "stop"], False),
+        (["svc", "shell", "primary"], False),
+        (["-f", "db", "stdout"], False),
+        ([], False),
+    ],
+)
+def test_is_forwardable(argv: List[str], expected: bool) -> None:
+    """Test which command lines go to the daemon"""
+
+    assert is_forwardable(argv) is expected
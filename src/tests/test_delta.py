@@ -0,0 +1,135 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import random
+import shutil
+from pathlib import Path
+
+import pytest
+
+from environment.archive import extract_archive, write_archive
+from environment.delta import write_delta_archive
+from util.fscopy import copy_tree
+
+MiB = 1024 * 1024
+
+
+def make_baseline(path: Path) -> None:
+    rng = random.Random(3)
+    (path / "db" / "data").mkdir(parents=True)
+    (path / "db" / "data" / "system.dbf").write_bytes(rng.randbytes(4 * MiB))
+    (path / "db" / "data" / "undo.dbf").write_bytes(rng.randbytes(2 * MiB))
+    (path / "db" / "data" / "temp.dbf").write_bytes(rng.randbytes(MiB))
+    (path / "db" / "init.ora").write_text("processes=300\n")
+    (path / "db" / "control.ctl").write_bytes(rng.randbytes(100_000))
+
+
+def read_tree(root: Path) -> dict:
+    return {
+        str(path.relative_to(root)): path.read_bytes()
+        for path in sorted(root.rglob("*"))
+        if path.is_file()
+    }
+
+
+def test_delta_archive_stores_changes_only(tmp_path: Path) -> None:
+    """Test a clone of the baseline archives as its changed blocks"""
+
+    base_dir = tmp_path / "fresh-ora"
+    env_dir = tmp_path / "env-1"
+    make_baseline(base_dir)
+    copy_tree(str(base_dir), str(env_dir))
+    with open(env_dir / "db" / "data" / "system.dbf", "r+b") as f:
+        f.seek(2 * MiB + 10)
+        f.write(b"updated row")
+    with open(env_dir / "db" / "data" / "undo.dbf", "ab") as f:
+        f.write(b"u" * 100_000)
+    os.truncate(env_dir / "db" / "data" / "temp.dbf", 3000)
+    (env_dir / "db" / "init.ora").write_text("processes=500\n")
+    (env_dir / "db" / "data" / "users.dbf").write_bytes(b"new" * 1000)
+    archive_path = str(tmp_path / "env-1.delta.tar.gz")
+
+    stats = write_delta_archive(
+        str(env_dir), str(base_dir), "env-1", archive_path
+    )
+
+    assert stats.bytes_in > 6 * MiB
+    assert stats.bytes_out < 200_000
+    restored_dir = tmp_path / "restored"
+    extract_archive(
+        archive_path, "env-1", str(restored_dir), base_dir=str(base_dir)
+    )
+    assert read_tree(restored_dir) == read_tree(env_dir)
+
+    with pytest.raises(ValueError):
+        extract_archive(archive_path, "env-1", str(tmp_path / "no-base"))
+
+
+def test_delta_archive_requires_same_baseline(tmp_path: Path) -> None:
+    """Test a delta is not applied to a modified baseline"""
+
+    base_dir = tmp_path / "fresh-ora"
+    make_baseline(base_dir)
+    copy_tree(str(base_dir), str(tmp_path / "env-1"))
+    archive_path = str(tmp_path / "env-1.delta.tar.gz")
+    write_delta_archive(
+        str(tmp_path / "env-1"), str(base_dir), "env-1", archive_path
+    )
+    with open(base_dir / "db" / "data" / "system.dbf", "r+b") as f:
+        f.write(b"changed")
+
+    with pytest.raises(ValueError, match="system.dbf"):
+        extract_archive(
+            archive_path,
+            "env-1",
+            str(tmp_path / "restored"),
+            base_dir=str(base_dir),
+        )
+
+
+def test_delta_applies_to_restored_baseline(tmp_path: Path) -> None:
+    """Test a baseline restored from a tar.gz still takes its deltas"""
+
+    base_dir = tmp_path / "fresh-ora"
+    make_baseline(base_dir)
+    for path in base_dir.rglob("*"):
+        os.utime(path, ns=(1_700_000_000_123_456_789,) * 2)
+    env_dir = tmp_path / "env-1"
+    copy_tree(str(base_dir), str(env_dir))
+    with open(env_dir / "db" / "data" / "system.dbf", "r+b") as f:
+        f.write(b"updated row")
+    archive_path = str(tmp_path / "env-1.delta.tar.gz")
+    write_delta_archive(str(env_dir), str(base_dir), "env-1", archive_path)
+
+    base_archive = str(tmp_path / "fresh-ora.tar.gz")
+    write_archive(str(base_dir), "fresh-ora", base_archive)
+    shutil.rmtree(base_dir)
+    extract_archive(base_archive, "fresh-ora", str(base_dir))
+    restored_st = os.stat(base_dir / "db" / "init.ora")
+    assert restored_st.st_mtime_ns != 1_700_000_000_123_456_789
+
+    restored_dir = tmp_path / "restored"
+    extract_archive(
+        archive_path, "env-1", str(restored_dir), base_dir=str(base_dir)
+    )
+    assert read_tree(restored_dir) == read_tree(env_dir)
@@ -0,0 +1,162 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import errno
+import os
+import stat
+from pathlib import Path
+from types import SimpleNamespace
+from typing import cast
+
+import pytest
+from pytest_mock import MockerFixture
+
+from util.fscopy import TreeCopier, copy_tree
+
+MiB = 1024 * 1024
+
+
+def make_tree(root: Path) -> None:
+    (root / "db" / "data").mkdir(parents=True)
+    (root / "svc-1" / "shared").mkdir(parents=True)
+    with open(root / "db" / "data" / "sparse.dbf", "wb") as f:
+        f.write(b"head" * 1024)
+        f.seek(8 * MiB)
+        f.write(b"tail" * 1024)
+        f.truncate(16 * MiB)
+    big = root / "svc-1" / "shared" / "big.bin"
+    big.write_bytes(os.urandom(3 * MiB + 17))
+    os.chmod(big, 0o640)
+    (root / "db" / "empty").write_bytes(b"")
+    os.symlink("../db/data/sparse.dbf", root / "svc-1" / "link")
+    os.chmod(root / "db", 0o750)
+    os.utime(root / "db", ns=(1_000_000_000, 2_000_000_000))
+
+
+def test_copy_tree_preserves_content_holes_and_metadata(
+    tmp_path: Path,
+) -> None:
+    """Test the chunked copy keeps data, holes, modes and times"""
+
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    make_tree(src)
+
+    stats = TreeCopier(workers=4, chunk_size=MiB, use_reflink=False).copy(
+        str(src), str(dst)
+    )
+
+    assert stats.files == 3 and stats.reflinked == 0
+    assert stats.bytes == 16 * MiB + 3 * MiB + 17
+    for rel in ("db/data/sparse.dbf", "svc-1/shared/big.bin", "db/empty"):
+        assert (dst / rel).read_bytes() == (src / rel).read_bytes()
+    sparse = os.stat(dst / "db" / "data" / "sparse.dbf")
+    assert sparse.st_blocks * 512 < 2 * MiB
+    assert os.stat(dst / "svc-1" / "shared" / "big.bin").st_mode & 0o777 == (
+        0o640
+    )
+    assert os.readlink(dst / "svc-1" / "link") == "../db/data/sparse.dbf"
+    db = os.stat(dst / "db")
+    assert db.st_mode & 0o777 == 0o750
+    assert db.st_mtime_ns == 2_000_000_000
+
+    with pytest.raises(FileExistsError):
+        copy_tree(str(src), str(dst))
+
+
+def test_copy_tree_reflinks_when_supported(
+    mocker: MockerFixture, tmp_path: Path
+) -> None:
+    """Test files are cloned with FICLONE, or copied once unsupported"""
+
+    src = tmp_path / "src"
+    make_tree(src)
+
+    ioctl = mocker.patch("util.fscopy.fcntl.ioctl")
+    stats = copy_tree(str(src), str(tmp_path / "cow"))
+    assert stats.reflinked == 2
+    assert ioctl.call_count == 2
+
+    ioctl.reset_mock()
+    ioctl.side_effect = OSError(errno.EOPNOTSUPP, "not supported")
+    stats = copy_tree(str(src), str(tmp_path / "copy"))
+    assert stats.reflinked == 0
+    assert ioctl.call_count == 1
+    assert (
+        tmp_path / "copy" / "svc-1" / "shared" / "big.bin"
+    ).read_bytes() == (src / "svc-1" / "shared" / "big.bin").read_bytes()
+
+
+def test_copy_tree_keeps_hardlinks_and_special_files(tmp_path: Path) -> None:
+    """Test hardlinked files stay shared and FIFOs are recreated"""
+
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    make_tree(src)
+    os.link(src / "svc-1" / "shared" / "big.bin", src / "db" / "big.lnk")
+    os.mkfifo(src / "db" / "pipe")
+
+    stats = copy_tree(str(src), str(dst))
+
+    assert stats.files == 3 and stats.skipped == 0
+    big = os.stat(dst / "svc-1" / "shared" / "big.bin")
+    assert os.stat(dst / "db" / "big.lnk").st_ino == big.st_ino
+    assert big.st_nlink == 2
+    assert (dst / "db" / "pipe").is_fifo()
+
+
+def test_copy_tree_skips_device_nodes_without_privileges(
+    mocker: MockerFixture, tmp_path: Path
+) -> None:
+    """Test device nodes are skipped when mknod is not permitted"""
+
+    mocker.patch(
+        "util.fscopy.os.mknod", side_effect=PermissionError(errno.EPERM, "")
+    )
+    device = cast(
+        os.stat_result,
+        SimpleNamespace(st_mode=stat.S_IFCHR | 0o600, st_rdev=os.makedev(1, 3)),
+    )
+    socket = cast(
+        os.stat_result,
+        SimpleNamespace(st_mode=stat.S_IFSOCK | 0o600, st_rdev=0),
+    )
+    copier = TreeCopier()
+    assert copier.make_node(str(tmp_path / "null"), device) is False
+    with pytest.raises(PermissionError):
+        copier.make_node(str(tmp_path / "sock"), socket)
+
+
+def test_copy_tree_removes_partial_copy_on_failure(
+    mocker: MockerFixture, tmp_path: Path
+) -> None:
+    """Test a failed copy leaves no partial destination behind"""
+
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    make_tree(src)
+    os.chmod(src / "svc-1", 0o500)
+    mocker.patch(
+        "util.fscopy.TreeCopier.copy_chunk",
+        side_effect=OSError(errno.ENOSPC, "No space left on device"),
+    )
+
+    with pytest.raises(OSError):
+        TreeCopier(use_reflink=False).copy(str(src), str(dst))
+    assert not os.path.lexists(dst)
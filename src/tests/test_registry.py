@@ -0,0 +1,699 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import ftplib
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import threading
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+import pytest
+
+from config import ShpdRegistry
+from environment.archive import write_archive
+from environment.kept import read_kept, set_kept
+from registry import FtpPool, Registry, stream
+from registry.pool import MAX_PER_SERVER
+from registry.stream import StreamPuller
+from registry.transfer import Downloader, Uploader
+from system import System
+
+
+class FakeFtpServer:
+    """In-memory FTP server, shared by the clients it hands out."""
+
+    def __init__(self) -> None:
+        self.files: Dict[str, bytearray] = {}
+        self.dirs = {"/", "/shpd"}
+        self.lock = threading.Lock()
+        self.mtimes: Dict[str, int] = {}
+        self.clock = 0
+        self.logins = 0
+        self.desyncs = 0
+        self.stors: List[Tuple[str, int]] = []
+        self.retrs: List[Tuple[str, int]] = []
+        # Transfers allowed before the server drops connections.
+        self.fail_after: Optional[int] = None
+        self.supports_hash = True
+        self.clients: List["FakeFtp"] = []
+
+    def fail(self) -> None:
+        if self.fail_after is not None:
+            if self.fail_after == 0:
+                raise EOFError()
+            self.fail_after -= 1
+
+    def touch(self, path: str) -> None:
+        self.clock += 1
+        self.mtimes[path] = self.clock
+
+    def client(self) -> "FakeFtp":
+        client = FakeFtp(self)
+        self.clients.append(client)
+        return client
+
+    def drop(self) -> None:
+        """Drops the connections of every client, as on an idle timeout."""
+        for client in self.clients:
+            client.dropped = True
+
+
+class FakeFtp:
+    """The subset of ftplib.FTP the registry uses."""
+
+    def __init__(self, server: FakeFtpServer) -> None:
+        self.server = server
+        self.cwd_path = "/"
+        self.sock: Optional[object] = object()
+        # Set when the server dropped the idle connection.
+        self.dropped = False
+        # Replies sent but not read yet, as after an aborted transfer.
+        self.replies: List[str] = []
+
+    def reply(self, expected: str) -> None:
+        if self.replies:
+            self.server.desyncs += 1
+            raise ftplib.error_reply(f"{self.replies.pop(0)}, not {expected}")
+
+    def path(self, name: str) -> str:
+        return posixpath.normpath(posixpath.join(self.cwd_path, name))
+
+    def connect(self, host: str, port: int, timeout: float) -> None:
+        pass
+
+    def login(self, user: str, psw: str) -> None:
+        if psw != "secret":
+            raise ftplib.error_perm("530 Login incorrect.")
+        with self.server.lock:
+            self.server.logins += 1
+
+    def voidcmd(self, cmd: str) -> str:
+        if self.dropped:
+            raise EOFError()
+        self.reply("200")
+        return "200 OK"
+
+    def sendcmd(self, cmd: str) -> str:
+        self.reply("2xx")
+        verb, _, arg = cmd.partition(" ")
+        if verb in ("OPTS", "HASH") and not self.server.supports_hash:
+            raise ftplib.error_perm("502 Command not implemented.")
+        if verb == "HASH":
+            data = self.server.files.get(self.path(arg))
+            if data is None:
+                raise ftplib.error_perm("550 No such file.")
+            digest = hashlib.sha256(data).hexdigest()
+            return f"213 SHA-256 0-{len(data) - 1} {digest} {arg}"
+        if verb == "MDTM":
+            if self.path(arg) not in self.server.files:
+                raise ftplib.error_perm("550 No such file.")
+            return f"213 {20260101000000 + self.server.mtimes[self.path(arg)]}"
+        return "200 OK"
+
+    def cwd(self, path: str) -> None:
+        if self.path(path) not in self.server.dirs:
+            raise ftplib.error_perm("550 No such directory.")
+        self.cwd_path = self.path(path)
+
+    def pwd(self) -> str:
+        return self.cwd_path
+
+    def mkd(self, path: str) -> None:
+        if self.path(path) in self.server.dirs:
+            raise ftplib.error_perm("550 Exists.")
+        self.server.dirs.add(self.path(path))
+
+    def size(self, path: str) -> int:
+        self.reply("213")
+        data = self.server.files.get(self.path(path))
+        if data is None:
+            raise ftplib.error_perm("550 No such file.")
+        return len(data)
+
+    def retrbinary(
+        self,
+        cmd: str,
+        callback: Callable[[bytes], None],
+        blocksize: int = 8192,
+        rest: Optional[int] = None,
+    ) -> str:
+        self.reply("150")
+        path = self.path(cmd.split(" ", 1)[1])
+        with self.server.lock:
+            self.server.fail()
+            data = self.server.files.get(path)
+            if data is None:
+                raise ftplib.error_perm("550 No such file.")
+            data = bytes(data)
+            self.server.retrs.append((path, rest or 0))
+        try:
+            for offset in range(rest or 0, len(data), blocksize):
+                callback(data[offset : offset + blocksize])
+        except BaseException:
+            # As proftpd: both the abort and the completion are reported.
+            self.replies += ["426 Transfer aborted.", "226 Transfer complete."]
+            raise
+        return "226 Transfer complete."
+
+    def voidresp(self) -> str:
+        if not self.replies:
+            raise ftplib.error_reply("Nothing to read.")
+        return self.replies.pop(0)
+
+    def rename(self, src: str, dst: str) -> None:
+        with self.server.lock:
+            self.server.files[self.path(dst)] = self.server.files.pop(
+                self.path(src)
+            )
+            self.server.touch(self.path(dst))
+
+    def nlst(self, path: str) -> List[str]:
+        prefix = self.path(path) + "/"
+        return [
+            posixpath.join(path, name[len(prefix) :])
+            for name in self.server.files
+            if name.startswith(prefix) and "/" not in name[len(prefix) :]
+        ]
+
+    def delete(self, path: str) -> None:
+        with self.server.lock:
+            if self.server.files.pop(self.path(path), None) is None:
+                raise ftplib.error_perm("550 No such file.")
+
+    def storbinary(
+        self,
+        cmd: str,
+        fp: Any,
+        blocksize: int = 8192,
+        callback: Optional[Callable[[bytes], None]] = None,
+        rest: Optional[int] = None,
+    ) -> str:
+        path = self.path(cmd.split(" ", 1)[1])
+        with self.server.lock:
+            self.server.fail()
+            self.server.stors.append((path, rest or 0))
+            self.server.touch(path)
+            if not rest:
+                # As vsftpd: a transfer from offset 0 truncates.
+                self.server.files[path] = bytearray()
+            data = self.server.files.setdefault(path, bytearray())
+        offset = rest or 0
+        while block := fp.read(blocksize):
+            with self.server.lock:
+                if len(data) < offset:
+                    data.extend(bytes(offset - len(data)))
+                data[offset : offset + len(block)] = block
+            offset += len(block)
+        return "226 Transfer complete."
+
+    def quit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.sock = None
+
+
+REGISTRY = ShpdRegistry(
+    ftp_server="registry.example:2121",
+    ftp_user="shpd",
+    ftp_psw="secret",
+    ftp_shpd_path="shpd",
+    ftp_env_imgs_path="imgs",
+)
+
+
+def image_names(images: Path) -> List[str]:
+    return sorted(n for n in os.listdir(images) if not n.startswith("."))
+
+
+def make_registry(tmp_path: Path, server: FakeFtpServer) -> Registry:
+    env = SimpleNamespace(db=SimpleNamespace(type="ora", empty_env="fresh"))
+    config = SimpleNamespace(
+        envs_dir=str(tmp_path),
+        shpd_registry=REGISTRY,
+        get_effective_environment=lambda tag: env,
+        get_environment=lambda tag: env,
+    )
+    pool = FtpPool(server.client)  # type: ignore[arg-type]
+    return Registry(config, pool)
+
+
+def test_upload_resumes_missing_parts(tmp_path: Path) -> None:
+    """Test an interrupted upload resumes with the missing parts only"""
+
+    server = FakeFtpServer()
+    registry = make_registry(tmp_path, server)
+    data = os.urandom(1024 * 1024 + 10)
+    (tmp_path / "env-1.tar.gz").write_bytes(data)
+    state_path = str(tmp_path / "state")
+    uploader = Uploader(registry.session, 4, part_size=64 * 1024)
+
+    server.fail_after = 6
+    with pytest.raises(OSError):
+        uploader.upload(
+            str(tmp_path / "env-1.tar.gz"), "env-1.tar.gz", state_path
+        )
+    with open(state_path) as f:
+        done = json.load(f)["done"]
+    assert "0" in done and 1 <= len(done) <= 6
+
+    server.fail_after = None
+    server.stors.clear()
+    stats, manifest = uploader.upload(
+        str(tmp_path / "env-1.tar.gz"), "env-1.tar.gz", state_path
+    )
+
+    assert len(server.stors) == 17 - len(done) + 1
+    assert not any(rest == 0 for path, rest in server.stors[:-1])
+    assert server.files["/shpd/env-1.tar.gz"] == data
+    assert "/shpd/env-1.tar.gz.upload" not in server.files
+    assert manifest["sha256"] == hashlib.sha256(data).hexdigest()
+    assert (
+        manifest["parts"][1]
+        == hashlib.sha256(data[64 * 1024 : 128 * 1024]).hexdigest()
+    )
+    assert json.loads(server.files["/shpd/env-1.tar.gz.json"]) == manifest
+    assert stats.transferred == len(data) - 64 * 1024 * len(done)
+    assert not os.path.exists(state_path)
+
+
+def test_upload_without_hash_checks_size_only(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """Test servers without HASH verify uploads by size, with a warning"""
+
+    server = FakeFtpServer()
+    server.supports_hash = False
+    registry = make_registry(tmp_path, server)
+    data = os.urandom(200_000)
+    (tmp_path / "env-1.tar.gz").write_bytes(data)
+    uploader = Uploader(registry.session, 2, part_size=64 * 1024)
+
+    _, manifest = uploader.upload(
+        str(tmp_path / "env-1.tar.gz"), "env-1.tar.gz", str(tmp_path / "st")
+    )
+    assert server.files["/shpd/env-1.tar.gz"] == data
+    assert "checked by size only" in capsys.readouterr().err
+
+    corrupt = bytearray(data)
+    corrupt[100_000] ^= 0xFF
+    server.files["/shpd/env-1.tar.gz.upload"] = corrupt
+    with registry.session() as ftp:
+        uploader.verify(ftp, "env-1.tar.gz.upload", manifest, "st")
+    assert "checked by size only" in capsys.readouterr().err
+
+    server.supports_hash = True
+    with pytest.raises(OSError, match="checksum manifest"):
+        with registry.session() as ftp:
+            uploader.verify(ftp, "env-1.tar.gz.upload", manifest, "st")
+
+    server.files["/shpd/env-1.tar.gz.upload"] = corrupt[:-1]
+    server.supports_hash = False
+    with pytest.raises(OSError, match="checksum manifest"):
+        with registry.session() as ftp:
+            uploader.verify(ftp, "env-1.tar.gz.upload", manifest, "st")
+
+
+def test_push_and_fetch_environment(tmp_path: Path) -> None:
+    """Test push publishes the image with its manifest, fetch gets it"""
+
+    server = FakeFtpServer()
+    registry = make_registry(tmp_path, server)
+    images = tmp_path / ".env_images"
+    images.mkdir()
+    (images / "env-1.delta.tar.gz").write_bytes(b"delta")
+    server.files["/shpd/imgs/env-1.tar.gz"] = bytearray(b"old")
+    server.files["/shpd/imgs/env-1.tar.gz.json"] = bytearray(b"{}")
+
+    registry.push_environment("env-1")
+
+    assert server.files["/shpd/imgs/env-1.delta.tar.gz"] == b"delta"
+    manifest = json.loads(server.files["/shpd/imgs/env-1.delta.tar.gz.json"])
+    assert manifest["env"] == "env-1"
+    assert manifest["base"] == "fresh"
+    assert manifest["db_type"] == "ora"
+    assert "/shpd/imgs/env-1.tar.gz" not in server.files
+    assert "/shpd/imgs/env-1.tar.gz.json" not in server.files
+
+    (images / "env-1.delta.tar.gz").unlink()
+    (images / "env-1.tar.gz").write_bytes(b"stale")
+    registry.fetch_environment("env-1")
+    assert image_names(images) == ["env-1.delta.tar.gz"]
+    assert (images / "env-1.delta.tar.gz").read_bytes() == b"delta"
+
+    # Fetched to be restored: pruning keeps it until it is.
+    system = System(
+        SimpleNamespace(  # type: ignore[arg-type]
+            envs_dir=str(tmp_path),
+            envs=[SimpleNamespace(tag="env-1", archived=False)],
+        )
+    )
+    system.prune()
+    assert image_names(images) == ["env-1.delta.tar.gz"]
+    set_kept(str(images), "env-1", None)
+    system.prune()
+    assert image_names(images) == []
+
+
+def test_connections_capped_by_pool(
+    tmp_path: Path, capsys: pytest.CaptureFixture
+) -> None:
+    """Test asking for more connections than the pool allows warns"""
+
+    registry = make_registry(tmp_path, FakeFtpServer())
+    assert registry.connections(None) == REGISTRY.ftp_connections
+    assert registry.connections(MAX_PER_SERVER) == MAX_PER_SERVER
+    assert capsys.readouterr().err == ""
+
+    assert registry.connections(32) == MAX_PER_SERVER
+    assert capsys.readouterr().err == (
+        f"Warning: using {MAX_PER_SERVER} connections, the most opened "
+        "to a server, instead of 32.\n"
+    )
+
+
+def test_registry_index(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    """Test push maintains the index that list reads, cached locally"""
+
+    server = FakeFtpServer()
+    registry = make_registry(tmp_path, server)
+    images = tmp_path / ".env_images"
+    images.mkdir()
+    for tag, data in (("env-1", b"one"), ("env-2", b"second")):
+        (images / f"{tag}.tar.gz").write_bytes(data)
+        registry.push_environment(tag)
+    capsys.readouterr()
+
+    index = json.loads(server.files["/shpd/imgs/index.json"])
+    assert sorted(index["images"]) == ["env-1", "env-2"]
+    assert index["images"]["env-2"]["size"] == 6
+    assert index["images"]["env-2"]["db_type"] == "ora"
+    assert index["images"]["env-2"]["sha256"] == (
+        hashlib.sha256(b"second").hexdigest()
+    )
+
+    registry.list_images(sort="size", reverse=True, porcelain=True)
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split("\t")[:3] for line in lines] == [
+        ["env-2", "env-2.tar.gz", "6"],
+        ["env-1", "env-1.tar.gz", "3"],
+    ]
+
+    server.retrs.clear()
+    registry.list_images(pattern="*-1")
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ["Environment", "Size", "Type", "Base", "Pushed"]
+    assert lines[2].startswith("env-1        3.00 (B)  ora   -     20")
+    assert server.retrs == []
+
+    server.touch("/shpd/imgs/env-2.tar.gz")
+    server.files["/shpd/imgs/env-1.tar.gz.json"] = bytearray(
+        json.dumps(
+            {**index["images"]["env-1"], "pushed": "2000-01-01"}
+        ).encode()
+    )
+    server.files["/shpd/imgs/index.json"] = bytearray(b"garbage")
+    registry.prune_registry(older_than=30)
+    assert capsys.readouterr().out.splitlines() == [
+        "Removed 1 images.",
+        "Indexed 1 images.",
+    ]
+    assert "/shpd/imgs/env-1.tar.gz" not in server.files
+    registry.list_images(porcelain=True)
+    assert capsys.readouterr().out.startswith("env-2\t")
+
+
+def test_registry_index_recovers_lost_updates(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """Test entries lost to concurrent index updates are rebuilt"""
+
+    server = FakeFtpServer()
+    registry = make_registry(tmp_path, server)
+    images = tmp_path / ".env_images"
+    images.mkdir()
+    for tag in ("env-1", "env-2"):
+        (images / f"{tag}.tar.gz").write_bytes(tag.encode())
+        registry.push_environment(tag)
+    # env-1 and env-2 were pushed at once: the env-1 update won.
+    index = json.loads(server.files["/shpd/imgs/index.json"])
+    del index["images"]["env-2"]
+    server.files["/shpd/imgs/index.json"] = bytearray(
+        json.dumps(index).encode()
+    )
+    server.touch("/shpd/imgs/index.json")
+    capsys.readouterr()
+
+    registry.list_images(porcelain=True)
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split("\t")[0] for line in lines] == ["env-1", "env-2"]
+    server.retrs.clear()
+    registry.list_images(porcelain=True)
+    assert "env-2\t" in capsys.readouterr().out
+    assert server.retrs == []
+
+    (images / "env-3.tar.gz").write_bytes(b"env-3")
+    registry.push_environment("env-3")
+    index = json.loads(server.files["/shpd/imgs/index.json"])
+    assert sorted(index["images"]) == ["env-1", "env-2", "env-3"]
+
+    del server.files["/shpd/imgs/env-1.tar.gz"]
+    capsys.readouterr()
+    registry.list_images(porcelain=True)
+    assert not capsys.readouterr().out.startswith("env-1\t")
+
+
+def test_download_resumes_and_verifies(tmp_path: Path) -> None:
+    """Test a fetch resumes with the missing parts, verified"""
+
+    server = FakeFtpServer()
+    registry = make_registry(tmp_path, server)
+    data = os.urandom(1024 * 1024 + 10)
+    (tmp_path / "env-1.tar.gz").write_bytes(data)
+    uploader = Uploader(registry.session, 2, part_size=64 * 1024)
+    uploader.upload(
+        str(tmp_path / "env-1.tar.gz"), "env-1.tar.gz", str(tmp_path / "up")
+    )
+    local_path = str(tmp_path / "fetched.tar.gz")
+    state_path = str(tmp_path / "state")
+    downloader = Downloader(registry.session, 3)
+
+    server.fail_after = 7
+    with pytest.raises(OSError):
+        downloader.download("env-1.tar.gz", local_path, state_path)
+    with open(state_path) as f:
+        done = json.load(f)["done"]
+    assert 1 <= len(done) <= 6
+    assert os.path.getsize(local_path + ".fetch") == len(data)
+
+    server.fail_after = None
+    server.retrs.clear()
+    stats, _ = downloader.download("env-1.tar.gz", local_path, state_path)
+
+    assert len(server.retrs) == 1 + 17 - len(done)
+    assert open(local_path, "rb").read() == data
+    assert stats.transferred == len(data) - 64 * 1024 * len(done)
+    assert not os.path.exists(state_path)
+
+    server.files["/shpd/env-1.tar.gz"][100_000] ^= 0xFF
+    with pytest.raises(OSError, match="checksum"):
+        downloader.download("env-1.tar.gz", local_path, state_path)
+
+
+def test_pool_reuses_sessions(tmp_path: Path) -> None:
+    """Test the pool logs in once and replaces dropped sessions"""
+
+    server = FakeFtpServer()
+    pool = FtpPool(server.client, max_per_server=2)  # type: ignore[arg-type]
+
+    for _ in range(3):
+        with pool.session(REGISTRY) as ftp:
+            assert ftp.pwd() == "/shpd"
+    assert server.logins == 1
+
+    with pytest.raises(ftplib.error_perm):
+        with pool.session(REGISTRY) as ftp:
+            ftp.size("missing")
+    with pool.session(REGISTRY) as other:
+        assert other is not ftp
+    assert server.logins == 2
+
+    pool.check_after = 0
+    server.drop()
+    with pool.session(REGISTRY) as ftp:
+        assert ftp is not other
+    assert server.logins == 3
+
+    active, peak = 0, 0
+    lock = threading.Lock()
+
+    def use() -> None:
+        nonlocal active, peak
+        with pool.session(REGISTRY):
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            threading.Event().wait(0.01)
+            with lock:
+                active -= 1
+
+    threads = [threading.Thread(target=use) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak <= 2
+    pool.close()
+
+
+class FakeEnvironment:
+    """Restores environments' data where tests can find it."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def replace_data(
+        self,
+        env_tag: str,
+        restore: Callable[[str], int],
+        replace: bool = False,
+    ) -> int:
+        return restore(str(self.root / env_tag))
+
+
+def test_pull_environment_streams(tmp_path: Path) -> None:
+    """Test pull restores while downloading and keeps a verified copy"""
+
+    server = FakeFtpServer()
+    registry = make_registry(tmp_path, server)
+    src = tmp_path / "src" / "env-1"
+    (src / "data").mkdir(parents=True)
+    content = os.urandom(300_000)
+    (src / "data" / "file").write_bytes(content)
+    images = tmp_path / ".env_images"
+    images.mkdir()
+    write_archive(str(src), "env-1", str(images / "env-1.tar.gz"))
+    registry.push_environment("env-1")
+    (images / "env-1.tar.gz").unlink()
+
+    restored = tmp_path / "restored"
+    registry.pull_environment(
+        "env-1", FakeEnvironment(restored), keep_image=True  # type: ignore
+    )
+    assert (restored / "env-1" / "data" / "file").read_bytes() == content
+    assert image_names(images) == ["env-1.tar.gz"]
+    assert read_kept(str(images)) == {"env-1": "env-1.tar.gz"}
+    remote = server.files["/shpd/imgs/env-1.tar.gz"]
+    assert (images / "env-1.tar.gz").read_bytes() == remote
+
+    remote[len(remote) // 2] ^= 0xFF
+    with pytest.raises(OSError):
+        registry.pull_environment(
+            "env-1",
+            FakeEnvironment(tmp_path / "again"),  # type: ignore
+            keep_image=True,
+        )
+    assert not (images / "env-1.tar.gz.fetch").exists()
+
+
+def test_stream_puller_members_and_errors(tmp_path: Path) -> None:
+    """Test the pipeline joins gzip members and stops on errors"""
+
+    server = FakeFtpServer()
+    registry = make_registry(tmp_path, server)
+    data = os.urandom(1024 * 1024)
+    image = gzip.compress(data[:300_000]) + gzip.compress(data[300_000:])
+    (tmp_path / "image.gz").write_bytes(image)
+    Uploader(registry.session, 1).upload(
+        str(tmp_path / "image.gz"), "image.gz", str(tmp_path / "state")
+    )
+    puller = StreamPuller(registry.session, queue_blocks=1)
+
+    stats, pulled = puller.pull("image.gz", lambda stream: stream.read())
+    assert pulled == data
+    assert stats.transferred == len(image)
+
+    def fail(stream: Any) -> None:
+        stream.read(1000)
+        raise zlib.error("consumer failed")
+
+    with pytest.raises(zlib.error, match="consumer"):
+        puller.pull("image.gz", fail)
+
+    server.files["/shpd/image.gz"] = bytearray(image[:-100])
+    with pytest.raises(OSError, match="truncated"):
+        puller.pull("image.gz", lambda stream: stream.read())
+
+
+def test_stream_puller_bounds_inflated_blocks(tmp_path: Path) -> None:
+    """Test a highly compressible image is queued in bounded blocks"""
+
+    server = FakeFtpServer()
+    registry = make_registry(tmp_path, server)
+    data = bytes(64 * 1024 * 1024)
+    (tmp_path / "zeros.gz").write_bytes(gzip.compress(data, 1))
+    Uploader(registry.session, 1).upload(
+        str(tmp_path / "zeros.gz"), "zeros.gz", str(tmp_path / "state")
+    )
+
+    # The stream is unbuffered: a read returns at most one queued block.
+    reads: List[int] = []
+
+    def consume(f: BinaryIO) -> int:
+        while block := f.read(4 * stream.BLOCK_SIZE):
+            reads.append(len(block))
+        return sum(reads)
+
+    puller = StreamPuller(registry.session, queue_blocks=2)
+    _, size = puller.pull("zeros.gz", consume)
+
+    assert size == len(data)
+    assert max(reads) <= stream.BLOCK_SIZE
+
+
+def test_download_discards_aborted_sessions(tmp_path: Path) -> None:
+    """Test sessions whose transfer was aborted are not reused"""
+
+    server = FakeFtpServer()
+    registry = make_registry(tmp_path, server)
+    data = os.urandom(512 * 1024)
+    (tmp_path / "env-1.tar.gz").write_bytes(data)
+    Uploader(registry.session, 1, part_size=64 * 1024).upload(
+        str(tmp_path / "env-1.tar.gz"), "env-1.tar.gz", str(tmp_path / "up")
+    )
+    logins = server.logins
+
+    Downloader(registry.session, 1).download(
+        "env-1.tar.gz", str(tmp_path / "fetched"), str(tmp_path / "state")
+    )
+
+    assert (tmp_path / "fetched").read_bytes() == data
+    assert server.desyncs == 0
+    # Each of the 8 parts ends aborted, closing its session: only the
+    # first one reuses the pooled session.
+    assert server.logins - logins == 7
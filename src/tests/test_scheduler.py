@@ -0,0 +1,173 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+import time
+from typing import Any, Dict, List
+
+import pytest
+
+from config import EffectiveEnvironment
+from config.effective import EffectiveDatabase, EffectiveService
+from environment.scheduler import (
+    DB_NODE,
+    DagScheduler,
+    build_start_graph,
+    reverse_graph,
+)
+
+
+def make_env(*services: EffectiveService) -> EffectiveEnvironment:
+    db = EffectiveDatabase(
+        type="pg",
+        image="pg",
+        empty_env="fresh",
+        net_listener_port="5432",
+        sys_user="sys",
+        sys_psw="sys",
+        user="docker",
+        psw="docker",
+        upstreams=[],
+    )
+    return EffectiveEnvironment(
+        tag="env",
+        db=db,
+        services=list(services),
+        services_by_tag={svc.tag: svc for svc in services},
+    )
+
+
+def make_service(tag: str, **kwargs: Any) -> EffectiveService:
+    fields: Dict[str, Any] = dict(
+        type="custom",
+        tag=tag,
+        image="img",
+        ingress=False,
+        envvars={},
+        ports={},
+        properties={},
+        subject_alternative_name=None,
+        depends_on=[],
+    )
+    fields.update(kwargs)
+    return EffectiveService(**fields)
+
+
+def test_build_start_graph() -> None:
+    """Test db, ingress, application and explicit dependencies"""
+
+    env = make_env(
+        make_service("traefik-1", type="traefik", ingress=True),
+        make_service("api"),
+        make_service("web", depends_on=["api"]),
+    )
+    assert build_start_graph(env) == {
+        DB_NODE: set(),
+        "traefik-1": {DB_NODE},
+        "api": {DB_NODE, "traefik-1"},
+        "web": {DB_NODE, "traefik-1", "api"},
+    }
+    assert reverse_graph(build_start_graph(env))[DB_NODE] == {
+        "traefik-1",
+        "api",
+        "web",
+    }
+
+    with pytest.raises(ValueError, match="unknown service 'nope'"):
+        build_start_graph(make_env(make_service("a", depends_on=["nope"])))
+    with pytest.raises(ValueError, match="cycle"):
+        build_start_graph(
+            make_env(
+                make_service("a", depends_on=["b"]),
+                make_service("b", depends_on=["a"]),
+            )
+        )
+
+
+def test_scheduler_runs_independent_nodes_concurrently() -> None:
+    """Test siblings overlap while dependencies are honored"""
+
+    graph = {DB_NODE: set(), "a": {DB_NODE}, "b": {DB_NODE}, "c": {"a", "b"}}
+    barrier = threading.Barrier(2, timeout=5)
+    order: List[str] = []
+    lock = threading.Lock()
+
+    def action(node: str) -> None:
+        if node in ("a", "b"):
+            barrier.wait()
+        with lock:
+            order.append(node)
+
+    timings = DagScheduler(graph, action, workers=4).run()
+
+    assert order[0] == DB_NODE and order[-1] == "c"
+    assert [t.node for t in timings][-1] == "c"
+    assert all(t.elapsed >= 0 for t in timings)
+
+
+def test_scheduler_waits_on_readiness() -> None:
+    """Test dependents start only once a node reports ready"""
+
+    probes: Dict[str, int] = {DB_NODE: 0}
+    started: List[str] = []
+
+    def ready(node: str) -> bool:
+        if node == DB_NODE:
+            probes[DB_NODE] += 1
+            return probes[DB_NODE] >= 3
+        return True
+
+    def action(node: str) -> None:
+        if node == "app":
+            assert probes[DB_NODE] >= 3
+        started.append(node)
+
+    graph = {DB_NODE: set(), "app": {DB_NODE}}
+    DagScheduler(graph, action, ready, poll_interval=0.001).run()
+    assert started == [DB_NODE, "app"]
+
+    with pytest.raises(TimeoutError):
+        DagScheduler(
+            {DB_NODE: set()},
+            lambda node: None,
+            lambda node: False,
+            ready_timeout=0.05,
+            poll_interval=0.01,
+        ).run()
+
+
+def test_scheduler_stops_on_failure() -> None:
+    """Test a failure skips dependents but waits for running nodes"""
+
+    finished: List[str] = []
+
+    def action(node: str) -> None:
+        if node == "a":
+            raise OSError("boom")
+        if node == "b":
+            time.sleep(0.05)
+        finished.append(node)
+
+    graph = {DB_NODE: set(), "a": {DB_NODE}, "b": {DB_NODE}, "c": {"a"}}
+    with pytest.raises(OSError, match="boom"):
+        DagScheduler(graph, action).run()
+    assert finished == [DB_NODE, "b"]
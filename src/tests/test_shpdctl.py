@@ -0,0 +1,312 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+from click.testing import CliRunner
+from pytest_mock import MockerFixture
+
+import shpdctl
+from benchmarks.synthetic import write_config
+from util.container import ENV_LABEL, ContainerInfo, container_labels
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHPDCTL = os.path.join(SRC_DIR, "shpdctl.py")
+
+# Best-of-N wall time allowed for a full `shpdctl` invocation, interpreter
+# start included. Override with SHPD_STARTUP_BUDGET_MS on slow runners.
+STARTUP_BUDGET_MS = float(os.environ.get("SHPD_STARTUP_BUDGET_MS", "150"))
+STARTUP_RUNS = 5
+
+SUBSYSTEMS = ["database", "environment", "service", "registry", "system"]
+
+
+@pytest.fixture
+def shpd_cfg(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    config_path, values_path = write_config(str(tmp_path), envs=3)
+    with open(values_path, "a") as f:
+        f.write(f"env_base_dir={tmp_path / 'envs'}\n")
+    monkeypatch.setenv("SHPD_CFG_PATH", config_path)
+    reset_cli()
+    return Path(config_path)
+
+
+def reset_cli() -> None:
+    """Drops everything the CLI built, as a new process would."""
+    for accessor in (
+        shpdctl.get_config,
+        shpdctl.get_state_journal,
+        shpdctl.get_database,
+        shpdctl.get_environment,
+        shpdctl.get_service,
+        shpdctl.get_registry,
+        shpdctl.get_system,
+    ):
+        accessor.cache_clear()
+
+
+def run_shpdctl(args: List[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, SHPDCTL, *args],
+        cwd=SRC_DIR,
+        check=True,
+        capture_output=True,
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+@pytest.mark.parametrize("args", [["--help"], ["env", "list"]])
+def test_startup_time_budget(args: List[str], shpd_cfg: Path) -> None:
+    """Test the CLI starts within the time budget"""
+
+    best = min(run_shpdctl(args) for _ in range(STARTUP_RUNS))
+    assert best < STARTUP_BUDGET_MS, (
+        f"shpdctl {' '.join(args)} took {best:.1f} ms, "
+        f"budget is {STARTUP_BUDGET_MS:.0f} ms"
+    )
+
+
+def test_subsystems_not_imported_at_startup() -> None:
+    """Test importing the CLI does not import any subsystem"""
+
+    code = (
+        "import sys, shpdctl; "
+        f"print(','.join(m for m in {SUBSYSTEMS!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=SRC_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    assert result.stdout.strip() == ""
+
+
+def test_command_instantiates_its_subsystem_only(
+    mocker: MockerFixture, shpd_cfg: Path
+) -> None:
+    """Test a command builds only the subsystem it runs"""
+
+    list_environments = mocker.patch(
+        "environment.Environment.list_environments"
+    )
+
+    result = CliRunner().invoke(shpdctl.cli, ["env", "list"])
+
+    assert result.exit_code == 0
+    list_environments.assert_called_once_with()
+    assert shpdctl.get_environment.cache_info().currsize == 1
+    assert shpdctl.get_database.cache_info().currsize == 0
+    assert shpdctl.get_service.cache_info().currsize == 0
+
+
+def test_env_checkout(shpd_cfg: Path) -> None:
+    """Test checkout is persisted through the state journal"""
+
+    runner = CliRunner()
+    result = runner.invoke(shpdctl.cli, ["env", "checkout", "env-2"])
+    assert result.exit_code == 0
+    assert result.output == "Switched to env-2.\n"
+    assert os.path.exists(shpd_cfg.with_suffix(".journal"))
+    current = shpd_cfg.parent / "envs" / ".current"
+    assert os.readlink(current) == "env-2"
+
+    reset_cli()
+    result = runner.invoke(shpdctl.cli, ["env", "list"])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[2:5] == [
+        "env-0        archived",
+        "env-1",
+        "env-2        active",
+    ]
+
+    result = runner.invoke(shpdctl.cli, ["env", "checkout", "missing"])
+    assert result.exit_code == 1
+    assert "Environment 'missing' does not exist." in result.output
+
+    # No environment can be cloned over the link.
+    result = runner.invoke(shpdctl.cli, ["env", "clone", "env-2", ".current"])
+    assert result.exit_code == 1
+    assert "Invalid environment tag '.current'." in result.output
+    assert os.readlink(current) == "env-2"
+
+    result = runner.invoke(shpdctl.cli, ["env", "noactive"])
+    assert result.exit_code == 0
+    assert not os.path.lexists(current)
+
+
+def test_env_shard_moves_inline_environments(shpd_cfg: Path) -> None:
+    """Test shard migrates the inline environments, keeping their state"""
+
+    runner = CliRunner()
+    runner.invoke(shpdctl.cli, ["env", "checkout", "env-2"])
+    listed = runner.invoke(shpdctl.cli, ["env", "list"]).output
+    result = runner.invoke(shpdctl.cli, ["env", "shard"])
+    assert result.exit_code == 0
+    assert result.output == "Moved 3 environments to the sharded layout.\n"
+    defs_dir = shpd_cfg.parent / "envs" / ".env_defs"
+    assert sorted(os.listdir(defs_dir)) == [
+        "env-0.json",
+        "env-1.json",
+        "env-2.json",
+        "index.json",
+        "index.json.lock",
+    ]
+
+    reset_cli()
+    assert shpdctl.get_config().envs_layout == "sharded"
+    result = runner.invoke(shpdctl.cli, ["env", "list"])
+    assert result.exit_code == 0
+    assert result.output == listed
+    assert "env-2        active" in listed
+
+    result = runner.invoke(shpdctl.cli, ["env", "shard"])
+    assert result.exit_code == 1
+    assert "Environments are already sharded." in result.output
+
+
+def test_env_archive_opens_chunk_store_only_when_chunked(
+    mocker: MockerFixture, shpd_cfg: Path
+) -> None:
+    """Test only chunked archives start, and then close, the chunk store"""
+
+    from environment.chunks import ChunkStore
+
+    envs_dir = shpd_cfg.parent / "envs"
+    for tag in ("env-1", "env-2"):
+        (envs_dir / tag / "db").mkdir(parents=True)
+        (envs_dir / tag / "db" / "data.dbf").write_bytes(os.urandom(4096))
+    enter = mocker.spy(ChunkStore, "__enter__")
+    close = mocker.spy(ChunkStore, "close")
+
+    runner = CliRunner()
+    result = runner.invoke(shpdctl.cli, ["env", "archive", "env-1"])
+    assert result.exit_code == 0
+    assert os.path.isfile(envs_dir / ".env_images" / "env-1.tar.gz")
+    enter.assert_not_called()
+    close.assert_not_called()
+
+    result = runner.invoke(
+        shpdctl.cli, ["env", "archive", "--chunked", "env-2"]
+    )
+    assert result.exit_code == 0
+    assert enter.call_count == 1 and close.call_count == 1
+    assert close.call_args.args[0]._pool is None
+
+
+def test_env_reload_recreates_changed_services_only(
+    mocker: MockerFixture, shpd_cfg: Path
+) -> None:
+    """Test reload compares spec hashes of the running containers"""
+
+    runner = CliRunner()
+    runner.invoke(shpdctl.cli, ["env", "checkout", "env-1"])
+    env = shpdctl.get_config().get_effective_environment("env-1")
+    assert env is not None
+
+    def container(node: str, spec_hash: str) -> ContainerInfo:
+        labels = container_labels("env-1", node, spec_hash)
+        return ContainerInfo(id=node, name=node, state="running", labels=labels)
+
+    running = [container("db", env.db.spec_hash())]
+    running += [
+        container(s.tag, s.spec_hash(env.db)) for s in env.services[:-1]
+    ]
+    running[-1] = container(env.services[-2].tag, "outdated")
+    running.append(container("gone", "x"))
+    mocker.patch(
+        "util.container.ContainerEngine.list_containers", return_value=running
+    )
+    remove = mocker.patch("util.container.ContainerEngine.remove_container")
+    start = mocker.patch("service.Service.start_environment_service")
+    halt = mocker.patch("service.Service.halt_environment_service")
+
+    result = runner.invoke(shpdctl.cli, ["env", "reload", "--dry-run"])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[2:] == [
+        "svc-1    recreate",
+        "svc-2    start",
+        "gone     remove",
+    ]
+    start.assert_not_called()
+
+    result = runner.invoke(shpdctl.cli, ["env", "reload"])
+    assert result.exit_code == 0
+    assert [call.args[0] for call in remove.call_args_list] == [
+        "gone",
+        env.services[-2].tag,
+    ]
+    halt.assert_called_once_with("env-1", env.services[-2])
+    assert sorted(call.args[1].tag for call in start.call_args_list) == [
+        env.services[-2].tag,
+        env.services[-1].tag,
+    ]
+
+
+def test_env_status_single_query(mocker: MockerFixture, shpd_cfg: Path) -> None:
+    """Test status maps one container listing back to services"""
+
+    runner = CliRunner()
+    runner.invoke(shpdctl.cli, ["env", "checkout", "env-1"])
+    running = [
+        ContainerInfo(
+            id="1",
+            name="db-env-1",
+            state="running",
+            labels=container_labels("env-1", "db", "h"),
+        ),
+        ContainerInfo(
+            id="2",
+            name="svc-0-env-2",
+            state="exited",
+            labels=container_labels("env-2", "svc-0", "h"),
+        ),
+    ]
+    list_containers = mocker.patch(
+        "util.container.ContainerEngine.list_containers", return_value=running
+    )
+
+    result = runner.invoke(shpdctl.cli, ["-a", "-p", "env", "status"])
+    assert result.exit_code == 0
+    list_containers.assert_called_once_with({ENV_LABEL: None}, all=True)
+    lines = result.output.splitlines()
+    assert len(lines) == 2 * 5
+    assert lines[0] == "env-1\tdb\tpg\trunning\tdb-env-1"
+    assert lines[1] == "env-1\ttraefik-1\ttraefik\t-\t-"
+    assert "env-2\tsvc-0\tcustom-0\texited\tsvc-0-env-2" in lines
+
+    result = runner.invoke(shpdctl.cli, ["env", "status"])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[:3] == [
+        "Environment  Service    Type      State    Container",
+        "-----------  -------    ----      -----    ---------",
+        "env-1        db         pg        running  db-env-1",
+    ]
@@ -0,0 +1,101 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+from pathlib import Path
+from typing import Any
+
+from pytest_mock import MockerFixture
+
+from environment import sizes as sizes_module
+from environment.sizes import SizeIndex
+
+
+def make_env(root: Path) -> None:
+    for rel in ("db/data", "db/shared", "svc-1/server/shared"):
+        (root / rel).mkdir(parents=True)
+    (root / "db" / "data" / "users.dbf").write_bytes(os.urandom(64 * 1024))
+    (root / "svc-1" / "server" / "shared" / "app.log").write_bytes(b"x" * 8192)
+
+
+def test_size_index_revalidates_changed_dirs_only(
+    mocker: MockerFixture, tmp_path: Path
+) -> None:
+    """Test only directories with a new mtime are rescanned"""
+
+    make_env(tmp_path / "env-1")
+    make_env(tmp_path / "env-2")
+    roots = {tag: str(tmp_path / tag) for tag in ("env-1", "env-2", "gone")}
+
+    sizes = SizeIndex(str(tmp_path)).sizes(roots)
+    assert sizes["env-1"] == sizes["env-2"] >= 72 * 1024
+    assert sizes["gone"] == 0
+    assert os.path.exists(tmp_path / ".sizes.json")
+
+    scan_dir = mocker.spy(sizes_module, "scan_dir")
+    index = SizeIndex(str(tmp_path))
+    assert index.sizes(roots) == sizes
+    scan_dir.assert_not_called()
+
+    (tmp_path / "env-2" / "db" / "shared" / "dump.dmp").write_bytes(
+        b"d" * 40960
+    )
+    grown = index.sizes(roots)
+    assert grown["env-2"] == sizes["env-2"] + 40960
+    assert [c.args[0] for c in scan_dir.call_args_list] == [
+        str(tmp_path / "env-2" / "db" / "shared")
+    ]
+
+    index.invalidate("env-1")
+    scan_dir.reset_mock()
+    assert SizeIndex(str(tmp_path)).sizes(roots) == grown
+    # env-1, db, db/data, db/shared, svc-1, svc-1/server, .../shared
+    assert scan_dir.call_count == 7
+
+
+def test_size_index_skips_unreadable_dirs(
+    mocker: MockerFixture, tmp_path: Path
+) -> None:
+    """Test an unreadable directory is reported and not indexed"""
+
+    make_env(tmp_path / "env-1")
+    roots = {"env-1": str(tmp_path / "env-1")}
+    full = SizeIndex(str(tmp_path)).sizes(roots)["env-1"]
+    denied = str(tmp_path / "env-1" / "db" / "data")
+    scan_dir = sizes_module.scan_dir
+
+    def deny(path: str) -> Any:
+        if path == denied:
+            raise PermissionError(13, "Permission denied", path)
+        return scan_dir(path)
+
+    mocker.patch.object(sizes_module, "scan_dir", side_effect=deny)
+    index = SizeIndex(str(tmp_path))
+    index.invalidate("env-1")
+    assert index.sizes(roots)["env-1"] <= full - 64 * 1024
+    assert index.unreadable == [denied]
+    assert "db/data" not in index.entries["env-1"]["dirs"]
+
+    mocker.stopall()
+    index = SizeIndex(str(tmp_path))
+    assert index.sizes(roots)["env-1"] == full
+    assert index.unreadable == []
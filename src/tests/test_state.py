@@ -0,0 +1,150 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import os
+import threading
+from pathlib import Path
+
+from pytest_mock import MockerFixture
+
+from benchmarks.synthetic import generate_config, make_environment
+from config import write_environment
+from config.config import ConfigBuilder, build_config
+from config.state import (
+    OP_ARCHIVE,
+    OP_CHECKOUT,
+    OP_NOACTIVE,
+    OP_RESTORE,
+    EnvState,
+    StateJournal,
+)
+
+
+def test_replay_journal(tmp_path: Path) -> None:
+    """Test the state is rebuilt by replaying the journal"""
+
+    journal = StateJournal(str(tmp_path / "shpdctl.journal"))
+    journal.append(OP_CHECKOUT, "env-1")
+    journal.append(OP_ARCHIVE, "env-2")
+    journal.append(OP_ARCHIVE, "env-3")
+    journal.append(OP_RESTORE, "env-3")
+
+    assert journal.replay() == EnvState(
+        active_set=True,
+        active="env-1",
+        archived={"env-2": True, "env-3": False},
+    )
+
+    journal.append(OP_NOACTIVE)
+    state = journal.replay()
+    assert state.active_set and state.active is None
+
+
+def test_apply_journal_to_config(tmp_path: Path) -> None:
+    """Test replaying the journal over the static config"""
+
+    config_data, _ = generate_config(4)
+    config = build_config(config_data)
+    assert config.envs[0].active
+
+    journal = StateJournal(str(tmp_path / "shpdctl.journal"))
+    journal.append(OP_CHECKOUT, "env-2")
+    journal.append(OP_ARCHIVE, "env-3")
+    journal.apply(config)
+
+    assert [env.active for env in config.envs] == [False, False, True, False]
+    assert [env.archived for env in config.envs] == [True, False, False, True]
+
+
+def test_apply_journal_to_sharded_config(
+    tmp_path: Path, mocker: MockerFixture
+) -> None:
+    """Test replaying the journal does not parse sharded environments"""
+
+    config_data, _ = generate_config(0)
+    config_data["envs_layout"] = "sharded"
+    config_data["envs_dir"] = str(tmp_path)
+    for i in range(3):
+        write_environment(str(tmp_path), make_environment(i, 1, 0))
+    config = build_config(config_data)
+
+    journal = StateJournal(str(tmp_path / "shpdctl.journal"))
+    journal.append(OP_CHECKOUT, "env-1")
+    parse_env = mocker.spy(ConfigBuilder, "environment")
+    journal.apply(config)
+
+    parse_env.assert_not_called()
+    active = config.get_active_environment()
+    assert active and active.tag == "env-1"
+
+
+def test_journal_compaction(tmp_path: Path) -> None:
+    """Test the journal is compacted into a snapshot past its threshold"""
+
+    path = tmp_path / "shpdctl.journal"
+    journal = StateJournal(str(path), compact_threshold=512)
+    for i in range(100):
+        journal.append(OP_CHECKOUT, f"env-{i}")
+        journal.append(OP_ARCHIVE, f"env-{i % 7}")
+
+    assert os.path.getsize(path) <= 512 + 64
+    state = journal.replay()
+    assert state.active == "env-99"
+    assert state.archived == {f"env-{i}": True for i in range(7)}
+
+
+def test_journal_ignores_torn_line(tmp_path: Path) -> None:
+    """Test an interrupted append does not break the replay"""
+
+    path = tmp_path / "shpdctl.journal"
+    journal = StateJournal(str(path))
+    journal.append(OP_CHECKOUT, "env-1")
+    with open(path, "a") as f:
+        f.write('{"op":"checkout","ta')
+
+    assert journal.replay().active == "env-1"
+
+
+def test_journal_concurrent_appends(tmp_path: Path) -> None:
+    """Test concurrent appends are not lost across compactions"""
+
+    path = str(tmp_path / "shpdctl.journal")
+
+    def worker(tag: str) -> None:
+        journal = StateJournal(path, compact_threshold=256)
+        for i in range(50):
+            journal.append(OP_RESTORE if i % 2 else OP_ARCHIVE, tag)
+        journal.append(OP_ARCHIVE, tag)
+
+    threads = [
+        threading.Thread(target=worker, args=(f"env-{i}",)) for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    state = StateJournal(path).replay()
+    assert state.archived == {f"env-{i}": True for i in range(8)}
+    with open(path) as f:
+        assert all(json.loads(line) for line in f)
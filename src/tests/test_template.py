@@ -0,0 +1,101 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import pytest
+
+from config.template import Placeholder, TemplateEngine, compile_template
+
+
+def test_compile_template_segments() -> None:
+    """Test strings are compiled once into literals and placeholders"""
+
+    template = compile_template("DNS:poke-${ingress_ip}.${domain}")
+
+    assert template.segments == (
+        "DNS:poke-",
+        Placeholder(key="ingress_ip", source="${ingress_ip}"),
+        ".",
+        Placeholder(key="domain", source="${domain}"),
+    )
+    assert not template.is_placeholder
+    assert compile_template("${domain}").is_placeholder
+    assert compile_template("DNS:poke-${ingress_ip}.${domain}") is template
+    assert compile_template("unterminated ${x").segments == (
+        "unterminated ${x",
+    )
+
+
+def test_render_embedded_placeholders() -> None:
+    """Test embedded placeholders are resolved and missing ones reported"""
+
+    engine = TemplateEngine({"domain": "sslip.io"})
+
+    assert (
+        engine.render("DNS:poke-${ingress_ip}.${domain}")
+        == "DNS:poke-${ingress_ip}.sslip.io"
+    )
+    assert engine.render("${domain}") == "sslip.io"
+    assert engine.render("${missing}") is None
+    assert engine.render("plain") == "plain"
+    assert engine.unresolved == {"ingress_ip", "missing"}
+
+
+def test_render_nested_placeholders() -> None:
+    """Test values and keys holding placeholders are resolved"""
+
+    engine = TemplateEngine(
+        {
+            "db_type": "pg",
+            "pg_image": "ghcr.io/${org}/postgres:17",
+            "org": "lunaticfringers",
+        }
+    )
+
+    assert engine.render("${${db_type}_image}") == (
+        "ghcr.io/lunaticfringers/postgres:17"
+    )
+    assert engine.render("image: ${pg_image}") == (
+        "image: ghcr.io/lunaticfringers/postgres:17"
+    )
+    assert engine.render("${${other}_image}") is None
+    assert engine.unresolved == {"other", "${other}_image"}
+
+
+def test_render_is_memoized() -> None:
+    """Test each value is resolved once per value set"""
+
+    values = {"domain": "sslip.io"}
+    engine = TemplateEngine(values)
+    first = engine.render("svc.${domain}")
+
+    values["domain"] = "changed"
+    assert engine.render("svc.${domain}") is first
+    assert TemplateEngine(values).render("svc.${domain}") == "svc.changed"
+
+
+def test_render_circular_reference() -> None:
+    """Test values referencing each other in a cycle are rejected"""
+
+    engine = TemplateEngine({"a": "${b}", "b": "x-${a}"})
+
+    with pytest.raises(ValueError):
+        engine.render("${a}")
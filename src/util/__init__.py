@@ -20,6 +20,16 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from .util import Util
+from .container import ContainerEngine, ContainerInfo, container_labels
+from .util import Util, human_size
 
-__all__ = ["Util"]
+# util.fscopy is imported explicitly by the commands copying trees,
+# keeping its thread pool machinery off the startup path.
+
+__all__ = [
+    "ContainerEngine",
+    "ContainerInfo",
+    "Util",
+    "container_labels",
+    "human_size",
+]
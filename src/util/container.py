@@ -0,0 +1,162 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Tuple, cast
+
+# Labels carried by every container shpdctl creates.
+ENV_LABEL = "io.shpd.env"
+NODE_LABEL = "io.shpd.node"
+SPEC_HASH_LABEL = "io.shpd.spec-hash"
+
+# Seconds a container listing is reused for; zero unless raised by the
+# daemon, whose engine outlives single commands.
+STATE_TTL = 0.0
+
+
+@dataclass(slots=True, frozen=True)
+class ContainerInfo:
+    id: str
+    name: str
+    state: str
+    labels: Dict[str, str]
+
+
+def container_labels(env_tag: str, node: str, spec_hash: str) -> Dict[str, str]:
+    """
+    Returns the labels of the container running `node` of an
+    environment with the given effective spec.
+    """
+    return {ENV_LABEL: env_tag, NODE_LABEL: node, SPEC_HASH_LABEL: spec_hash}
+
+
+def parse_labels(value: Any) -> Dict[str, str]:
+    """
+    Parses the labels of a `ps` JSON line: docker renders them as a
+    "k1=v1,k2=v2" string, podman as an object.
+    """
+    if isinstance(value, dict):
+        mapping = cast(Dict[Any, Any], value)
+        return {str(k): str(v) for k, v in mapping.items()}
+    if not value:
+        return {}
+    labels: Dict[str, str] = {}
+    for item in str(value).split(","):
+        key, _, val = item.partition("=")
+        labels[key] = val
+    return labels
+
+
+class ContainerEngine:
+    """
+    Thin wrapper around the docker (or podman) command line.
+    """
+
+    def __init__(
+        self, binary: Optional[str] = None, state_ttl: Optional[float] = None
+    ):
+        self.binary = binary or os.environ.get(
+            "SHPD_CONTAINER_ENGINE", "docker"
+        )
+        self.state_ttl = STATE_TTL if state_ttl is None else state_ttl
+        self._state: Dict[Any, Tuple[float, List[ContainerInfo]]] = {}
+
+    def run(self, *args: str) -> str:
+        """
+        Runs an engine command.
+
+        :return: The command's stdout.
+        :raises OSError: If the engine is missing or the command fails.
+        """
+        import subprocess
+
+        if args[:1] != ("ps",):
+            # Anything else may change the containers' state.
+            self._state.clear()
+        try:
+            result = subprocess.run(
+                [self.binary, *args],
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+        except FileNotFoundError:
+            raise OSError(f"Container engine '{self.binary}' not found.")
+        if result.returncode != 0:
+            raise OSError(
+                f"'{self.binary} {' '.join(args)}' failed: "
+                f"{result.stderr.strip()}"
+            )
+        return result.stdout
+
+    def list_containers(
+        self, labels: Mapping[str, Optional[str]], all: bool = False
+    ) -> List[ContainerInfo]:
+        """
+        Lists the containers carrying all the given labels, with a
+        single engine call.
+
+        :param labels: Label values to filter on; a None value matches
+                       any value of the label.
+        :param all: Include stopped containers.
+        :return: The matching containers.
+        """
+        query = (tuple(sorted(labels.items())), all)
+        if self.state_ttl > 0:
+            cached = self._state.get(query)
+            if cached and time.monotonic() - cached[0] < self.state_ttl:
+                return list(cached[1])
+        listed_at = time.monotonic()
+
+        args = ["ps", "--no-trunc", "--format", "{{json .}}"]
+        if all:
+            args.append("--all")
+        for key, value in labels.items():
+            label = key if value is None else f"{key}={value}"
+            args += ["--filter", f"label={label}"]
+
+        containers: List[ContainerInfo] = []
+        for line in self.run(*args).splitlines():
+            if not line.strip():
+                continue
+            item: Dict[str, Any] = json.loads(line)
+            names = item.get("Names", "")
+            if isinstance(names, list):
+                names = cast(List[Any], names)[0]
+            containers.append(
+                ContainerInfo(
+                    id=str(item.get("ID") or item.get("Id", "")),
+                    name=str(names),
+                    state=str(item.get("State", "")),
+                    labels=parse_labels(item.get("Labels")),
+                )
+            )
+        if self.state_ttl > 0:
+            self._state[query] = (listed_at, containers)
+        return list(containers)
+
+    def remove_container(self, container_id: str) -> None:
+        """Forcibly removes a container."""
+        self.run("rm", "--force", container_id)
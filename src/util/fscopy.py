@@ -0,0 +1,368 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import errno
+import fcntl
+import os
+import shutil
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# _IOW(0x94, 9, int): clones a whole file by sharing its extents, on
+# filesystems supporting reflinks (btrfs, XFS, ...).
+FICLONE = 0x40049409
+
+CHUNK_SIZE = 64 * 1024 * 1024
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
+# Errors meaning "this filesystem (pair) cannot reflink".
+NO_REFLINK_ERRNOS = {
+    errno.EOPNOTSUPP,
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.ENOSYS,
+    errno.EPERM,
+}
+
+
+@dataclass(slots=True)
+class CopyStats:
+    files: int = 0
+    bytes: int = 0
+    reflinked: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Logical bytes per second."""
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+
+@dataclass(slots=True)
+class _Entry:
+    src: str
+    dst: str
+    st: os.stat_result
+    chunks: List[Tuple[int, int]] = field(default_factory=list[Tuple[int, int]])
+
+
+@dataclass(slots=True)
+class _Plan:
+    dirs: List[_Entry] = field(default_factory=list[_Entry])
+    files: List[_Entry] = field(default_factory=list[_Entry])
+    others: List[_Entry] = field(default_factory=list[_Entry])
+    # Further names of files already planned: src is the first dst.
+    links: List[_Entry] = field(default_factory=list[_Entry])
+    inodes: Dict[Tuple[int, int], str] = field(
+        default_factory=dict[Tuple[int, int], str]
+    )
+    skipped: int = 0
+
+
+def reflink(src_fd: int, dst_fd: int) -> bool:
+    """
+    Clones a file through the FICLONE ioctl.
+
+    :return: False if the filesystem cannot reflink.
+    """
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError as e:
+        if e.errno in NO_REFLINK_ERRNOS:
+            return False
+        raise
+    return True
+
+
+def data_segments(fd: int, size: int) -> Iterator[Tuple[int, int]]:
+    """
+    Yields the (offset, length) of the data regions of a file,
+    skipping holes; the whole file if holes cannot be detected.
+    """
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return
+            if e.errno in (errno.EINVAL, errno.EOPNOTSUPP):
+                yield offset, size - offset
+                return
+            raise
+        end = os.lseek(fd, start, os.SEEK_HOLE)
+        yield start, end - start
+        offset = end
+
+
+def split_chunks(
+    segments: Iterator[Tuple[int, int]], chunk_size: int
+) -> Iterator[Tuple[int, int]]:
+    for offset, length in segments:
+        while length > 0:
+            size = min(length, chunk_size)
+            yield offset, size
+            offset += size
+            length -= size
+
+
+def copy_range(src_fd: int, dst_fd: int, offset: int, length: int) -> None:
+    """
+    Copies a byte range between two files, in kernel when possible.
+    """
+    end = offset + length
+    while offset < end:
+        try:
+            copied = os.copy_file_range(
+                src_fd, dst_fd, end - offset, offset, offset
+            )
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP):
+                raise
+            break
+        if copied == 0:
+            break
+        offset += copied
+
+    while offset < end:
+        data = os.pread(src_fd, min(end - offset, 1024 * 1024), offset)
+        if not data:
+            break
+        offset += os.pwrite(dst_fd, data, offset)
+
+
+def copy_metadata(path: str, st: os.stat_result) -> None:
+    """
+    Applies ownership, mode and times of `st` to `path`. Ownership is
+    only restored when running as root, the only case it can differ.
+    """
+    if os.geteuid() == 0:
+        os.lchown(path, st.st_uid, st.st_gid)
+    if not stat.S_ISLNK(st.st_mode):
+        os.chmod(path, stat.S_IMODE(st.st_mode))
+    os.utime(
+        path,
+        ns=(st.st_atime_ns, st.st_mtime_ns),
+        follow_symlinks=not stat.S_ISLNK(st.st_mode),
+    )
+
+
+def remove_tree(path: str) -> None:
+    """
+    Removes a partially copied tree, making directories writable
+    again where the copy already restored a read-only mode.
+    """
+
+    def retry(func: Callable[[str], Any], failed_path: str, _: Any) -> None:
+        try:
+            os.chmod(os.path.dirname(failed_path), 0o700)
+            func(failed_path)
+        except OSError:
+            pass
+
+    shutil.rmtree(path, onerror=retry)
+
+
+class TreeCopier:
+    """
+    Copies a directory tree, reflinking files when the filesystem
+    allows it and otherwise copying their data regions in chunks on a
+    pool of threads, so that large files are copied in parallel too.
+    Holes are preserved, as are modes, times and, as root, ownership.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        chunk_size: int = CHUNK_SIZE,
+        use_reflink: bool = True,
+    ):
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.use_reflink = use_reflink
+
+    def copy(self, src: str, dst: str) -> CopyStats:
+        """
+        Copies the tree at `src` to `dst`, which must not exist. Should
+        the copy fail, whatever was created of `dst` is removed.
+
+        :return: What was copied and how fast.
+        """
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, "Destination exists", dst)
+
+        start = time.monotonic()
+        plan = _Plan()
+        try:
+            stats = self.run(src, dst, plan)
+        except BaseException:
+            if plan.dirs:
+                remove_tree(dst)
+            raise
+        stats.seconds = time.monotonic() - start
+        return stats
+
+    def run(self, src: str, dst: str, plan: _Plan) -> CopyStats:
+        stats = CopyStats()
+        self.scan(src, dst, plan)
+        stats.skipped = plan.skipped
+
+        pending: List[_Entry] = []
+        for entry in plan.files:
+            stats.files += 1
+            stats.bytes += entry.st.st_size
+            if self.prepare(entry):
+                stats.reflinked += 1
+            else:
+                pending.append(entry)
+        for entry in plan.links:
+            os.link(entry.src, entry.dst)
+
+        def copy_task(task: Tuple[_Entry, int, int]) -> None:
+            self.copy_chunk(*task)
+
+        tasks = [
+            (entry, offset, length)
+            for entry in pending
+            for offset, length in entry.chunks
+        ]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for _ in pool.map(copy_task, tasks):
+                pass
+
+        for entry in plan.files + plan.others:
+            copy_metadata(entry.dst, entry.st)
+        # Deepest first, as filling a directory changes its mtime.
+        for entry in reversed(plan.dirs):
+            copy_metadata(entry.dst, entry.st)
+        return stats
+
+    def scan(self, src: str, dst: str, plan: _Plan) -> None:
+        """
+        Recreates the directories, symlinks and special files of the
+        tree, collecting the regular files to copy and the further
+        names of those that are hardlinked.
+        """
+        st = os.lstat(src)
+        os.mkdir(dst, 0o700)
+        plan.dirs.append(_Entry(src, dst, st))
+
+        with os.scandir(src) as it:
+            for item in it:
+                src_path = item.path
+                dst_path = os.path.join(dst, item.name)
+                item_st = item.stat(follow_symlinks=False)
+                mode = item_st.st_mode
+                if stat.S_ISDIR(mode):
+                    self.scan(src_path, dst_path, plan)
+                elif stat.S_ISREG(mode):
+                    inode = (item_st.st_dev, item_st.st_ino)
+                    first = plan.inodes.get(inode)
+                    if first is not None:
+                        plan.links.append(_Entry(first, dst_path, item_st))
+                        continue
+                    if item_st.st_nlink > 1:
+                        plan.inodes[inode] = dst_path
+                    plan.files.append(_Entry(src_path, dst_path, item_st))
+                elif stat.S_ISLNK(mode):
+                    os.symlink(os.readlink(src_path), dst_path)
+                    plan.others.append(_Entry(src_path, dst_path, item_st))
+                elif self.make_node(dst_path, item_st):
+                    plan.others.append(_Entry(src_path, dst_path, item_st))
+                else:
+                    plan.skipped += 1
+
+    def make_node(self, path: str, st: os.stat_result) -> bool:
+        """
+        Recreates a FIFO, socket or device node.
+
+        :return: False if it is a device node and creating those is
+                 not permitted, i.e. when not running as root.
+        """
+        if stat.S_ISFIFO(st.st_mode):
+            os.mkfifo(path, 0o600)
+            return True
+        try:
+            os.mknod(path, st.st_mode, st.st_rdev)
+        except PermissionError:
+            if stat.S_ISCHR(st.st_mode) or stat.S_ISBLK(st.st_mode):
+                return False
+            raise
+        return True
+
+    def prepare(self, entry: _Entry) -> bool:
+        """
+        Creates the destination file, reflinking it when possible;
+        otherwise sizes it (leaving it all hole) and plans the chunks
+        of data to copy.
+
+        :return: True if the file was reflinked.
+        """
+        src_fd = os.open(entry.src, os.O_RDONLY)
+        try:
+            dst_fd = os.open(entry.dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+            try:
+                if self.use_reflink and entry.st.st_size > 0:
+                    if reflink(src_fd, dst_fd):
+                        return True
+                    # Not supported here: no point trying other files.
+                    self.use_reflink = False
+                os.ftruncate(dst_fd, entry.st.st_size)
+            finally:
+                os.close(dst_fd)
+            entry.chunks = list(
+                split_chunks(
+                    data_segments(src_fd, entry.st.st_size), self.chunk_size
+                )
+            )
+        finally:
+            os.close(src_fd)
+        return False
+
+    def copy_chunk(self, entry: _Entry, offset: int, length: int) -> None:
+        src_fd = os.open(entry.src, os.O_RDONLY)
+        try:
+            dst_fd = os.open(entry.dst, os.O_WRONLY)
+            try:
+                copy_range(src_fd, dst_fd, offset, length)
+            finally:
+                os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+
+
+def copy_tree(src: str, dst: str, workers: Optional[int] = None) -> CopyStats:
+    """
+    Copies a directory tree with reflinks where supported, falling
+    back to a parallel, sparse-aware copy; see `TreeCopier`.
+
+    :param src: The source directory.
+    :param dst: The destination, which must not exist.
+    :param workers: Number of copy threads.
+    :return: The copy statistics.
+    """
+    return TreeCopier(workers or DEFAULT_WORKERS).copy(src, dst)
@@ -0,0 +1,154 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Deque, Optional
+
+# Size of the independently compressed blocks. Each block is primed
+# with the last 32 KiB of the previous one as a dictionary, so the
+# ratio stays close to the one of a single stream.
+BLOCK_SIZE = 1024 * 1024
+DICT_SIZE = 32 * 1024
+DEFAULT_LEVEL = 6
+DEFAULT_THREADS = os.cpu_count() or 1
+
+
+def compress_block(
+    data: bytes, zdict: Optional[bytes], level: int, last: bool
+) -> bytes:
+    """
+    Compresses a block as raw deflate data which can be concatenated to
+    the previous blocks: non-final blocks end on a byte boundary with a
+    sync flush, the final one closes the deflate stream.
+    """
+    if zdict:
+        compressor = zlib.compressobj(
+            level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict
+        )
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    out = compressor.compress(data)
+    return out + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """
+    Writable file object producing a standard, single-member gzip
+    stream, compressing blocks of its input on a pool of threads.
+
+    At most `2 * threads` blocks are in flight, so memory use does not
+    depend on the amount of data written.
+    """
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        level: int = DEFAULT_LEVEL,
+        threads: int = DEFAULT_THREADS,
+        block_size: int = BLOCK_SIZE,
+    ):
+        super().__init__()
+        self.fileobj = fileobj
+        self.level = level
+        self.threads = max(1, threads)
+        self.block_size = block_size
+        self.pool = ThreadPoolExecutor(max_workers=self.threads)
+        self.pending: Deque[Future[bytes]] = deque()
+        self.buffer = bytearray()
+        self.zdict: Optional[bytes] = None
+        self.crc = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.write_header()
+
+    def writable(self) -> bool:
+        return True
+
+    def write_header(self) -> None:
+        # Magic, deflate, no flags, mtime, no extra flags, unknown OS.
+        header = struct.pack(
+            "<BBBBIBB", 0x1F, 0x8B, 8, 0, int(time.time()), 0, 255
+        )
+        self.fileobj.write(header)
+        self.bytes_out += len(header)
+
+    def write(self, data: bytes) -> int:  # type: ignore[override]
+        if self.closed:
+            raise ValueError("write to closed file")
+        view = memoryview(data).cast("B")
+        self.buffer += view
+        self.crc = zlib.crc32(view, self.crc)
+        self.bytes_in += len(view)
+        while len(self.buffer) >= self.block_size:
+            block = bytes(self.buffer[: self.block_size])
+            del self.buffer[: self.block_size]
+            self.submit(block, last=False)
+        return len(view)
+
+    def submit(self, block: bytes, last: bool) -> None:
+        self.pending.append(
+            self.pool.submit(
+                compress_block, block, self.zdict, self.level, last
+            )
+        )
+        self.zdict = block[-DICT_SIZE:]
+        while len(self.pending) > 2 * self.threads:
+            self.drain_one()
+
+    def drain_one(self) -> None:
+        out = self.pending.popleft().result()
+        self.fileobj.write(out)
+        self.bytes_out += len(out)
+
+    def abort(self) -> None:
+        """
+        Stops compressing, leaving the stream without its final block
+        and trailer: for writers failing partway. A no-op once closed.
+        """
+        if self.closed:
+            return
+        self.pending.clear()
+        self.pool.shutdown(cancel_futures=True)
+        super().close()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self.submit(bytes(self.buffer), last=True)
+            self.buffer.clear()
+            while self.pending:
+                self.drain_one()
+            trailer = struct.pack(
+                "<II", self.crc & 0xFFFFFFFF, self.bytes_in & 0xFFFFFFFF
+            )
+            self.fileobj.write(trailer)
+            self.bytes_out += len(trailer)
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            super().close()
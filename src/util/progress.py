@@ -0,0 +1,85 @@
+# MIT License
+#
+# Copyright (c) 2025 Lunatic Fringers
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+import time
+from typing import Optional, TextIO
+
+from .util import human_size
+
+
+class Progress:
+    """
+    Reports the progress of a transfer on a terminal, at most a few
+    times per second; silent when the stream is not a terminal.
+    """
+
+    def __init__(
+        self,
+        label: str,
+        total: Optional[int] = None,
+        stream: Optional[TextIO] = None,
+        interval: float = 0.5,
+    ):
+        self.label = label
+        self.total = total
+        self.stream = stream if stream is not None else sys.stderr
+        self.interval = interval
+        self.done = 0
+        self.start = time.monotonic()
+        self.last = 0.0
+        self.enabled = self.stream.isatty()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    @property
+    def rate(self) -> float:
+        """Bytes per second so far."""
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def update(self, amount: int) -> None:
+        self.done += amount
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.render()
+
+    def render(self) -> None:
+        done, unit = human_size(self.done)
+        rate, rate_unit = human_size(self.rate)
+        line = f"{self.label}  {done} ({unit})"
+        if self.total:
+            line += f"  {100 * self.done / self.total:.0f}%"
+        line += f"  {rate} ({rate_unit})/s"
+        self.stream.write(f"\r{line}\033[K")
+        self.stream.flush()
+
+    def finish(self) -> None:
+        if self.enabled:
+            self.render()
+            self.stream.write("\n")
+            self.stream.flush()
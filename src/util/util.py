@@ -20,6 +20,24 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from typing import Tuple
+
+SIZE_UNITS = ["B", "K", "M", "G", "T", "P"]
+
+
+def human_size(size: float) -> Tuple[str, str]:
+    """
+    Formats a byte count the way sizes are printed by shpdctl.
+
+    :param size: The size in bytes.
+    :return: The value with two decimals and its unit, e.g. ("466.45", "M").
+    """
+    unit = 0
+    while size >= 1024 and unit < len(SIZE_UNITS) - 1:
+        size /= 1024
+        unit += 1
+    return f"{size:.2f}", SIZE_UNITS[unit]
+
 
 class Util:
 